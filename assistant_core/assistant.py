@@ -1,49 +1,98 @@
 import requests
 import json
-from .providers import OpenAIProvider, GroqProvider, LocalTransformersProvider, RemoteTransformersProvider
+import threading
+import uuid
+from .providers import create_provider
+from .cancellation import GenerationCancelled
+from .cassette import CassetteAdapter
+from .tool_index import ToolIndex, tool_name
+from .canonical import canonical_tools
+from .memory import get_memory, format_recalled
+from .profiling import turn_profile
+from .mcp_stream import INVOKE_ACCEPT, is_streamed, iter_invoke_events
+from .tool_output import ToolOutputPipeline, READ_TOOL_OUTPUT, READ_TOOL_OUTPUT_SCHEMA
 from config.settings import settings
 
-class Assistant:
+# One pooled HTTP session for all MCP traffic, shared by every Assistant;
+# its transport records or replays the traffic when a cassette is active
+mcp_http = requests.Session()
+mcp_http.mount("http://", CassetteAdapter())
+mcp_http.mount("https://", CassetteAdapter())
+
+def fetch_all_tools():
+    """Query every enabled MCP server for its tool schemas, in canonical order."""
+    all_tools = []
+    server_definitions = settings.get_mcp_servers()
+    for server in server_definitions:
+        if not server.get('enabled'):
+            continue
+
+        url = server.get('url')
+        if not url:
+            continue
+
+        try:
+            response = mcp_http.get(f"{url}/tools", timeout=5)
+            response.raise_for_status()
+            server_tools = response.json()
+            for tool_schema in server_tools:
+                # Store the server URL with each tool for later invocation
+                all_tools.append({"server_url": url, "schema": tool_schema})
+        except requests.exceptions.RequestException as e:
+            print(f"Could not fetch tools from MCP server at {url}: {e}")
+    return canonical_tools(all_tools)
+
+class ToolCatalog:
+    """MCP tool schemas and their index, discovered once and shared by many conversations.
+
+    Servers are queried again only when the MCP server settings change.
+    """
+
     def __init__(self):
-        provider_name = settings.get_selected_provider()
-        model_name = settings.get_selected_model()
-
-        if provider_name == "groq":
-            self.provider = GroqProvider(model=model_name)
-        elif provider_name == "local_transformers":
-            self.provider = LocalTransformersProvider(model=model_name)
-        elif provider_name == "remote_transformers":
-            self.provider = RemoteTransformersProvider(model=model_name)
-        else:  # Default to openai
-            self.provider = OpenAIProvider(model=model_name)
+        self.tools_info = None
+        self.tool_index = None
+        self._key = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        key = json.dumps(settings.get_mcp_servers(), sort_keys=True)
+        with self._lock:
+            if key != self._key:
+                self.tools_info = fetch_all_tools()
+                self.tool_index = ToolIndex([info['schema'] for info in self.tools_info])
+                self._key = key
+            return self.tools_info, self.tool_index
+
+class Assistant:
+    def __init__(self, provider_name=None, model_name=None, tools_info=None, tool_index=None):
+        # Callers running many sessions (batch runner) pass an already
+        # discovered tool list (and its index) so MCP servers are only
+        # queried once.
+        provider_name = provider_name or settings.get_selected_provider()
+        model_name = model_name or settings.get_selected_model()
+
+        self.provider = create_provider(provider_name, model_name)
 
         self.mcp_server_urls = settings.get_mcp_servers()
-        self.tools_info = self._fetch_all_tools()
+        self.tools_info = tools_info if tools_info is not None else self._fetch_all_tools()
         self.tool_schemas = [info['schema'] for info in self.tools_info]
+        self.tool_index = tool_index if tool_index is not None else ToolIndex(self.tool_schemas)
+
+        # Tools sent with the current turn
+        self.active_tools = list(self.tool_schemas)
+        self.used_tools = set()
+        # Names of every tool this conversation has sent; the set only grows
+        self.sent_tools = set()
+        self.last_tool_selection = {}
+        # Identifies this conversation's turns in long-term memory
+        self.session_id = uuid.uuid4().hex
+        # Keeps oversized tool results out of the history (spilled to disk)
+        self.tool_outputs = ToolOutputPipeline.from_settings(summarize=self._summarize)
 
         self.messages = []
 
     def _fetch_all_tools(self):
-        all_tools = []
-        server_definitions = settings.get_mcp_servers()
-        for server in server_definitions:
-            if not server.get('enabled'):
-                continue
-
-            url = server.get('url')
-            if not url:
-                continue
-
-            try:
-                response = requests.get(f"{url}/tools", timeout=5)
-                response.raise_for_status()
-                server_tools = response.json()
-                for tool_schema in server_tools:
-                    # Store the server URL with each tool for later invocation
-                    all_tools.append({"server_url": url, "schema": tool_schema})
-            except requests.exceptions.RequestException as e:
-                print(f"Could not fetch tools from MCP server at {url}: {e}")
-        return all_tools
+        return fetch_all_tools()
 
     def _get_server_url_for_tool(self, tool_name):
         for tool_info in self.tools_info:
@@ -51,25 +100,194 @@ class Assistant:
                 return tool_info['server_url']
         return None
 
+    def select_tools(self, user_input: str) -> list:
+        """Pick the tool schemas sent with this turn and record what they cost.
+
+        Tools come before the messages in a request, so a tool list that
+        changed from one turn to the next would defeat the provider's prompt
+        cache for the whole history. The conversation's tool list therefore
+        only grows: the tools relevant to this turn are added to those sent
+        before, in catalog order, and a turn matching no tool keeps the list
+        as it is (empty, if no turn has matched one yet). The prefix only
+        changes on turns that add a tool.
+        """
+        top_k = settings.get_tool_top_k()
+        if not top_k or len(self.tool_schemas) <= top_k:
+            self.sent_tools.update(tool_name(schema) for schema in self.tool_schemas)
+        else:
+            # Tools already used in this conversation stay available for follow-ups.
+            # A turn matching nothing adds nothing: falling back to the whole
+            # catalog would put every tool in the list for good.
+            selected = self.tool_index.select(user_input, top_k, always_include=self.used_tools, all_if_unmatched=False)
+            self.sent_tools.update(tool_name(schema) for schema in selected)
+        self.active_tools = [schema for schema in self.tool_schemas if tool_name(schema) in self.sent_tools]
+        self.last_tool_selection = {
+            "tools_sent": len(self.active_tools),
+            "tools_total": len(self.tool_schemas),
+            "schema_tokens_sent": self.tool_index.tokens_for(self.active_tools),
+            "schema_tokens_total": self.tool_index.total_tokens(),
+        }
+        if self.tool_outputs.spilled:
+            # History holds handles to spilled outputs; let the model read them.
+            # Once added it stays, like every other tool.
+            self.active_tools.append(READ_TOOL_OUTPUT_SCHEMA)
+        return self.active_tools
+
+    def recall(self, user_input: str):
+        """Notes from memory relevant to `user_input`, or None.
+
+        They are sent as context with this turn's requests only (see
+        BaseProvider.turn_context); the history keeps the user's own words.
+        """
+        memory = get_memory()
+        if memory is None:
+            return None
+        try:
+            snippets = memory.recall(
+                user_input,
+                k=settings.get_memory_top_k(),
+                min_score=settings.get_memory_min_score(),
+                exclude_session=self.session_id,
+            )
+        except Exception as e:
+            print(f"Could not search memory: {e}")
+            return None
+        return format_recalled(snippets)
+
+    def remember(self, user_input: str, response) -> None:
+        memory = get_memory()
+        # Providers report failures as "Error..." strings; those are not worth recalling
+        if memory is None or not isinstance(response, str) or not response or response.startswith("Error"):
+            return
+        try:
+            memory.remember(self.session_id, user_input, response)
+        except Exception as e:
+            print(f"Could not save turn to memory: {e}")
+
     def handle_command(self, user_input: str) -> str:
         # The new provider logic will handle the different flows
-        return self.provider.handle_chat(user_input, self.tool_schemas, self._invoke_tool)
+        tools = self.select_tools(user_input)
+        self.provider.turn_context = self.recall(user_input)
+        try:
+            response = self.provider.handle_chat(user_input, tools, self._invoke_tool)
+        finally:
+            self.provider.turn_context = None
+        self.remember(user_input, response)
+        return response
+
+    def handle_command_stream(self, user_input: str, stream_callback: callable, cancel_token=None, tool_output_callback=None) -> str:
+        """Streaming version of handle_command.
+
+        If `cancel_token` is cancelled mid-turn, GenerationCancelled is raised
+        and the history is rolled back to where it was before the turn (as it
+        is when the turn fails).
+        `tool_output_callback(tool_name, chunk)` receives the output of tools
+        that stream their results, as it arrives. With turn profiling on (see
+        profiling.py) the turn is profiled and its stats written to disk.
+        """
+        with turn_profile(self.session_id[:8]):
+            return self._handle_command_stream(user_input, stream_callback, cancel_token, tool_output_callback)
+
+    def _handle_command_stream(self, user_input, stream_callback, cancel_token, tool_output_callback):
+        tools = self.select_tools(user_input)
+        self.provider.turn_context = self.recall(user_input)
+        try:
+            response = self._stream_turn(user_input, tools, stream_callback, cancel_token, tool_output_callback)
+        finally:
+            self.provider.turn_context = None
+        self.remember(user_input, response)
+        return response
+
+    def _stream_turn(self, user_input, tools, stream_callback, cancel_token, tool_output_callback):
+        if cancel_token is None and tool_output_callback is None:
+            return self.provider.handle_chat_stream(user_input, tools, self._invoke_tool, stream_callback)
+
+        checkpoint = len(self.provider.messages)
+
+        def tool_invoker(tool_name, kwargs):
+            return self._invoke_tool(tool_name, kwargs, cancel_token, on_output=tool_output_callback)
+
+        try:
+            return self.provider.handle_chat_stream(user_input, tools, tool_invoker, stream_callback, cancel_token=cancel_token)
+        except Exception:
+            # Cancelled or failed: drop the partial turn (user message, tool
+            # calls without results...), which later requests would be refused for
+            del self.provider.messages[checkpoint:]
+            raise
+
+    def _summarize(self, prompt):
+        return self.provider.complete(prompt)
 
-    def handle_command_stream(self, user_input: str, stream_callback: callable) -> str:
-        """Streaming version of handle_command."""
-        return self.provider.handle_chat_stream(user_input, self.tool_schemas, self._invoke_tool, stream_callback)
+    def _invoke_tool(self, tool_name, kwargs, cancel_token=None, on_output=None):
+        if tool_name == READ_TOOL_OUTPUT:
+            return self.tool_outputs.read(kwargs.get("handle"), kwargs.get("offset", 0), kwargs.get("length"))
 
-    def _invoke_tool(self, tool_name, kwargs):
         server_url = self._get_server_url_for_tool(tool_name)
         if not server_url:
             return f"Error: Could not find a server for tool '{tool_name}'"
 
+        # Even a tool pruned from this turn is served (from the full catalog);
+        # once used, it is sent with every later turn of the conversation.
+        self.used_tools.add(tool_name)
+
+        forward = (lambda chunk: on_output(tool_name, chunk)) if on_output else None
+        output = self.tool_outputs.accumulator(tool_name, forward)
+        if cancel_token is None:
+            self._post_invoke(server_url, tool_name, kwargs, output)
+            return output.finish()
+
+        # Run the request on a helper thread so cancelling returns right away;
+        # the abandoned request stops at its next chunk or finishes in the background.
+        result = {}
+        finished = threading.Event()
+
+        def run():
+            try:
+                self._post_invoke(server_url, tool_name, kwargs, output)
+            except Exception as e:
+                result["error"] = e
+            finally:
+                finished.set()
+
+        def on_cancel():
+            output.close()
+            finished.set()
+
+        cancel_token.on_cancel(on_cancel)
+        threading.Thread(target=run, daemon=True).start()
+        finished.wait()
+        cancel_token.remove_callback(on_cancel)
+        cancel_token.raise_if_cancelled()
+        if "error" in result:
+            raise result["error"]
+        return output.finish()
+
+    def _post_invoke(self, server_url, tool_name, kwargs, output):
+        """Call the tool and write its result into `output` (an OutputAccumulator).
+
+        Servers may answer with plain JSON or stream the result as JSON lines
+        or server-sent events; streamed chunks go to `output` as they arrive.
+        """
         try:
-            api_response = requests.post(
+            with mcp_http.post(
                 f"{server_url}/invoke",
-                json={"tool": tool_name, "kwargs": kwargs}
-            )
-            api_response.raise_for_status()
-            return api_response.json().get('result', f'Error: No result found for {tool_name}')
+                json={"tool": tool_name, "kwargs": kwargs},
+                headers={"Accept": INVOKE_ACCEPT},
+                stream=True,
+            ) as api_response:
+                api_response.raise_for_status()
+                if not is_streamed(api_response):
+                    output.write(str(api_response.json().get('result', f'Error: No result found for {tool_name}')))
+                    return
+                for kind, value in iter_invoke_events(api_response):
+                    if kind == "delta":
+                        output.write(value)
+                    elif kind == "result":
+                        # A final result only stands in for output that was not streamed
+                        if not output.size:
+                            output.write(str(value))
+                    else:
+                        output.write(("\n" if output.size else "") + f"Error: {value}")
+                        return
         except requests.exceptions.RequestException as e:
-            return f"Error calling tool API: {e}"
\ No newline at end of file
+            output.write(("\n" if output.size else "") + f"Error calling tool API: {e}")
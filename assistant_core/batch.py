@@ -0,0 +1,146 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .assistant import Assistant, fetch_all_tools
+from .tool_index import ToolIndex
+from .metrics import LatencyStats, prefix_cache
+
+
+def load_prompts(input_path):
+    """Yield (id, prompt) pairs from a JSONL file.
+
+    Each line is either a JSON object with a "prompt" field (and an optional
+    "id") or a bare JSON string. Lines without an id are keyed by line number.
+    """
+    with open(input_path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                yield str(line_no), record
+            else:
+                yield str(record.get("id", line_no)), record["prompt"]
+
+
+def load_completed_ids(output_path):
+    """Ids that already have a successful result in `output_path`."""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A torn last line from an interrupted run
+                continue
+            if record.get("status") == "ok":
+                completed.add(str(record["id"]))
+    return completed
+
+
+class BatchRunner:
+    """Runs prompts through independent Assistant sessions on a bounded worker pool."""
+
+    def __init__(self, input_path, output_path, workers=4, provider_name=None, model_name=None, resume=True):
+        self.input_path = input_path
+        self.output_path = output_path
+        self.workers = max(1, workers)
+        self.provider_name = provider_name
+        self.model_name = model_name
+        self.resume = resume
+
+        self.latencies = LatencyStats()
+        self.succeeded = 0
+        self.failed = 0
+        self.skipped = 0
+        self._lock = threading.Lock()
+        self._output = None
+
+    def run(self):
+        completed = load_completed_ids(self.output_path) if self.resume else set()
+        # Discover and index MCP tools once and share them with every session
+        tools_info = fetch_all_tools()
+        tool_index = ToolIndex([info['schema'] for info in tools_info])
+
+        self._open_output()
+        # Bound the number of submitted-but-unfinished prompts so large input
+        # files are streamed rather than loaded into the executor queue.
+        in_flight = threading.BoundedSemaphore(self.workers * 2)
+        started = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                for prompt_id, prompt in load_prompts(self.input_path):
+                    if prompt_id in completed:
+                        self.skipped += 1
+                        continue
+                    in_flight.acquire()
+                    future = executor.submit(self._run_one, prompt_id, prompt, tools_info, tool_index)
+                    future.add_done_callback(lambda _: in_flight.release())
+        finally:
+            self._output.close()
+        elapsed = time.perf_counter() - started
+        return self._summary(elapsed)
+
+    def _open_output(self):
+        mode = "a" if self.resume else "w"
+        needs_newline = False
+        if mode == "a" and os.path.exists(self.output_path) and os.path.getsize(self.output_path) > 0:
+            with open(self.output_path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                needs_newline = f.read(1) != b"\n"
+        self._output = open(self.output_path, mode, encoding="utf-8")
+        if needs_newline:
+            self._output.write("\n")
+
+    def _run_one(self, prompt_id, prompt, tools_info, tool_index):
+        started = time.perf_counter()
+        schema_tokens = None
+        try:
+            assistant = Assistant(provider_name=self.provider_name, model_name=self.model_name, tools_info=tools_info, tool_index=tool_index)
+            response = assistant.handle_command(prompt)
+            schema_tokens = assistant.last_tool_selection.get("schema_tokens_sent")
+            # Providers report failures as "Error..." strings rather than raising
+            status = "error" if isinstance(response, str) and response.startswith("Error") else "ok"
+        except Exception as e:
+            response = f"Error: {e}"
+            status = "error"
+        latency = time.perf_counter() - started
+        self._write_result({
+            "id": prompt_id,
+            "status": status,
+            "response": response,
+            "latency": round(latency, 4),
+            "schema_tokens": schema_tokens,
+        })
+        self.latencies.add(latency)
+        with self._lock:
+            if status == "ok":
+                self.succeeded += 1
+            else:
+                self.failed += 1
+
+    def _write_result(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._output.write(line)
+            # Flush every record so the output file doubles as the checkpoint
+            self._output.flush()
+
+    def _summary(self, elapsed):
+        processed = self.succeeded + self.failed
+        return {
+            "processed": processed,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "elapsed": elapsed,
+            "throughput": processed / elapsed if elapsed > 0 else 0.0,
+            "latency": self.latencies.summary(),
+            "prefix_cache": prefix_cache.summary(),
+        }
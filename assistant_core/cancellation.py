@@ -0,0 +1,55 @@
+import threading
+
+
+class GenerationCancelled(Exception):
+    """Raised inside a provider call once its CancelToken has been cancelled."""
+
+
+class CancelToken:
+    """Cooperative cancellation for one in-flight generation.
+
+    Code that holds a blocking resource (an HTTP stream, a pending request)
+    registers a callback with `on_cancel` that releases it, so `cancel()` from
+    another thread takes effect immediately instead of at the next check.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Error in cancel callback: {e}")
+
+    def on_cancel(self, callback):
+        """Run `callback` on cancel (right away if already cancelled)."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise GenerationCancelled()
+
+    def wait(self, timeout=None):
+        return self._event.wait(timeout)
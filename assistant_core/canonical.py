@@ -0,0 +1,31 @@
+import json
+
+
+def canonical_json(value):
+    """Stable JSON encoding: sorted keys, no insignificant whitespace."""
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+def canonicalize(value):
+    """Rebuild dicts with sorted keys so the SDK serializes them identically every time."""
+    if isinstance(value, dict):
+        return {key: canonicalize(value[key]) for key in sorted(value)}
+    if isinstance(value, list):
+        return [canonicalize(item) for item in value]
+    return value
+
+
+def canonical_tools(tools_info):
+    """Tool entries sorted by name, each schema with canonical key order.
+
+    MCP servers return tools in arbitrary order; normalizing once at discovery
+    keeps the tools part of the request prefix byte-identical across turns,
+    which is what provider prompt caching keys on.
+    """
+    tools = [
+        {"server_url": info["server_url"], "schema": canonicalize(info["schema"])}
+        for info in tools_info
+    ]
+    tools.sort(key=lambda info: (info["schema"].get("function", {}).get("name", ""), info["server_url"]))
+    return tools
+
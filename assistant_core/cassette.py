@@ -0,0 +1,399 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config.settings import settings
+
+
+class CassetteMiss(LookupError):
+    """A replayed request has no recorded exchange left to answer it."""
+
+
+def _canonical_json(value):
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def request_key(*parts):
+    """Short fingerprint of a request, used to find its recording."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if not isinstance(part, bytes):
+            part = _canonical_json(part).encode("utf-8")
+        digest.update(part)
+        digest.update(b"\0")
+    return digest.hexdigest()[:20]
+
+
+def _delay(since):
+    return round(time.perf_counter() - since, 4)
+
+
+class Cassette:
+    """Recorded provider and MCP traffic that can be served back without a network.
+
+    The file is append-only JSON lines, one exchange per line:
+
+      {"kind": "chat", "key": ..., "request": {...}, "delay": s, "response": {...}}
+      {"kind": "chat", "key": ..., "request": {...}, "chunks": [[delay, {...}], ...]}
+      {"kind": "mcp", "key": ..., "request": {"method": ..., "url": ..., "body": ...},
+       "status": 200, "reason": "OK", "content_type": ..., "chunks": [[delay, "bytes as latin-1"], ...]}
+
+    `request` is what was sent (the chat.completions arguments with sorted
+    keys), so recordings can be inspected and diffed; `key` is its
+    fingerprint, used to find the recording again. A streamed chat
+    completion keeps every chunk, and an MCP response every body chunk, with
+    the delay since the previous one (the first delay runs from when the
+    request was sent). Replaying serves the recorded exchanges in place of
+    the network, either with the recorded delays (`realtime`) or as fast as
+    possible. A request whose key was not recorded gets the next unused
+    exchange of its kind, in recording order.
+    """
+
+    def __init__(self, path, mode="record", realtime=False):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode '{mode}'")
+        self.path = path
+        self.mode = mode
+        self.realtime = realtime
+        self.recorded = 0
+        self.replayed = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._file = None
+        self._by_key = {}
+        self._by_kind = {}
+        if mode == "replay":
+            self._load()
+
+    @property
+    def replaying(self):
+        return self.mode == "replay"
+
+    def _load(self):
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # Torn last line from an interrupted recording
+                    break
+                entry = json.loads(line)
+                entry["used"] = False
+                self._by_key.setdefault((entry["kind"], entry["key"]), deque()).append(entry)
+                self._by_kind.setdefault(entry["kind"], deque()).append(entry)
+
+    def append(self, entry):
+        line = json.dumps(entry, separators=(",", ":"), ensure_ascii=False) + "\n"
+        with self._lock:
+            if self._file is None:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line)
+            self._file.flush()
+            self.recorded += 1
+
+    def take(self, kind, key):
+        """The recorded exchange answering this request (each one is served once)."""
+        with self._lock:
+            matches = self._by_key.get((kind, key))
+            while matches and matches[0]["used"]:
+                matches.popleft()
+            if matches:
+                entry = matches.popleft()
+            else:
+                pending = self._by_kind.get(kind, ())
+                while pending and pending[0]["used"]:
+                    pending.popleft()
+                if not pending:
+                    raise CassetteMiss(f"No recorded {kind} exchange left in {self.path}")
+                entry = pending.popleft()
+                self.misses += 1
+                print(f"Cassette: no recording matches this {kind} request; replaying the next one recorded")
+            entry["used"] = True
+            self.replayed += 1
+            return entry
+
+    def wait(self, delay, stop=None):
+        """Sleep for a recorded delay when replaying in real time; False once `stop` is set."""
+        if not self.realtime or delay <= 0:
+            return not (stop is not None and stop.is_set())
+        if stop is None:
+            time.sleep(delay)
+            return True
+        return not stop.wait(delay)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    # chat.completions
+
+    def wrap_chat(self, kwargs, send):
+        """Wrap `send` (a raw chat.completions request) to record or replay it."""
+        key = request_key("chat", kwargs)
+        if self.replaying:
+            return lambda: _ReplayedCompletion(self, self.take("chat", key))
+        request = json.loads(_canonical_json(kwargs))
+
+        def record():
+            started = time.perf_counter()
+            return _RecordingCompletion(self, key, request, send(), started)
+        return record
+
+    # MCP over requests
+
+    def replay_http(self, request):
+        entry = self.take("mcp", request_key(request.method, request.url, request.body or b""))
+        return _ReplayedBody(self, entry)
+
+
+class _ReplayedCompletion:
+    """Stands in for the SDK's raw response when replaying."""
+
+    headers = {}
+
+    def __init__(self, cassette, entry):
+        self.cassette = cassette
+        self.entry = entry
+
+    def parse(self):
+        from openai.types.chat import ChatCompletion
+
+        if "chunks" in self.entry:
+            return _ReplayedStream(self.cassette, self.entry["chunks"])
+        self.cassette.wait(self.entry.get("delay", 0))
+        return ChatCompletion.model_validate(self.entry["response"])
+
+
+class _ReplayedStream:
+    """Iterates recorded chunks like an SDK Stream; close() stops it (also mid-wait)."""
+
+    def __init__(self, cassette, chunks):
+        self.cassette = cassette
+        self.chunks = chunks
+        self._closed = threading.Event()
+
+    def __iter__(self):
+        from openai.types.chat import ChatCompletionChunk
+
+        for delay, chunk in self.chunks:
+            if not self.cassette.wait(delay, self._closed):
+                return
+            yield ChatCompletionChunk.model_validate(chunk)
+
+    def close(self):
+        self._closed.set()
+
+
+class _RecordingCompletion:
+    """Wraps the SDK's raw response; what parse() returns is written to the cassette."""
+
+    def __init__(self, cassette, key, request, raw_response, started):
+        self.cassette = cassette
+        self.key = key
+        self.request = request
+        self.raw_response = raw_response
+        self.started = started
+        self.delay = _delay(started)
+
+    @property
+    def headers(self):
+        return self.raw_response.headers
+
+    def parse(self):
+        response = self.raw_response.parse()
+        if hasattr(response, "choices"):
+            self.cassette.append({
+                "kind": "chat",
+                "key": self.key,
+                "request": self.request,
+                "delay": self.delay,
+                "response": response.model_dump(mode="json", exclude_unset=True),
+            })
+            return response
+        return _RecordingStream(self.cassette, self.key, self.request, response, self.started)
+
+
+class _RecordingStream:
+    """Passes an SDK Stream through, keeping each chunk and its delay.
+
+    The exchange is written once the stream ends or is closed.
+    """
+
+    def __init__(self, cassette, key, request, stream, started):
+        self.cassette = cassette
+        self.key = key
+        self.request = request
+        self.stream = stream
+        self.chunks = []
+        self._last = started
+        self._written = False
+
+    def __iter__(self):
+        try:
+            for chunk in self.stream:
+                self.chunks.append([_delay(self._last), chunk.model_dump(mode="json", exclude_unset=True)])
+                self._last = time.perf_counter()
+                yield chunk
+        finally:
+            self._write()
+
+    def close(self):
+        self.stream.close()
+        self._write()
+
+    def _write(self):
+        if not self._written:
+            self._written = True
+            self.cassette.append({"kind": "chat", "key": self.key, "request": self.request, "chunks": self.chunks})
+
+
+class _ReplayedBody:
+    """Plays a recorded MCP response body back the way urllib3 would stream it."""
+
+    def __init__(self, cassette, entry):
+        self.cassette = cassette
+        self.entry = entry
+        self.status = entry["status"]
+        self.reason = entry.get("reason", "")
+        self.headers = {"Content-Type": entry["content_type"]} if entry.get("content_type") else {}
+        self._closed = threading.Event()
+
+    def stream(self, amt=None, decode_content=None):
+        for delay, data in self.entry["chunks"]:
+            if not self.cassette.wait(delay, self._closed):
+                return
+            yield data.encode("latin-1")
+
+    def read(self, amt=None, decode_content=None, **kwargs):
+        return b"".join(self.stream())
+
+    def close(self):
+        self._closed.set()
+
+    def release_conn(self):
+        pass
+
+
+class _RecordingBody:
+    """Passes a urllib3 response body through, keeping each chunk and its delay."""
+
+    def __init__(self, cassette, key, request, raw, started):
+        self._cassette = cassette
+        self._key = key
+        self._request = request
+        self._raw = raw
+        self._chunks = []
+        self._last = started
+        self._written = False
+
+    def _keep(self, data):
+        if data:
+            # latin-1 maps bytes 1:1 to characters, so any body survives JSON
+            self._chunks.append([_delay(self._last), data.decode("latin-1")])
+            self._last = time.perf_counter()
+        return data
+
+    def stream(self, amt=2 ** 16, decode_content=None):
+        try:
+            for data in self._raw.stream(amt, decode_content=decode_content):
+                yield self._keep(data)
+        finally:
+            self._write()
+
+    def read(self, amt=None, decode_content=None, **kwargs):
+        data = self._keep(self._raw.read(amt, decode_content=decode_content, **kwargs))
+        if not data or amt is None:
+            self._write()
+        return data
+
+    def close(self):
+        self._raw.close()
+        self._write()
+
+    def release_conn(self):
+        self._raw.release_conn()
+        self._write()
+
+    def _write(self):
+        if not self._written:
+            self._written = True
+            self._cassette.append({
+                "kind": "mcp",
+                "key": self._key,
+                "request": self._request,
+                "status": self._raw.status,
+                "reason": self._raw.reason,
+                "content_type": self._raw.headers.get("Content-Type", ""),
+                "chunks": self._chunks,
+            })
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+
+class CassetteAdapter(HTTPAdapter):
+    """requests transport for the MCP session: records or replays through the active cassette."""
+
+    def send(self, request, **kwargs):
+        cassette = get_cassette()
+        if cassette is None:
+            return super().send(request, **kwargs)
+        if cassette.replaying:
+            try:
+                return self.build_response(request, cassette.replay_http(request))
+            except CassetteMiss as e:
+                raise requests.exceptions.ConnectionError(str(e), request=request)
+        body = request.body or b""
+        key = request_key(request.method, request.url, body)
+        sent = {
+            "method": request.method,
+            "url": request.url,
+            "body": body.decode("latin-1") if isinstance(body, bytes) else body,
+        }
+        started = time.perf_counter()
+        response = super().send(request, **kwargs)
+        response.raw = _RecordingBody(cassette, key, sent, response.raw, started)
+        return response
+
+
+_cassette = None
+_cassette_loaded = False
+_cassette_lock = threading.Lock()
+
+
+def get_cassette():
+    """The active Cassette (from the cassette_* settings unless set_cassette() was called), or None."""
+    global _cassette, _cassette_loaded
+    if _cassette_loaded:
+        return _cassette
+    with _cassette_lock:
+        if not _cassette_loaded:
+            mode = settings.get_cassette_mode()
+            if mode in ("record", "replay"):
+                _cassette = Cassette(settings.get_cassette_path(), mode, realtime=settings.get_cassette_realtime())
+            _cassette_loaded = True
+        return _cassette
+
+
+def set_cassette(cassette):
+    """Make `cassette` (or None, for live traffic) the active one."""
+    global _cassette, _cassette_loaded
+    with _cassette_lock:
+        if _cassette is not None and _cassette is not cassette:
+            _cassette.close()
+        _cassette = cassette
+        _cassette_loaded = True
+
+
+def replaying():
+    cassette = get_cassette()
+    return cassette is not None and cassette.replaying
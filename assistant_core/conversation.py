@@ -0,0 +1,180 @@
+import json
+import threading
+
+from .assistant import Assistant
+from .cancellation import CancelToken, GenerationCancelled
+from .executor import turn_executor
+from .messages import MessageHistory
+from config.settings import settings
+
+
+class Turn:
+    """One queued user message and its outcome."""
+
+    def __init__(self, user_input, stream_callback, on_start=None, on_done=None, on_tool_output=None):
+        self.user_input = user_input
+        self.stream_callback = stream_callback
+        self.on_tool_output = on_tool_output
+        self.on_start = on_start
+        self.on_done = on_done
+        self.cancel_token = CancelToken()
+        self.status = "queued"  # queued -> running -> completed | cancelled | error
+        self.started = False
+        self.result = None
+        self.number = 0
+
+
+class Conversation:
+    """Runs the turns of one conversation strictly one after another.
+
+    Turns are queued on a FairExecutor shared with the other conversations
+    (at most one running per conversation), so the provider's `messages` is
+    never touched by two turns at once and a busy conversation cannot hold
+    more than one worker. `cancel()` stops the running turn (closing its
+    provider stream and abandoning pending tool calls) and drops any turns
+    still waiting. A shared ToolCatalog avoids querying the MCP servers for
+    every conversation.
+
+    The conversation can be branched: `fork()` starts a new branch from any
+    point of the current one and `edit()` re-asks an earlier prompt with new
+    text on a branch of its own. Branches share their common messages (see
+    MessageHistory.fork), and `switch()` only changes which history the next
+    turn appends to.
+    """
+
+    def __init__(self, executor=None, catalog=None):
+        self.executor = executor or turn_executor
+        self.catalog = catalog
+        self.assistant = None
+        self._assistant_key = None
+        # Branch name -> history; turns run on `branch`
+        self.histories = {"main": MessageHistory()}
+        self.branch = "main"
+        self._current = None
+        self._pending = 0
+        # Turns numbered up to this were submitted before the last cancel()
+        self._submitted = 0
+        self._cancelled_upto = 0
+        self._lock = threading.Lock()
+
+    def submit(self, user_input, stream_callback, on_start=None, on_done=None, on_tool_output=None):
+        turn = Turn(user_input, stream_callback, on_start, on_done, on_tool_output)
+        with self._lock:
+            self._pending += 1
+            self._submitted += 1
+            turn.number = self._submitted
+        self.executor.submit(self, self._run_turn, turn)
+        return turn
+
+    def cancel(self):
+        """Cancel the running turn and every queued one."""
+        pending = [args[0] for args in self.executor.cancel_pending(self)]
+        with self._lock:
+            current = self._current
+            self._pending -= len(pending)
+            # Also catches a turn a worker has just taken but not started yet
+            self._cancelled_upto = self._submitted
+        if current is not None:
+            current.cancel_token.cancel()
+        for turn in pending:
+            turn.cancel_token.cancel()
+            self._finish(turn, "cancelled")
+
+    @property
+    def history(self):
+        return self.histories[self.branch]
+
+    def fork(self, at=None, name=None):
+        """Start a branch with the first `at` messages of the current one (all by default) and switch to it."""
+        self._ensure_idle()
+        name = name or f"branch {len(self.histories)}"
+        if name in self.histories:
+            raise ValueError(f"Branch '{name}' already exists")
+        self.histories[name] = self.history.fork(at)
+        self.branch = name
+        return name
+
+    def switch(self, name):
+        self._ensure_idle()
+        if name not in self.histories:
+            raise ValueError(f"Unknown branch '{name}'")
+        self.branch = name
+
+    def edit(self, index, user_input, stream_callback, **callbacks):
+        """Ask the user message at `index` again with new text, on a new branch.
+
+        The current branch is kept as it is; returns the queued Turn.
+        """
+        if self.history[index].role != "user":
+            raise ValueError(f"Message {index} is not a user message")
+        self.fork(at=index)
+        return self.submit(user_input, stream_callback, **callbacks)
+
+    def _ensure_idle(self):
+        if self.busy:
+            raise RuntimeError("Stop or wait for the running turn before changing branches")
+
+    @property
+    def busy(self):
+        with self._lock:
+            return self._current is not None or self._pending > 0
+
+    def _get_assistant(self):
+        # Re-create the assistant when the provider, model or MCP servers
+        # change; the history itself belongs to the conversation.
+        key = (
+            settings.get_selected_provider(),
+            settings.get_selected_model(),
+            json.dumps(settings.get_mcp_servers(), sort_keys=True),
+        )
+        if self.assistant is None or key != self._assistant_key:
+            if self.catalog is not None:
+                tools_info, tool_index = self.catalog.get()
+                assistant = Assistant(tools_info=tools_info, tool_index=tool_index)
+            else:
+                assistant = Assistant()
+            if self.assistant is not None:
+                assistant.tool_outputs.spilled = self.assistant.tool_outputs.spilled
+                assistant.session_id = self.assistant.session_id
+            self.assistant = assistant
+            self._assistant_key = key
+        return self.assistant
+
+    def _run_turn(self, turn):
+        with self._lock:
+            self._pending -= 1
+            self._current = turn
+            if turn.number <= self._cancelled_upto:
+                turn.cancel_token.cancel()
+        turn.status = "running"
+        turn.started = True
+        try:
+            if turn.on_start:
+                turn.on_start(turn)
+            turn.cancel_token.raise_if_cancelled()
+            assistant = self._get_assistant()
+            # The history lives here so branches survive provider/model changes
+            assistant.provider.messages = self.history
+            turn.result = assistant.handle_command_stream(
+                turn.user_input,
+                turn.stream_callback,
+                cancel_token=turn.cancel_token,
+                tool_output_callback=turn.on_tool_output,
+            )
+            status = "completed"
+        except GenerationCancelled:
+            status = "cancelled"
+        except Exception as e:
+            turn.result = f"Error: {e}"
+            status = "error"
+        with self._lock:
+            self._current = None
+        self._finish(turn, status)
+
+    def _finish(self, turn, status):
+        turn.status = status
+        if turn.on_done:
+            try:
+                turn.on_done(turn)
+            except Exception as e:
+                print(f"Error in turn callback: {e}")
@@ -0,0 +1,117 @@
+import threading
+import time
+from collections import OrderedDict, deque
+
+from config.settings import settings
+
+
+class FairExecutor:
+    """Bounded worker pool that takes turns between owners.
+
+    Every task belongs to an owner (a conversation, a tab...). Each owner
+    has its own queue, and idle workers serve owners round-robin, running at
+    most `max_per_owner` of an owner's tasks at once. An owner with a long
+    backlog or a slow agent loop therefore holds at most that many workers,
+    and the other owners keep being served. Worker threads start on the
+    first submit.
+    """
+
+    def __init__(self, workers=4, max_per_owner=1):
+        self.workers = max(1, workers)
+        self.max_per_owner = max(1, max_per_owner)
+        # owner -> deque of (fn, args); order is the round-robin order
+        self._queues = OrderedDict()
+        self._running = {}
+        self._cond = threading.Condition()
+        self._threads = []
+        self._started = time.monotonic()
+        self.busy = 0
+        self.busy_seconds = 0.0
+        self.completed = 0
+
+    def submit(self, owner, fn, *args):
+        with self._cond:
+            if not self._threads:
+                self._start_workers()
+            self._queues.setdefault(owner, deque()).append((fn, args))
+            self._cond.notify()
+
+    def cancel_pending(self, owner):
+        """Drop `owner`'s tasks that have not started; returns their argument tuples."""
+        with self._cond:
+            queue = self._queues.pop(owner, None)
+            if self._running.get(owner):
+                # Keep the owner's place while one of its tasks runs
+                self._queues[owner] = deque()
+        return [args for _, args in queue or ()]
+
+    def queued(self, owner=None):
+        with self._cond:
+            if owner is not None:
+                return len(self._queues.get(owner, ()))
+            return sum(len(queue) for queue in self._queues.values())
+
+    def stats(self):
+        with self._cond:
+            uptime = time.monotonic() - self._started
+            return {
+                "workers": self.workers,
+                "busy": self.busy,
+                "utilization": self.busy / self.workers,
+                # Share of worker time spent running tasks since the pool was created
+                "mean_utilization": self.busy_seconds / (self.workers * uptime) if uptime > 0 else 0.0,
+                "queued": sum(len(queue) for queue in self._queues.values()),
+                "owners_waiting": sum(1 for queue in self._queues.values() if queue),
+                "completed": self.completed,
+            }
+
+    def _start_workers(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"fair-executor-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _next_task(self):
+        for owner, queue in self._queues.items():
+            if queue and self._running.get(owner, 0) < self.max_per_owner:
+                fn, args = queue.popleft()
+                # Served owners go to the back of the line
+                self._queues.move_to_end(owner)
+                return owner, fn, args
+        return None
+
+    def _work(self):
+        while True:
+            with self._cond:
+                task = self._next_task()
+                while task is None:
+                    self._cond.wait()
+                    task = self._next_task()
+                owner, fn, args = task
+                self._running[owner] = self._running.get(owner, 0) + 1
+                self.busy += 1
+            started = time.monotonic()
+            try:
+                fn(*args)
+            except Exception as e:
+                print(f"Error in executor task: {e}")
+            finally:
+                with self._cond:
+                    self.busy -= 1
+                    self.busy_seconds += time.monotonic() - started
+                    self.completed += 1
+                    self._running[owner] -= 1
+                    if not self._running[owner]:
+                        del self._running[owner]
+                    if owner in self._queues:
+                        if self._queues[owner] or owner in self._running:
+                            # Owners that queued up meanwhile go first
+                            self._queues.move_to_end(owner)
+                        else:
+                            del self._queues[owner]
+                    # A slot (and maybe this owner's next task) is free
+                    self._cond.notify_all()
+
+
+# Shared by every conversation: one turn at a time per conversation
+turn_executor = FairExecutor(workers=settings.get_turn_workers(), max_per_owner=1)
@@ -0,0 +1,300 @@
+import json
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Flask, Response, jsonify, request
+
+from .assistant import Assistant, fetch_all_tools
+from .cancellation import CancelToken, GenerationCancelled
+from .metrics import LatencyStats, prefix_cache, time_to_first_token
+from .scheduler import scheduler
+from .tool_index import ToolIndex
+from config.settings import settings
+
+_END_OF_STREAM = object()
+
+
+def _message_text(content):
+    """Flatten OpenAI message content (a string or a list of parts) to text."""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return ""
+
+
+class GatewayBusy(Exception):
+    """Raised when the worker pool and its queue are both full."""
+
+
+class SessionModelMismatch(Exception):
+    """Raised when a request names a different model than its session was created with."""
+
+
+class Session:
+    def __init__(self, session_id, assistant):
+        self.id = session_id
+        self.assistant = assistant
+        # Turns of one session must not interleave on the provider's history
+        self.lock = threading.Lock()
+        self.last_used = time.time()
+
+
+class Gateway:
+    """Serves the Assistant to other local apps over an OpenAI-compatible API.
+
+    MCP tools are discovered once at startup and provider clients are shared
+    process-wide (see providers.get_client), so each session only owns its
+    message history.
+    """
+
+    def __init__(self, workers=4, max_queue=16, max_sessions=256, session_ttl=3600, provider_name=None):
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self.max_sessions = max_sessions
+        self.session_ttl = session_ttl
+        self.provider_name = provider_name
+
+        self.tools_info = fetch_all_tools()
+        self.tool_index = ToolIndex([info['schema'] for info in self.tools_info])
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="gateway")
+
+        self.sessions = OrderedDict()
+        self._sessions_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.queue_wait = LatencyStats(window=1000)
+        self.service_time = LatencyStats(window=1000)
+        # Tool schema tokens sent per turn (see Assistant.select_tools)
+        self.schema_tokens = LatencyStats(window=1000)
+
+    # Session table
+
+    def get_session(self, session_id, model_name=None):
+        now = time.time()
+        with self._sessions_lock:
+            self._evict_sessions(now)
+            session = self.sessions.get(session_id)
+            if session is None:
+                assistant = Assistant(provider_name=self.provider_name, model_name=model_name, tools_info=self.tools_info, tool_index=self.tool_index)
+                session = Session(session_id, assistant)
+                self.sessions[session_id] = session
+            elif model_name and model_name != session.assistant.provider.model:
+                # Its history was built with another model; don't switch silently
+                raise SessionModelMismatch(
+                    f"Session '{session_id}' uses model '{session.assistant.provider.model}', not '{model_name}'. "
+                    "Start a new session to change models."
+                )
+            self.sessions.move_to_end(session_id)
+            session.last_used = now
+            return session
+
+    def new_ephemeral_session(self, history, model_name=None):
+        """A throwaway session seeded with the history the client sent."""
+        assistant = Assistant(provider_name=self.provider_name, model_name=model_name, tools_info=self.tools_info, tool_index=self.tool_index)
+        assistant.provider.messages.extend(history)
+        return Session(None, assistant)
+
+    def drop_session(self, session_id):
+        with self._sessions_lock:
+            return self.sessions.pop(session_id, None) is not None
+
+    def _evict_sessions(self, now):
+        # Oldest entries are at the front of the OrderedDict
+        while self.sessions:
+            oldest_id, oldest = next(iter(self.sessions.items()))
+            if len(self.sessions) < self.max_sessions and now - oldest.last_used < self.session_ttl:
+                break
+            del self.sessions[oldest_id]
+
+    # Worker pool with admission control
+
+    def submit(self, fn, *args):
+        with self._stats_lock:
+            if self.queued + self.running >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise GatewayBusy()
+            self.queued += 1
+        enqueued_at = time.perf_counter()
+
+        def task():
+            started = time.perf_counter()
+            with self._stats_lock:
+                self.queued -= 1
+                self.running += 1
+            self.queue_wait.add(started - enqueued_at)
+            try:
+                return fn(*args)
+            finally:
+                self.service_time.add(time.perf_counter() - started)
+                with self._stats_lock:
+                    self.running -= 1
+                    self.completed += 1
+
+        return self.executor.submit(task)
+
+    def metrics(self):
+        with self._stats_lock:
+            counters = {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "queued": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+        with self._sessions_lock:
+            counters["sessions"] = len(self.sessions)
+        counters["queue_wait"] = self.queue_wait.summary()
+        counters["service_time"] = self.service_time.summary()
+        counters["tool_schema_tokens"] = dict(self.schema_tokens.summary(), catalog=self.tool_index.total_tokens())
+        counters["providers"] = {
+            "time_to_first_token": time_to_first_token.summary(),
+            "prefix_cache": prefix_cache.summary(),
+            "rate_limits": scheduler.stats(),
+        }
+        return counters
+
+    # Turn execution
+
+    def run_turn(self, session, user_input, stream_callback=None, cancel_token=None):
+        with session.lock:
+            try:
+                if stream_callback is None:
+                    return session.assistant.handle_command(user_input)
+                return session.assistant.handle_command_stream(user_input, stream_callback, cancel_token=cancel_token)
+            finally:
+                sent = session.assistant.last_tool_selection.get("schema_tokens_sent")
+                if sent is not None:
+                    self.schema_tokens.add(sent)
+
+
+def _completion_id():
+    return f"chatcmpl-{uuid.uuid4().hex}"
+
+
+def _chunk(completion_id, model, delta, finish_reason=None):
+    payload = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+def create_app(gateway: Gateway) -> Flask:
+    app = Flask(__name__)
+
+    @app.get("/v1/models")
+    def list_models():
+        model = settings.get_selected_model()
+        return jsonify({"object": "list", "data": [{"id": model, "object": "model", "owned_by": "assistant"}]})
+
+    @app.get("/metrics")
+    def metrics():
+        return jsonify(gateway.metrics())
+
+    @app.delete("/v1/sessions/<session_id>")
+    def delete_session(session_id):
+        if gateway.drop_session(session_id):
+            return "", 204
+        return jsonify({"error": {"message": f"Unknown session '{session_id}'"}}), 404
+
+    @app.post("/v1/chat/completions")
+    def chat_completions():
+        body = request.get_json(silent=True) or {}
+        messages = body.get("messages") or []
+        if not messages or messages[-1].get("role") != "user":
+            return jsonify({"error": {"message": "The last message must have role 'user'."}}), 400
+
+        user_input = _message_text(messages[-1].get("content"))
+        model_name = body.get("model")
+        session_id = request.headers.get("X-Session-Id") or body.get("session_id")
+        if session_id:
+            # The session keeps its own history; only the new user turn is used
+            try:
+                session = gateway.get_session(session_id, model_name)
+            except SessionModelMismatch as e:
+                return jsonify({"error": {"message": str(e), "type": "invalid_request_error"}}), 400
+        else:
+            history = [
+                {"role": m["role"], "content": _message_text(m.get("content"))}
+                for m in messages[:-1]
+                if m.get("role") in ("system", "user", "assistant")
+            ]
+            session = gateway.new_ephemeral_session(history, model_name)
+        model = session.assistant.provider.model
+        headers = {"X-Session-Id": session_id} if session_id else {}
+
+        if not body.get("stream"):
+            try:
+                future = gateway.submit(gateway.run_turn, session, user_input)
+            except GatewayBusy:
+                return _busy_response()
+            content = future.result()
+            return jsonify({
+                "id": _completion_id(),
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }],
+            }), 200, headers
+
+        tokens = queue.Queue()
+        # Cancelled when the client disconnects, so the turn stops using quota and a worker
+        cancel_token = CancelToken()
+
+        def run_streaming():
+            try:
+                gateway.run_turn(session, user_input, tokens.put, cancel_token)
+            except GenerationCancelled:
+                pass
+            finally:
+                tokens.put(_END_OF_STREAM)
+
+        try:
+            gateway.submit(run_streaming)
+        except GatewayBusy:
+            return _busy_response()
+
+        def event_stream():
+            completion_id = _completion_id()
+            try:
+                yield _chunk(completion_id, model, {"role": "assistant", "content": ""})
+                while True:
+                    token = tokens.get()
+                    if token is _END_OF_STREAM:
+                        break
+                    yield _chunk(completion_id, model, {"content": token})
+                yield _chunk(completion_id, model, {}, finish_reason="stop")
+                yield "data: [DONE]\n\n"
+            except GeneratorExit:
+                # The client went away mid-stream
+                cancel_token.cancel()
+                raise
+
+        headers["Cache-Control"] = "no-cache"
+        return Response(event_stream(), mimetype="text/event-stream", headers=headers)
+
+    return app
+
+
+def _busy_response():
+    response = jsonify({"error": {"message": "Server is at capacity, retry later.", "type": "rate_limit_error"}})
+    response.status_code = 429
+    response.headers["Retry-After"] = "1"
+    return response
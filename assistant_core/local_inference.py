@@ -0,0 +1,460 @@
+import queue
+import threading
+import time
+
+from .metrics import prefix_cache
+from config.settings import settings
+
+# Sentinel closing a request's output queue
+_DONE = object()
+
+
+def common_prefix_length(a, b):
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+class GenerationRequest:
+    """One generation: chat messages in, text pieces out through `output`."""
+
+    def __init__(self, messages, max_new_tokens=512, temperature=0.0):
+        self.messages = messages
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.output = queue.Queue()
+        self.cancelled = False
+        self.prompt_tokens = 0
+        self.reused_tokens = 0
+
+    def cancel(self):
+        # The caller stops waiting right away, even while the request is
+        # still queued behind a full batch; the worker drops it when it
+        # next looks at it
+        if not self.cancelled:
+            self.cancelled = True
+            self.output.put(_DONE)
+
+    def fail(self, error):
+        self.output.put(error)
+        self.output.put(_DONE)
+
+
+class IncrementalDecoder:
+    """Turns generated token ids into text pieces as they are produced.
+
+    Tokens are decoded together since one character can span several of
+    them; nothing is emitted while the text ends in an incomplete character.
+    The window restarts after each newline so decoding stays cheap.
+    """
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.ids = []
+        self.offset = 0
+
+    def push(self, token_id):
+        self.ids.append(token_id)
+        text = self.tokenizer.decode(self.ids, skip_special_tokens=True)
+        if text.endswith("\ufffd"):
+            return ""
+        piece = text[self.offset:]
+        if text.endswith("\n"):
+            self.ids = []
+            self.offset = 0
+        else:
+            self.offset = len(text)
+        return piece
+
+
+def _left_pad(tensor, width, dim):
+    """Zero-pad `tensor` on the left of `dim` up to `width`."""
+    import torch
+
+    missing = width - tensor.shape[dim]
+    if missing <= 0:
+        return tensor
+    shape = list(tensor.shape)
+    shape[dim] = missing
+    return torch.cat([tensor.new_zeros(shape), tensor], dim=dim)
+
+
+class TorchBackend:
+    """Runs a Hugging Face causal LM on the CPU, decoding many sequences per forward pass.
+
+    Sequences being decoded share one KV cache, left-padded to a common
+    length with an attention mask hiding the padding. A sequence is
+    prefilled on its own, then joins the batch; when it finishes its rows
+    are cut out again and returned as a cache of its own. Every method runs
+    on the engine's worker thread.
+
+    torch and transformers are imported by `load()`, so the rest of the app
+    works without them.
+    """
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self.model = None
+        self.tokenizer = None
+        self.eos_ids = set()
+        self.torch = None
+        # Batch state: [(keys, values)] per layer, each [batch, heads, length, dim]
+        self._layers = None
+        # [batch, length], 0 on left padding
+        self._mask = None
+        # Real (unpadded) cache length of each row
+        self._lengths = []
+
+    def load(self):
+        if self.model is not None:
+            return
+        import torch
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
+        print(f"Loading {self.model_name} for in-process inference...")
+        self.torch = torch
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        model = AutoModelForCausalLM.from_pretrained(self.model_name, torch_dtype=torch.float32)
+        model.eval()
+        eos = model.generation_config.eos_token_id
+        if eos is None:
+            eos = self.tokenizer.eos_token_id
+        self.eos_ids = set(eos) if isinstance(eos, (list, tuple)) else {eos}
+        self.model = model
+
+    def encode(self, messages):
+        return self.tokenizer.apply_chat_template(messages, add_generation_prompt=True)
+
+    def _sample(self, logits, temperature):
+        if not temperature:
+            return int(logits.argmax())
+        probs = self.torch.softmax(logits / temperature, dim=-1)
+        return int(self.torch.multinomial(probs, 1))
+
+    def prefill(self, ids, cache, reused, temperature):
+        """Encode ids[reused:] on top of `cache` (None for a cold start).
+
+        Returns the first generated token and the sequence's cache.
+        """
+        from transformers import DynamicCache
+
+        torch = self.torch
+        if cache is None:
+            cache = DynamicCache()
+        with torch.inference_mode():
+            out = self.model(input_ids=torch.tensor([ids[reused:]]), past_key_values=cache, use_cache=True)
+        return self._sample(out.logits[0, -1], temperature), out.past_key_values
+
+    def add(self, cache):
+        """Append a prefilled sequence's cache as the last row of the batch."""
+        torch = self.torch
+        layers = cache.to_legacy_cache()
+        length = layers[0][0].shape[2]
+        if self._layers is None:
+            self._layers = [(keys, values) for keys, values in layers]
+            self._mask = torch.ones(1, length, dtype=torch.long)
+            self._lengths = [length]
+            return
+        width = max(self._mask.shape[1], length)
+        self._layers = [
+            (
+                torch.cat([_left_pad(batch_keys, width, 2), _left_pad(keys, width, 2)]),
+                torch.cat([_left_pad(batch_values, width, 2), _left_pad(values, width, 2)]),
+            )
+            for (batch_keys, batch_values), (keys, values) in zip(self._layers, layers)
+        ]
+        row_mask = _left_pad(torch.ones(1, length, dtype=torch.long), width, 1)
+        self._mask = torch.cat([_left_pad(self._mask, width, 1), row_mask])
+        self._lengths.append(length)
+
+    def remove(self, index):
+        """Drop row `index` from the batch and return its own, unpadded cache."""
+        from transformers import DynamicCache
+
+        torch = self.torch
+        length = self._lengths.pop(index)
+        row = tuple(
+            (keys[index:index + 1, :, -length:].clone(), values[index:index + 1, :, -length:].clone())
+            for keys, values in self._layers
+        )
+        if not self._lengths:
+            self.reset()
+        else:
+            keep = torch.tensor([i for i in range(len(self._lengths) + 1) if i != index])
+            # Columns that are now padding in every row can go
+            width = max(self._lengths)
+            self._layers = [
+                (keys.index_select(0, keep)[:, :, -width:], values.index_select(0, keep)[:, :, -width:])
+                for keys, values in self._layers
+            ]
+            self._mask = self._mask.index_select(0, keep)[:, -width:]
+        return DynamicCache.from_legacy_cache(row)
+
+    def step(self, tokens, temperatures):
+        """Feed every row its next token; returns the token sampled for each row."""
+        from transformers import DynamicCache
+
+        torch = self.torch
+        mask = torch.cat([self._mask, torch.ones(len(tokens), 1, dtype=self._mask.dtype)], dim=1)
+        positions = torch.tensor([[length] for length in self._lengths])
+        cache = DynamicCache.from_legacy_cache(tuple(self._layers))
+        with torch.inference_mode():
+            out = self.model(
+                input_ids=torch.tensor([[token] for token in tokens]),
+                attention_mask=mask,
+                position_ids=positions,
+                past_key_values=cache,
+                use_cache=True,
+            )
+        self._layers = list(out.past_key_values.to_legacy_cache())
+        self._mask = mask
+        self._lengths = [length + 1 for length in self._lengths]
+        return [self._sample(out.logits[i, -1], temperatures[i]) for i in range(len(tokens))]
+
+    def reset(self):
+        self._layers = None
+        self._mask = None
+        self._lengths = []
+
+
+class _Sequence:
+    """A request being decoded in the batch."""
+
+    def __init__(self, request, ids, decoder):
+        self.request = request
+        # Token ids whose keys/values are in the cache
+        self.ids = ids
+        self.decoder = decoder
+        # Last sampled token, fed on the next step
+        self.token = None
+        self.generated = 0
+
+
+class LocalEngine:
+    """In-process inference for one model, with continuous batching.
+
+    Callers get a generator of text pieces; a single worker thread owns the
+    model. When idle, the worker waits `batch_window` seconds after the
+    first request so that concurrent ones (batch runs, several windows) are
+    started together. Every decoding step then advances all running
+    sequences in one forward pass, up to `max_batch` of them. New requests
+    join at the next step instead of waiting for the batch to drain, and
+    finished ones leave without stopping the others. Each sampled token is
+    fanned out to its own request's queue. If the backend fails, every
+    running and queued request gets the error and the batch starts over
+    empty.
+
+    The KV cache of a finished sequence is kept along with the token ids it
+    covers. A new prompt starts from the cache sharing its longest prefix
+    (cropped to that prefix), so a follow-up turn of a conversation only
+    encodes the messages added since the previous reply.
+    """
+
+    def __init__(self, model_name, backend=None, max_batch=8, batch_window=0.01, max_cached_prefixes=4):
+        self.model_name = model_name
+        self.backend = backend or TorchBackend(model_name)
+        self.max_batch = max(1, max_batch)
+        self.batch_window = batch_window
+        self.max_cached_prefixes = max_cached_prefixes
+        # [(token ids covered by the cache, cache)], most recently used last
+        self._prefixes = []
+        # One _Sequence per batch row, in row order
+        self._active = []
+        self._requests = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+        self.steps = 0
+        self.batched_tokens = 0
+
+    def generate(self, messages, max_new_tokens=512, temperature=0.0, cancel_token=None):
+        """Yield the reply to `messages` piece by piece."""
+        request = GenerationRequest(messages, max_new_tokens, temperature)
+        self.submit(request)
+        if cancel_token is not None:
+            cancel_token.on_cancel(request.cancel)
+        try:
+            while True:
+                item = request.output.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            # Stops decoding early if the caller stops iterating
+            request.cancel()
+            if cancel_token is not None:
+                cancel_token.remove_callback(request.cancel)
+
+    def submit(self, request):
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name=f"local-engine:{self.model_name}", daemon=True)
+                self._worker.start()
+        self._requests.put(request)
+
+    def stats(self):
+        return {
+            "active": len(self._active),
+            "queued": self._requests.qsize(),
+            "steps": self.steps,
+            "mean_batch_size": self.batched_tokens / self.steps if self.steps else 0.0,
+        }
+
+    def _run(self):
+        while True:
+            pending = []
+            try:
+                pending = self._collect()
+                while pending:
+                    self._start(pending.pop(0))
+                if self._active:
+                    self._step()
+            except Exception as e:
+                # The batch state is unknown now: fail everything rather than
+                # let the worker die with callers blocked on their queues
+                self._fail(e, pending)
+
+    def _collect(self):
+        """New requests to start, as many as there are free batch slots."""
+        free = self.max_batch - len(self._active)
+        requests = []
+        if free <= 0:
+            return requests
+        if not self._active:
+            # Idle: block for work, then give concurrent requests a moment to arrive
+            requests.append(self._requests.get())
+            deadline = time.monotonic() + self.batch_window
+            while len(requests) < free:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    requests.append(self._requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+        else:
+            while len(requests) < free:
+                try:
+                    requests.append(self._requests.get_nowait())
+                except queue.Empty:
+                    break
+        return requests
+
+    def _start(self, request):
+        """Prefill a new request and add it to the running batch."""
+        if request.cancelled:
+            return
+        try:
+            self.backend.load()
+            ids = list(self.backend.encode(request.messages))
+            cache, reused = self._take_prefix(ids)
+            request.prompt_tokens = len(ids)
+            request.reused_tokens = reused
+            prefix_cache.get(f"embedded_transformers:{self.model_name}").add(len(ids), reused)
+            token, cache = self.backend.prefill(ids, cache, reused, request.temperature)
+        except Exception as e:
+            request.fail(e)
+            return
+        # Active before it is added, so a failing add() fails it with the batch
+        self._active.append(_Sequence(request, ids, IncrementalDecoder(self.backend.tokenizer)))
+        self.backend.add(cache)
+        if not self._accept(self._active[-1], token):
+            self._finish(len(self._active) - 1)
+
+    def _step(self):
+        # Cancelled sequences leave before another forward pass is spent on them
+        for index in reversed(range(len(self._active))):
+            if self._active[index].request.cancelled:
+                self._finish(index)
+        if not self._active:
+            return
+        tokens = self.backend.step(
+            [sequence.token for sequence in self._active],
+            [sequence.request.temperature for sequence in self._active],
+        )
+        self.steps += 1
+        self.batched_tokens += len(tokens)
+        for sequence in self._active:
+            sequence.ids.append(sequence.token)
+        # Backwards, so removing a row does not shift the rows still to visit
+        for index in reversed(range(len(self._active))):
+            if not self._accept(self._active[index], tokens[index]):
+                self._finish(index)
+
+    def _accept(self, sequence, token):
+        """Hand a sampled token to its request; False once the sequence is done."""
+        if token in self.backend.eos_ids or sequence.request.cancelled:
+            return False
+        sequence.generated += 1
+        piece = sequence.decoder.push(token)
+        if piece:
+            sequence.request.output.put(piece)
+        sequence.token = token
+        return sequence.generated < sequence.request.max_new_tokens
+
+    def _finish(self, index):
+        cache = self.backend.remove(index)
+        sequence = self._active.pop(index)
+        self._keep_prefix(sequence.ids, cache)
+        sequence.request.output.put(_DONE)
+
+    def _fail(self, error, pending):
+        """Fail the running, collected and queued requests, and start over with an empty batch."""
+        print(f"Local inference failed: {error}")
+        requests = [sequence.request for sequence in self._active] + pending
+        while True:
+            try:
+                requests.append(self._requests.get_nowait())
+            except queue.Empty:
+                break
+        for request in requests:
+            request.fail(error)
+        self._active = []
+        # Cached prefixes may share state with the broken batch
+        self._prefixes = []
+        try:
+            self.backend.reset()
+        except Exception as e:
+            print(f"Could not reset local inference backend: {e}")
+
+    def _take_prefix(self, ids):
+        """Remove and return (cache, reused length) for the best cached prefix of `ids`."""
+        best, best_length = None, 0
+        for index, (cached_ids, _) in enumerate(self._prefixes):
+            length = common_prefix_length(cached_ids, ids)
+            if length > best_length:
+                best, best_length = index, length
+        if best is None:
+            return None, 0
+        _, cache = self._prefixes.pop(best)
+        # At least one prompt token must be fed to get the next-token logits
+        reused = min(best_length, len(ids) - 1)
+        cache.crop(reused)
+        return cache, reused
+
+    def _keep_prefix(self, ids, cache):
+        self._prefixes.append((ids, cache))
+        excess = len(self._prefixes) - self.max_cached_prefixes
+        if excess > 0:
+            del self._prefixes[:excess]
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(model_name):
+    """The shared engine for `model_name`; every provider instance uses the same one."""
+    with _engines_lock:
+        engine = _engines.get(model_name)
+        if engine is None:
+            engine = LocalEngine(
+                model_name,
+                max_batch=settings.get_embedded_max_batch(),
+                batch_window=settings.get_embedded_batch_window_ms() / 1000.0,
+            )
+            _engines[model_name] = engine
+        return engine
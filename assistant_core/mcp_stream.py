@@ -0,0 +1,66 @@
+import json
+
+STREAM_CONTENT_TYPES = ("application/x-ndjson", "application/jsonl", "text/event-stream")
+
+# Sent with /invoke so servers that can stream know the client accepts it
+INVOKE_ACCEPT = "application/json, application/x-ndjson, text/event-stream"
+
+
+def is_streamed(response):
+    content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+    return content_type in STREAM_CONTENT_TYPES
+
+
+def _payload_event(payload, text_suffix=""):
+    """Map one decoded payload to ("delta" | "result" | "error", value)."""
+    try:
+        data = json.loads(payload)
+    except ValueError:
+        # Plain text lines / SSE data are output as-is
+        return "delta", payload + text_suffix
+    if not isinstance(data, dict):
+        return "delta", data if isinstance(data, str) else json.dumps(data)
+    if "error" in data:
+        return "error", data["error"]
+    if "result" in data:
+        return "result", data["result"]
+    for key in ("delta", "content", "output", "text"):
+        if key in data:
+            return "delta", data[key]
+    return "delta", json.dumps(data)
+
+
+def _iter_lines(response):
+    for line in response.iter_lines(decode_unicode=False):
+        yield line.decode("utf-8", errors="replace")
+
+
+def iter_invoke_events(response):
+    """Yield (kind, value) events from a streamed /invoke response.
+
+    Newline-delimited JSON: one payload per line. Server-sent events: the
+    `data:` lines of an event joined by newlines, `[DONE]` ends the stream.
+    A payload is {"delta": "..."} (also "content", "output" or "text") for a
+    piece of output, {"result": ...} for a final result and {"error": "..."}
+    for a failure; anything that is not JSON is taken as output text.
+    """
+    content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+    if content_type != "text/event-stream":
+        for line in _iter_lines(response):
+            if line.strip():
+                yield _payload_event(line, text_suffix="\n")
+        return
+
+    data = []
+    for line in _iter_lines(response):
+        if line.startswith("data:"):
+            value = line[5:]
+            data.append(value[1:] if value.startswith(" ") else value)
+        elif not line.strip() and data:
+            payload = "\n".join(data)
+            data = []
+            if payload.strip() == "[DONE]":
+                return
+            yield _payload_event(payload)
+    if data and "\n".join(data).strip() != "[DONE]":
+        yield _payload_event("\n".join(data))
@@ -0,0 +1,291 @@
+import json
+import os
+import threading
+import time
+import zlib
+from array import array
+
+import numpy as np
+
+from .tool_index import tokenize
+from config.settings import settings
+
+
+class HashedNgramEmbedder:
+    """Embeds text with no model: hashed word, word-pair and character-trigram features.
+
+    Each feature is hashed (crc32) to one of `dim` buckets with a hashed sign,
+    counts are damped with log1p and the vector is L2-normalized, so a dot
+    product between two embeddings is their cosine similarity.
+    """
+
+    def __init__(self, dim=256):
+        self.dim = dim
+
+    @staticmethod
+    def features(text):
+        words = tokenize(text)
+        features = list(words)
+        features.extend(f"{a} {b}" for a, b in zip(words, words[1:]))
+        for word in words:
+            padded = f"#{word}#"
+            features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        return features
+
+    def embed(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in self.features(text):
+            h = zlib.crc32(feature.encode("utf-8"))
+            vector[h % self.dim] += 1.0 if (h >> 31) & 1 else -1.0
+        vector = np.sign(vector) * np.log1p(np.abs(vector))
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed_batch(self, texts):
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.stack([self.embed(text) for text in texts])
+
+
+def _top_k(scores, k):
+    """Indices of the k highest scores, best first."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+class MemoryIndex:
+    """Persistent vector index of text snippets.
+
+    Layout of `directory`:
+      vectors.f32    float32 [capacity, dim] memory map, grown by doubling
+      lists.i32      int32 [capacity] cluster of each row, once trained
+      centroids.npy  cluster centroids, once trained
+      snippets.jsonl one JSON line per snippet (text + metadata)
+
+    A snippet's vector is written before its JSON line, and the number of
+    complete lines is the number of snippets, so a crash mid-append loses at
+    most that snippet.
+
+    Search is exact (one matrix-vector product over all rows) until
+    `train_size` snippets exist. The rows are then clustered once
+    (spherical k-means, `n_lists` clusters). From then on a query only
+    scores the rows of its `n_probe` nearest clusters, which keeps queries
+    well under 10 ms at hundreds of thousands of snippets. Appends are
+    incremental: a new row goes to its nearest cluster.
+    """
+
+    def __init__(self, directory, dim=256, n_lists=256, n_probe=8, train_size=4096):
+        self.directory = directory
+        self.dim = dim
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.train_size = train_size
+        self.count = 0
+        self.centroids = None
+        self._capacity = 0
+        self._vectors = None
+        self._lists = None
+        # Row ids of each cluster, appendable without copying
+        self._members = None
+        self._offsets = array("q")
+        self._lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _load(self):
+        snippets_path = self._path("snippets.jsonl")
+        if os.path.exists(snippets_path):
+            with open(snippets_path, "rb") as f:
+                offset = 0
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        # Torn last line from an interrupted append
+                        break
+                    self._offsets.append(offset)
+                    offset += len(line)
+            self._truncate_snippets(offset)
+        self.count = len(self._offsets)
+        self._map(max(1024, self.count))
+        if os.path.exists(self._path("centroids.npy")):
+            self.centroids = np.load(self._path("centroids.npy"))
+            self._build_members()
+
+    def _truncate_snippets(self, size):
+        path = self._path("snippets.jsonl")
+        if os.path.getsize(path) != size:
+            with open(path, "r+b") as f:
+                f.truncate(size)
+
+    def _map(self, capacity):
+        """(Re)open the memory maps with room for at least `capacity` rows."""
+        capacity = max(capacity, self._capacity)
+        for name, dtype, width in (("vectors.f32", np.float32, self.dim), ("lists.i32", np.int32, 1)):
+            path = self._path(name)
+            itemsize = np.dtype(dtype).itemsize * width
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            if size < capacity * itemsize:
+                with open(path, "ab") as f:
+                    f.truncate(capacity * itemsize)
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._lists.flush()
+        self._vectors = np.memmap(self._path("vectors.f32"), dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        self._lists = np.memmap(self._path("lists.i32"), dtype=np.int32, mode="r+", shape=(capacity,))
+        self._capacity = capacity
+
+    def _build_members(self):
+        assignments = np.asarray(self._lists[:self.count])
+        self._members = [array("i") for _ in range(len(self.centroids))]
+        for cluster, members in enumerate(self._members):
+            members.extend(np.flatnonzero(assignments == cluster).astype(np.int32).tolist())
+
+    def add(self, vectors, records):
+        """Append normalized `vectors` ([n, dim]) with their JSON-serializable records."""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        with self._lock:
+            start = self.count
+            end = start + len(vectors)
+            if end > self._capacity:
+                self._map(max(end, self._capacity * 2))
+            self._vectors[start:end] = vectors
+            if self.centroids is not None:
+                assignments = np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)
+                self._lists[start:end] = assignments
+            self._vectors.flush()
+            self._lists.flush()
+
+            with open(self._path("snippets.jsonl"), "ab") as f:
+                offset = f.tell()
+                for record in records:
+                    line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+                    f.write(line)
+                    self._offsets.append(offset)
+                    offset += len(line)
+            self.count = end
+            if self.centroids is not None:
+                for row, cluster in enumerate(assignments.tolist(), start=start):
+                    self._members[cluster].append(row)
+            elif self.count >= self.train_size:
+                self.train()
+            return list(range(start, end))
+
+    def train(self, iterations=8, seed=0):
+        """Cluster the stored vectors (spherical k-means) and assign every row."""
+        with self._lock:
+            data = np.asarray(self._vectors[:self.count])
+            n_lists = min(self.n_lists, max(1, self.count // 16))
+            rng = np.random.default_rng(seed)
+            sample = data[rng.choice(self.count, size=min(self.count, n_lists * 64), replace=False)]
+            centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+            for _ in range(iterations):
+                assignments = np.argmax(sample @ centroids.T, axis=1)
+                for cluster in range(n_lists):
+                    members = sample[assignments == cluster]
+                    if len(members):
+                        centroid = members.sum(axis=0)
+                        norm = np.linalg.norm(centroid)
+                        if norm:
+                            centroids[cluster] = centroid / norm
+            for start in range(0, self.count, 65536):
+                block = data[start:start + 65536]
+                self._lists[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+            self._lists.flush()
+            self.centroids = centroids.astype(np.float32)
+            np.save(self._path("centroids.npy"), self.centroids)
+            self._build_members()
+
+    def search(self, queries, k=5):
+        """Top-k (row, score) pairs per query, for queries of shape [q, dim] (or [dim])."""
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        with self._lock:
+            if not self.count:
+                return [[] for _ in queries]
+            if self.centroids is None:
+                # Exact: every query against every row in one product
+                scores = queries @ np.asarray(self._vectors[:self.count]).T
+                return [self._pairs(np.arange(self.count), row_scores, k) for row_scores in scores]
+            results = []
+            probes = np.argsort(-(queries @ self.centroids.T), axis=1)[:, :self.n_probe]
+            for query, clusters in zip(queries, probes):
+                rows = np.concatenate([np.frombuffer(self._members[c], dtype=np.int32) for c in clusters])
+                if not len(rows):
+                    results.append([])
+                    continue
+                results.append(self._pairs(rows, self._vectors[rows] @ query, k))
+            return results
+
+    @staticmethod
+    def _pairs(rows, scores, k):
+        top = _top_k(scores, k)
+        return [(int(rows[i]), float(scores[i])) for i in top]
+
+    def get(self, row):
+        with self._lock:
+            offset = self._offsets[row]
+        with open(self._path("snippets.jsonl"), "rb") as f:
+            f.seek(offset)
+            return json.loads(f.readline())
+
+
+class ConversationMemory:
+    """Long-term memory of past turns, shared by every conversation.
+
+    Completed turns are embedded and appended to a MemoryIndex; before a new
+    turn the most similar snippets from other conversations are retrieved so
+    they can be put in front of the user's message.
+    """
+
+    def __init__(self, directory, embedder=None, snippet_chars=1000):
+        self.embedder = embedder or HashedNgramEmbedder()
+        self.index = MemoryIndex(directory, dim=self.embedder.dim)
+        self.snippet_chars = snippet_chars
+
+    def remember(self, session_id, user_input, response):
+        text = f"User: {user_input}\nAssistant: {response}"[:self.snippet_chars]
+        record = {"session": session_id, "text": text, "time": time.time()}
+        self.index.add(self.embedder.embed_batch([text]), [record])
+
+    def recall(self, query, k=3, min_score=0.25, exclude_session=None):
+        """Texts of the k most similar snippets, skipping `exclude_session`'s own turns."""
+        # Over-fetch a little since the current session's snippets are skipped
+        hits = self.index.search(self.embedder.embed(query), k=k * 4)[0]
+        texts = []
+        for row, score in hits:
+            if score < min_score:
+                break
+            record = self.index.get(row)
+            if record.get("session") == exclude_session:
+                continue
+            texts.append(record["text"])
+            if len(texts) == k:
+                break
+        return texts
+
+
+def format_recalled(snippets):
+    """Recalled snippets as context for one request, or None when there are none."""
+    if not snippets:
+        return None
+    notes = "\n".join(f"- {snippet}" for snippet in snippets)
+    return f"[Relevant notes from earlier conversations]\n{notes}"
+
+
+_memory = None
+_memory_lock = threading.Lock()
+
+
+def get_memory():
+    """The shared ConversationMemory, or None when memory is disabled."""
+    global _memory
+    if not settings.get_memory_enabled():
+        return None
+    with _memory_lock:
+        if _memory is None:
+            _memory = ConversationMemory(settings.get_memory_dir())
+        return _memory
@@ -0,0 +1,282 @@
+import json
+import sys
+
+
+def compact_json(value):
+    """JSON as it goes into a request body (no spaces, non-ASCII kept as is)."""
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+class ToolCall:
+    """A tool call requested by the model; arguments stay a raw JSON string."""
+
+    __slots__ = ("id", "name", "arguments")
+
+    def __init__(self, id, name, arguments):
+        self.id = id
+        self.name = sys.intern(name or "")
+        self.arguments = arguments or ""
+
+    def to_wire(self):
+        return {"id": self.id, "type": "function", "function": {"name": self.name, "arguments": self.arguments}}
+
+
+class Message:
+    """Compact, immutable chat message.
+
+    Roles and tool names are interned, tool call arguments are kept as the
+    raw JSON the model produced, and the wire-format dict and its JSON
+    encoding are built once and cached, so a request only encodes the
+    messages that are new since the previous one. Messages must not be
+    modified after creation.
+    """
+
+    __slots__ = ("role", "content", "name", "tool_call_id", "tool_calls", "_wire", "_json")
+
+    def __init__(self, role, content=None, name=None, tool_call_id=None, tool_calls=None):
+        self.role = sys.intern(role)
+        self.content = content
+        self.name = sys.intern(name) if name else None
+        self.tool_call_id = tool_call_id
+        self.tool_calls = tuple(tool_calls) if tool_calls else None
+        self._wire = None
+        self._json = None
+
+    @classmethod
+    def from_sdk(cls, message):
+        """Convert an SDK ChatCompletionMessage, dropping the pydantic model."""
+        tool_calls = None
+        if message.tool_calls:
+            tool_calls = [
+                ToolCall(tool_call.id, tool_call.function.name, tool_call.function.arguments)
+                for tool_call in message.tool_calls
+            ]
+        return cls(message.role, message.content, tool_calls=tool_calls)
+
+    @classmethod
+    def from_dict(cls, data):
+        tool_calls = None
+        if data.get("tool_calls"):
+            tool_calls = [
+                ToolCall(tool_call["id"], tool_call["function"]["name"], tool_call["function"]["arguments"])
+                for tool_call in data["tool_calls"]
+            ]
+        return cls(
+            data["role"],
+            data.get("content"),
+            name=data.get("name"),
+            tool_call_id=data.get("tool_call_id"),
+            tool_calls=tool_calls,
+        )
+
+    @classmethod
+    def coerce(cls, message):
+        if isinstance(message, Message):
+            return message
+        if isinstance(message, dict):
+            return cls.from_dict(message)
+        return cls.from_sdk(message)
+
+    def to_wire(self):
+        """The dict sent to the API, built on first use and cached."""
+        if self._wire is None:
+            wire = {"role": self.role}
+            if self.tool_call_id is not None:
+                wire["tool_call_id"] = self.tool_call_id
+            if self.name is not None:
+                wire["name"] = self.name
+            wire["content"] = self.content
+            if self.tool_calls:
+                wire["tool_calls"] = [tool_call.to_wire() for tool_call in self.tool_calls]
+            self._wire = wire
+        return self._wire
+
+    def to_json(self):
+        """The message's JSON encoding in a request body, encoded on first use and cached."""
+        if self._json is None:
+            self._json = compact_json(self.to_wire())
+        return self._json
+
+    def wire_size(self):
+        return len(self.to_json())
+
+    # Read-only dict-style access, for code that inspects history entries
+    def __getitem__(self, key):
+        return self.to_wire()[key]
+
+    def get(self, key, default=None):
+        return self.to_wire().get(key, default)
+
+    def __eq__(self, other):
+        if isinstance(other, (Message, dict)):
+            return self.to_wire() == (other.to_wire() if isinstance(other, Message) else other)
+        return NotImplemented
+
+    def __repr__(self):
+        return f"Message({self.to_wire()!r})"
+
+
+class _Node:
+    """One message of a history tree; following `parent` gives the history up to it.
+
+    Nodes are never modified, so any number of branches can share them.
+    """
+
+    __slots__ = ("message", "parent")
+
+    def __init__(self, message, parent):
+        self.message = message
+        self.parent = parent
+
+
+class MessageHistory:
+    """Conversation history of Message objects with an incrementally built wire list.
+
+    Appending accepts Message objects, plain dicts or SDK messages. The wire
+    list and total JSON size are extended as messages are added, and each
+    message's JSON is encoded once (Message.to_json), so building a request
+    does not re-serialize the existing history.
+
+    Messages are stored as a chain of shared, immutable nodes. `copy()`
+    starts a branch in O(1) and `fork(length)` only walks back over the
+    messages it leaves out: the branch shares every message of its prefix,
+    including their cached wire dicts, and only stores what is appended to
+    it. Truncating works the same way instead of rebuilding. A branch builds
+    its list views (for requests and indexing) on first use.
+    """
+
+    def __init__(self, messages=()):
+        self._tip = None
+        self._length = 0
+        self._size = 0
+        self._messages = []
+        self._wire = []
+        self.extend(messages)
+
+    def append(self, message):
+        message = Message.coerce(message)
+        self._tip = _Node(message, self._tip)
+        self._length += 1
+        self._size += message.wire_size()
+        if self._messages is not None:
+            self._messages.append(message)
+            self._wire.append(message.to_wire())
+
+    def extend(self, messages):
+        for message in messages:
+            self.append(message)
+
+    def __iadd__(self, messages):
+        self.extend(messages)
+        return self
+
+    def wire(self):
+        """Wire-format dicts for a request (a new list of the cached dicts)."""
+        self._materialize()
+        return list(self._wire)
+
+    def wire_json(self):
+        """The messages' cached JSON encodings, to join into a request body."""
+        self._materialize()
+        return [message.to_json() for message in self._messages]
+
+    def char_count(self):
+        return self._size
+
+    def fork(self, length=None):
+        """A branch sharing this history's first `length` messages (all by default)."""
+        branch = MessageHistory()
+        branch._tip, branch._length, branch._size = self._tip, self._length, self._size
+        # The branch's list views are built from the shared nodes when first needed
+        branch._messages = branch._wire = None
+        if length is not None and length < self._length:
+            del branch[max(0, length):]
+        return branch
+
+    def copy(self):
+        return self.fork()
+
+    def shared_prefix_length(self, other):
+        """Number of leading messages this history shares (structurally) with `other`."""
+        a, a_length = self._tip, self._length
+        b, b_length = other._tip, other._length
+        while a is not b:
+            if a_length >= b_length:
+                a, a_length = a.parent, a_length - 1
+            else:
+                b, b_length = b.parent, b_length - 1
+        return a_length
+
+    def _materialize(self):
+        if self._messages is None:
+            messages = []
+            node = self._tip
+            while node is not None:
+                messages.append(node.message)
+                node = node.parent
+            messages.reverse()
+            self._messages = messages
+            self._wire = [message.to_wire() for message in messages]
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        self._materialize()
+        return iter(self._messages)
+
+    def __getitem__(self, index):
+        self._materialize()
+        return self._messages[index]
+
+    def __setitem__(self, index, messages):
+        if not isinstance(index, slice):
+            raise TypeError("MessageHistory only supports slice assignment")
+        if index == slice(None) and isinstance(messages, MessageHistory):
+            # Adopt the other history's chain as is
+            other = messages.fork()
+            self._tip, self._length, self._size = other._tip, other._length, other._size
+            self._messages, self._wire = other._messages, other._wire
+            return
+        self._materialize()
+        updated = list(self._messages)
+        updated[index] = [Message.coerce(message) for message in messages]
+        self._rebuild(updated)
+
+    def __delitem__(self, index):
+        if isinstance(index, slice) and index.stop is None and index.step is None:
+            # Truncation (rolling back a turn): keep the shared prefix nodes
+            start = index.indices(self._length)[0]
+            self._truncate(start)
+            if self._messages is not None:
+                del self._messages[start:]
+                del self._wire[start:]
+            return
+        self._materialize()
+        updated = list(self._messages)
+        del updated[index]
+        self._rebuild(updated)
+
+    def _truncate(self, length):
+        while self._length > length:
+            self._size -= self._tip.message.wire_size()
+            self._tip = self._tip.parent
+            self._length -= 1
+
+    def _rebuild(self, messages):
+        # Keep the nodes of the unchanged leading messages
+        keep = 0
+        for old, new in zip(self._messages, messages):
+            if old is not new:
+                break
+            keep += 1
+        self._truncate(keep)
+        self._messages = messages[:keep]
+        self._wire = self._wire[:keep]
+        self.extend(messages[keep:])
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return f"MessageHistory({list(self)!r})"
@@ -0,0 +1,129 @@
+import math
+import threading
+from collections import deque
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of `values` (pct in 0-100). Returns None when there is no data."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class LatencyStats:
+    """Thread-safe collector for latency samples, in seconds.
+
+    With `window` set only the most recent samples are kept, which is what
+    the adaptive thresholds want; the batch runner keeps everything.
+    """
+
+    def __init__(self, window=None):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def count(self):
+        with self._lock:
+            return len(self._samples)
+
+    def percentile(self, pct):
+        with self._lock:
+            samples = list(self._samples)
+        return percentile(samples, pct)
+
+    def summary(self):
+        with self._lock:
+            samples = list(self._samples)
+        if not samples:
+            return {"count": 0}
+        return {
+            "count": len(samples),
+            "mean": sum(samples) / len(samples),
+            "p50": percentile(samples, 50),
+            "p90": percentile(samples, 90),
+            "p95": percentile(samples, 95),
+            "p99": percentile(samples, 99),
+            "max": max(samples),
+        }
+
+
+class LatencyRegistry:
+    """Named LatencyStats windows, created on first use."""
+
+    def __init__(self, window=200):
+        self.window = window
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = LatencyStats(window=self.window)
+                self._stats[name] = stats
+            return stats
+
+    def summary(self):
+        with self._lock:
+            stats = dict(self._stats)
+        return {name: s.summary() for name, s in stats.items()}
+
+# Time-to-first-token per "provider:model", measured on every streamed request
+time_to_first_token = LatencyRegistry()
+
+
+class PrefixCacheStats:
+    """Prompt tokens vs. tokens served from the provider's prompt cache."""
+
+    def __init__(self):
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.cache_hits = 0
+        self._lock = threading.Lock()
+
+    def add(self, prompt_tokens, cached_tokens):
+        with self._lock:
+            self.requests += 1
+            self.prompt_tokens += prompt_tokens or 0
+            self.cached_tokens += cached_tokens or 0
+            if cached_tokens:
+                self.cache_hits += 1
+
+    def summary(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "prompt_tokens": self.prompt_tokens,
+                "cached_tokens": self.cached_tokens,
+                # Share of requests that hit the cache at all, and of prompt tokens it served
+                "request_hit_rate": self.cache_hits / self.requests if self.requests else 0.0,
+                "token_hit_rate": self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0,
+            }
+
+
+class PrefixCacheRegistry:
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = PrefixCacheStats()
+                self._stats[name] = stats
+            return stats
+
+    def summary(self):
+        with self._lock:
+            stats = dict(self._stats)
+        return {name: s.summary() for name, s in stats.items()}
+
+# Prompt cache usage per "provider:model", from the `usage` of each response
+prefix_cache = PrefixCacheRegistry()
@@ -1,20 +1,195 @@
+import os
 import subprocess
 import shlex
 import atexit
+import threading
+import time
+from collections import deque
 from config.settings import settings
 
+
+class LogBuffer:
+    """The last `max_bytes` of a process's output, as lines.
+
+    Old lines are dropped as new ones arrive, so memory stays bounded however
+    chatty the process is. A line longer than the whole buffer keeps its end.
+    """
+
+    def __init__(self, max_bytes=64 * 1024):
+        self.max_bytes = max_bytes
+        self._lines = deque()
+        self._size = 0
+        self._partial = b""
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def write(self, data):
+        with self._lock:
+            data = self._partial + data
+            *lines, self._partial = data.split(b"\n")
+            if len(self._partial) > self.max_bytes:
+                # No newline in sight; keep it as a line of its own
+                lines.append(self._partial)
+                self._partial = b""
+            for line in lines:
+                self._append(line[-self.max_bytes:])
+
+    def _append(self, line):
+        self._lines.append(line)
+        self._size += len(line)
+        while self._size > self.max_bytes:
+            self._size -= len(self._lines.popleft())
+            self.dropped += 1
+
+    def lines(self):
+        with self._lock:
+            lines = list(self._lines)
+            if self._partial:
+                lines.append(self._partial)
+        return [line.decode("utf-8", errors="replace") for line in lines]
+
+    def text(self):
+        return "\n".join(self.lines())
+
+
+def _read_proc_usage(pid):
+    """(cpu seconds, rss bytes) of a process from /proc, or None where /proc is unavailable."""
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            stat = f.read()
+        with open(f"/proc/{pid}/statm", "rb") as f:
+            statm = f.read().split()
+    except OSError:
+        return None
+    # Fields after the command name, which may itself contain spaces or ')'
+    fields = stat[stat.rindex(b")") + 2:].split()
+    ticks = int(fields[11]) + int(fields[12])  # utime + stime
+    return ticks / _CLOCK_TICKS, int(statm[1]) * _PAGE_SIZE
+
+
+try:
+    _CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+    _PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    # No /proc accounting on this platform
+    _CLOCK_TICKS = _PAGE_SIZE = 1
+
+
+class ManagedProcess:
+    """A supervised child process: its output, resource usage and restarts."""
+
+    def __init__(self, name, cmd_list, log_bytes=64 * 1024, restart=True):
+        self.name = name
+        self.cmd_list = cmd_list
+        self.restart = restart
+        self.log = LogBuffer(log_bytes)
+        self.proc = None
+        self.started_at = None
+        self.restarts = 0
+        # Of the previous run, once one has ended
+        self.exit_code = None
+        self.backoff = 0.0
+        self.next_restart = None
+        self.stopped = False
+        # Latest /proc sample
+        self.cpu_percent = 0.0
+        self.rss = 0
+        self.peak_rss = 0
+        self._last_sample = None
+
+    @property
+    def pid(self):
+        return self.proc.pid if self.proc else None
+
+    @property
+    def status(self):
+        if self.stopped:
+            return "stopped"
+        if self.proc is not None and self.proc.poll() is None:
+            return "running"
+        if self.next_restart is not None:
+            return "restarting"
+        return "exited"
+
+    def spawn(self):
+        # stderr goes to the same pipe; a thread keeps draining it so a
+        # chatty child can never block on a full pipe
+        self.proc = subprocess.Popen(self.cmd_list, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL)
+        self.started_at = time.monotonic()
+        self.next_restart = None
+        self._last_sample = None
+        threading.Thread(target=self._drain, args=(self.proc,), name=f"log-{self.name}", daemon=True).start()
+        return self.proc
+
+    def _drain(self, proc):
+        stream = proc.stdout
+        while True:
+            data = stream.read1(65536) if hasattr(stream, "read1") else stream.read(65536)
+            if not data:
+                break
+            self.log.write(data)
+        stream.close()
+
+    def sample(self):
+        """Update CPU % (since the previous sample) and RSS from /proc."""
+        if self.proc is None or self.proc.poll() is not None:
+            self.cpu_percent = 0.0
+            self.rss = 0
+            return
+        usage = _read_proc_usage(self.proc.pid)
+        if usage is None:
+            return
+        cpu_seconds, self.rss = usage
+        self.peak_rss = max(self.peak_rss, self.rss)
+        now = time.monotonic()
+        if self._last_sample is not None:
+            last_time, last_cpu = self._last_sample
+            if now > last_time:
+                self.cpu_percent = 100.0 * (cpu_seconds - last_cpu) / (now - last_time)
+        self._last_sample = (now, cpu_seconds)
+
+    def info(self):
+        return {
+            "name": self.name,
+            "pid": self.pid,
+            "status": self.status,
+            "cpu_percent": self.cpu_percent,
+            "rss": self.rss,
+            "peak_rss": self.peak_rss,
+            "restarts": self.restarts,
+            "exit_code": self.exit_code,
+        }
+
+
 class ProcessManager:
-    def __init__(self):
+    """Starts the MCP server (and transformers) processes and keeps them alive.
+
+    A supervisor thread checks the children every `interval` seconds. A child
+    that exits on its own is started again after a backoff that doubles from
+    1 s up to `process_max_backoff` and resets once the child has stayed up
+    for a minute. Each check also samples CPU and RSS per child from /proc
+    (Linux only). Output (stdout and stderr) is kept in a LogBuffer of
+    `process_log_bytes` per child.
+    """
+
+    def __init__(self, interval=1.0):
         self.processes = []
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._supervisor = None
+        self._wakeup = threading.Event()
         atexit.register(self.shutdown)
 
-    def start_process(self, command, args, name="Process"):
+    def start_process(self, command, args, name="Process", restart=True):
         try:
             cmd_list = [command] + args
             print(f"Starting {name}: {' '.join(cmd_list)}")
-            proc = subprocess.Popen(cmd_list, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-            self.processes.append(proc)
-            return proc
+            managed = ManagedProcess(name, cmd_list, log_bytes=settings.get_process_log_bytes(), restart=restart)
+            managed.spawn()
+            with self._lock:
+                self.processes.append(managed)
+            self._ensure_supervisor()
+            return managed
         except Exception as e:
             print(f"Failed to start {name}: {e}")
             return None
@@ -37,23 +212,111 @@ class ProcessManager:
         # Canonical command: transformers serve --port <port>
         return self.start_process("transformers", ["serve", "--port", str(port)], name="Transformers Server")
 
-    def shutdown(self):
-        print("Shutting down all managed processes...")
-        for proc in self.processes:
-            if proc.poll() is None:
+    def get(self, name):
+        with self._lock:
+            for managed in self.processes:
+                if managed.name == name:
+                    return managed
+        return None
+
+    def stats(self):
+        """One info dict per managed process (see ManagedProcess.info)."""
+        with self._lock:
+            return [managed.info() for managed in self.processes]
+
+    def restart_process(self, name):
+        """Restart a process now (and reset its backoff)."""
+        managed = self.get(name)
+        if managed is None:
+            return False
+        with self._lock:
+            # Keeps the supervisor off it while it is being terminated
+            managed.stopped = True
+        # Terminating can take seconds: not under the lock, which stats() and
+        # the supervisor need meanwhile
+        self._terminate([managed])
+        with self._lock:
+            if managed not in self.processes:
+                # Shut down meanwhile
+                return False
+            managed.stopped = False
+            managed.backoff = 0.0
+            managed.next_restart = time.monotonic()
+        self._wakeup.set()
+        return True
+
+    def _ensure_supervisor(self):
+        if self._supervisor is None or not self._supervisor.is_alive():
+            self._supervisor = threading.Thread(target=self._supervise, name="process-supervisor", daemon=True)
+            self._supervisor.start()
+
+    def _supervise(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            with self._lock:
+                if not self.processes:
+                    self._supervisor = None
+                    return
+                for managed in self.processes:
+                    self._check(managed, time.monotonic())
+
+    def _check(self, managed, now):
+        if managed.stopped:
+            return
+        if managed.proc is not None and managed.proc.poll() is None:
+            managed.sample()
+            return
+        if managed.next_restart is None:
+            # Exited on its own since the last check
+            managed.exit_code = managed.proc.returncode if managed.proc else None
+            managed.sample()
+            if not managed.restart:
+                managed.stopped = True
+                return
+            if managed.started_at is not None and now - managed.started_at > 60:
+                managed.backoff = 0.0
+            managed.backoff = min(max(1.0, managed.backoff * 2), settings.get_process_max_backoff())
+            managed.next_restart = now + managed.backoff
+            print(f"{managed.name} exited with code {managed.exit_code}; restarting in {managed.backoff:.0f}s")
+        elif now >= managed.next_restart:
+            try:
+                managed.spawn()
+                managed.restarts += 1
+                print(f"Restarted {managed.name} (pid {managed.pid})")
+            except Exception as e:
+                print(f"Failed to restart {managed.name}: {e}")
+                managed.next_restart = None
+                managed.proc = None
+                managed.started_at = None
+
+    @staticmethod
+    def _terminate(processes):
+        for managed in processes:
+            proc = managed.proc
+            if proc is not None and proc.poll() is None:
                 print(f"Terminating process {proc.pid}...")
                 proc.terminate()
 
-        for proc in self.processes:
+        for managed in processes:
+            proc = managed.proc
             try:
-                if proc.poll() is None:
+                if proc is not None and proc.poll() is None:
                     proc.wait(timeout=5)
             except subprocess.TimeoutExpired:
                 print(f"Process {proc.pid} did not terminate gracefully, killing.")
                 proc.kill()
+                proc.wait()
 
-        self.processes = []
+    def shutdown(self):
+        print("Shutting down all managed processes...")
+        with self._lock:
+            processes, self.processes = self.processes, []
+            for managed in processes:
+                managed.stopped = True
+        self._terminate(processes)
+        self._wakeup.set()
         print("Shutdown complete.")
 
 # Global instance
-process_manager = ProcessManager()
\ No newline at end of file
+process_manager = ProcessManager()
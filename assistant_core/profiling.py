@@ -0,0 +1,161 @@
+import cProfile
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+from config.settings import settings
+
+# Set to anything but "" or "0" to profile turns without touching config.json
+PROFILE_ENV = "ASSISTANT_PROFILE"
+
+
+def current_rss():
+    """Resident set size of this process in bytes, or None where it cannot be read."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class TurnProfiler:
+    """Profiles turns one by one: cProfile for time, tracemalloc for memory.
+
+    Each profiled turn writes two files to `directory`, named after the time
+    the turn started:
+      turn-<timestamp>-<label>.pstats  cProfile stats of the turn (open with
+                                       `python -m pstats` or snakeviz)
+      turn-<timestamp>-<label>.json    wall and CPU time, peak and net traced
+                                       memory, RSS and the top allocation sites
+
+    Only one cProfile session can run at a time (on Python 3.12+ a second
+    one cannot even be enabled), so a turn starting while another is being
+    profiled gets its JSON summary but no .pstats file ("pstats" is null).
+    Before 3.12 the stats cover the thread running the turn; from 3.12 on,
+    every thread while it runs.
+
+    tracemalloc runs while at least one profiled turn is running (or for
+    longer, if something else started it). It is process-wide, so the memory
+    of turns that overlap is counted together; `overlapping` in the summary
+    says when that happened.
+    """
+
+    def __init__(self, directory, top=15):
+        self.directory = directory
+        self.top = top
+        self.last_summary = None
+        self._active = 0
+        self._overlapped = False
+        self._started_tracing = False
+        # A turn's cProfile session is running
+        self._profiling = False
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def profile(self, label="turn"):
+        stamp = datetime.now()
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            if self._active:
+                self._overlapped = True
+            else:
+                self._overlapped = False
+                tracemalloc.reset_peak()
+            self._active += 1
+            profile = None
+            if not self._profiling:
+                self._profiling = True
+                profile = cProfile.Profile()
+        traced_before = tracemalloc.get_traced_memory()[0]
+        rss_before = current_rss()
+        if profile is not None:
+            try:
+                profile.enable()
+            except ValueError:
+                # Another profiler is active (e.g. the app runs under cProfile)
+                profile = None
+                with self._lock:
+                    self._profiling = False
+        started = time.perf_counter()
+        cpu_started = time.thread_time()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+                with self._lock:
+                    self._profiling = False
+            elapsed = time.perf_counter() - started
+            cpu = time.thread_time() - cpu_started
+            traced, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            ))
+            with self._lock:
+                self._active -= 1
+                overlapping = self._overlapped
+                if not self._active and self._started_tracing:
+                    tracemalloc.stop()
+                    self._started_tracing = False
+            summary = {
+                "label": label,
+                "started": stamp.isoformat(timespec="milliseconds"),
+                "elapsed": elapsed,
+                "cpu_time": cpu,
+                "peak_traced_bytes": peak,
+                "net_traced_bytes": traced - traced_before,
+                "traced_bytes": traced,
+                "rss_bytes": current_rss(),
+                "rss_before_bytes": rss_before,
+                "overlapping": overlapping,
+                "top_allocations": [
+                    {"where": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}", "bytes": stat.size, "count": stat.count}
+                    for stat in snapshot.statistics("lineno")[:self.top]
+                ],
+            }
+            self._write(stamp, label, profile, summary)
+
+    def _write(self, stamp, label, profile, summary):
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, f"turn-{stamp:%Y%m%d-%H%M%S-%f}-{label}")
+        summary["pstats"] = None
+        if profile is not None:
+            profile.dump_stats(base + ".pstats")
+            summary["pstats"] = base + ".pstats"
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        self.last_summary = summary
+        print(f"Profiled turn {label}: {summary['elapsed']:.3f}s wall, {summary['cpu_time']:.3f}s CPU, "
+              f"peak traced {summary['peak_traced_bytes'] / 2**20:.1f} MiB -> {summary['pstats'] or base + '.json'}")
+
+
+def profiling_enabled():
+    return bool(settings.get_profile_turns()) or os.environ.get(PROFILE_ENV, "") not in ("", "0")
+
+
+_profiler = None
+_profiler_lock = threading.Lock()
+
+
+def get_turn_profiler():
+    """The shared TurnProfiler, or None when turn profiling is off."""
+    global _profiler
+    if not profiling_enabled():
+        return None
+    with _profiler_lock:
+        if _profiler is None:
+            _profiler = TurnProfiler(settings.get_profile_dir())
+        return _profiler
+
+
+def turn_profile(label):
+    """Context manager profiling one turn when profiling is on (a no-op otherwise)."""
+    profiler = get_turn_profiler()
+    return profiler.profile(label) if profiler is not None else nullcontext()
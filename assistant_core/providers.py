@@ -1,13 +1,42 @@
 import openai
+from openai import Stream
+from openai._constants import RAW_RESPONSE_HEADER
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
 import os
 import json
 import time
+import queue
+import threading
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_client(base_url: str, api_key: str):
+    """Return a shared OpenAI client for base_url/api_key.
+
+    Clients own an HTTP connection pool and are thread-safe, so every session
+    talking to the same endpoint reuses one instead of opening its own.
+    """
+    key = (base_url, api_key)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            # Retries are handled by the rate-limit scheduler instead
+            client = openai.OpenAI(base_url=base_url, api_key=api_key, max_retries=0)
+            _clients[key] = client
+        return client
 
 class BaseProvider:
+    # Context for the current turn only (recalled notes): sent as a system
+    # message ahead of the turn's user message, never kept in `messages`
+    turn_context = None
+    # Index in `messages` of the current turn's user message
+    _turn_start = None
+
     def handle_chat(self, user_input: str, tools: list, tool_invoker: callable) -> str:
         raise NotImplementedError()
 
-    def handle_chat_stream(self, user_input: str, tools: list, tool_invoker: callable, stream_callback: callable):
+    def handle_chat_stream(self, user_input: str, tools: list, tool_invoker: callable, stream_callback: callable, cancel_token=None):
         """Streaming version of handle_chat. Override in subclasses for streaming support."""
         # Default implementation: call non-streaming version and stream the result
         response = self.handle_chat(user_input, tools, tool_invoker)
@@ -16,109 +45,322 @@ class BaseProvider:
             import time
             time.sleep(0.01)  # Small delay to simulate streaming
 
+    def complete(self, prompt: str) -> str:
+        raise NotImplementedError()
+
+    def _ensure_client(self):
+        pass
+
+    def _ensure_ready(self):
+        """Set up what the provider needs before a request (see _ensure_client)."""
+        self._ensure_client()
+
+    def _with_turn_context(self, wire, encoded=False):
+        """The wire messages of a request, with the turn context in place if there is one.
+
+        With `encoded`, `wire` holds the messages' JSON encodings and so does the result.
+        """
+        if not self.turn_context:
+            return wire
+        start = len(wire) if self._turn_start is None else self._turn_start
+        context = {"role": "system", "content": self.turn_context}
+        if encoded:
+            context = compact_json(context)
+        return wire[:start] + [context] + wire[start:]
+
     @classmethod
     def get_models(cls):
         raise NotImplementedError()
 
 from config.settings import settings
+from .scheduler import scheduler, estimate_tokens
+from .cancellation import CancelToken, GenerationCancelled
+from .metrics import time_to_first_token, prefix_cache
+from .messages import Message, MessageHistory, ToolCall, compact_json
+from .local_inference import get_engine
+from .cassette import get_cassette, replaying
+
+def _invoke_with_arguments(tool_invoker, tool_name, arguments):
+    """Run a tool call; malformed argument JSON becomes an error result the model can see."""
+    try:
+        kwargs = json.loads(arguments or "{}")
+    except json.JSONDecodeError as e:
+        return f"Error: the arguments for '{tool_name}' are not valid JSON ({e}); the tool was not called."
+    return tool_invoker(tool_name, kwargs)
+
+def _tool_options(tools, tool_choice):
+    """The tools arguments of a request; none when no tool is sent (APIs refuse an empty list).
+
+    Follow-up requests after tool calls send the same list with tool_choice
+    "none": tools come before the messages, so dropping them would change the
+    prefix and miss the prompt cache.
+    """
+    if not tools:
+        return {}
+    return {"tools": tools, "tool_choice": tool_choice}
+
+
+class ChatCompletionsProvider(BaseProvider):
+    """Chat Completions flow shared by the OpenAI-compatible providers.
+
+    Subclasses set `display_name` (used in error messages) and
+    `rate_limit_key`, and create `self.client` in `_ensure_client()`.
+    """
+    display_name = "OpenAI"
+    rate_limit_key = "openai"
+    supports_stream_usage = False
 
-class OpenAIProvider(BaseProvider):
-    def __init__(self, api_key=None, model="gpt-5"):
-        # Prioritize settings, then environment variable, then direct parameter
-        self.api_key = settings.get_api_key("openai") or os.getenv("OPENAI_API_KEY") or api_key
+    def _ensure_client(self):
+        pass
 
-        # The client will be initialized on-demand to avoid errors if key is not set at startup
-        self.client = None
-        self.model = model
-        self.messages = []
+    def _ensure_ready(self):
+        # Replayed traffic needs no client (or API key)
+        if not replaying():
+            self._ensure_client()
+
+    def _create_completion(self, **kwargs):
+        """Send a chat.completions.create request through the rate-limit scheduler."""
+        response, estimated = self._send_request(**kwargs)
+        if not kwargs.get("stream"):
+            self._record_usage(getattr(response, "usage", None), estimated)
+        return response
+
+    def _send_request(self, cancel_token=None, **kwargs):
+        kwargs["model"] = self.model
+        if kwargs.get("stream") and self.supports_stream_usage:
+            # Ask for a final usage chunk so prompt cache hits are visible when streaming
+            kwargs["stream_options"] = {"include_usage": True}
+        estimated = estimate_tokens(kwargs)
+        history = isinstance(kwargs.get("messages"), MessageHistory)
+        if history and self.turn_context:
+            estimated += len(self.turn_context) // 4
+        send = lambda: self._post_chat(self._chat_body(kwargs), kwargs.get("stream", False))
+        cassette = get_cassette()
+        if cassette is not None:
+            # Recorded and looked up by the request's content, messages as dicts
+            messages = self._with_turn_context(kwargs["messages"].wire()) if history else kwargs["messages"]
+            request = dict(kwargs, messages=messages)
+            if cassette.replaying:
+                # Served from the recording: nothing to pace or retry
+                return cassette.wrap_chat(request, send)().parse(), estimated
+            send = cassette.wrap_chat(request, send)
+        raw_response = scheduler.call(self.rate_limit_key, send, estimated, cancel_token=cancel_token)
+        return raw_response.parse(), estimated
+
+    def _chat_body(self, kwargs):
+        """The encoded JSON body of a chat.completions request.
+
+        The history's messages are joined from their cached JSON encodings
+        (Message.to_json), so only messages added since the previous request,
+        the tools and the options are encoded.
+        """
+        messages = kwargs["messages"]
+        if isinstance(messages, MessageHistory):
+            pieces = self._with_turn_context(messages.wire_json(), encoded=True)
+        else:
+            pieces = [compact_json(message) for message in messages]
+        options = compact_json({key: value for key, value in kwargs.items() if key != "messages"})
+        head = options[:-1] + ("," if len(options) > 2 else "")
+        return (head + '"messages":[' + ",".join(pieces) + "]}").encode("utf-8")
+
+    def _post_chat(self, body, stream):
+        """POST an encoded request body to chat/completions; returns the SDK's raw response.
+
+        completions.create would validate and re-encode every message of the
+        history on each request; the client's low-level post sends the bytes
+        as they are, with the same authentication and response parsing.
+        """
+        return self.client.post(
+            "/chat/completions",
+            cast_to=ChatCompletion,
+            content=body,
+            options={
+                "headers": {"Content-Type": "application/json", RAW_RESPONSE_HEADER: "true"},
+                "security": {"bearer_auth": True},
+            },
+            stream=stream,
+            stream_cls=Stream[ChatCompletionChunk],
+        )
+
+    def _record_usage(self, usage, estimated):
+        if usage is None:
+            return
+        scheduler.limiter(self.rate_limit_key).settle(estimated, usage.total_tokens)
+        details = getattr(usage, "prompt_tokens_details", None)
+        prefix_cache.get(self.latency_key).add(usage.prompt_tokens, getattr(details, "cached_tokens", 0))
 
     def handle_chat(self, user_input: str, tool_schemas: list, tool_invoker: callable) -> str:
-        if not self.api_key:
-            return "Error: OpenAI API key is not configured. Please set it via the File -> Manage API Keys menu."
+        try:
+            self._ensure_ready()
+        except Exception as e:
+            return f"Error: {e}"
+        checkpoint = len(self.messages)
+        try:
+            return self._run_chat(user_input, tool_schemas, tool_invoker)
+        except Exception as e:
+            # A half-finished turn (e.g. tool calls without results) would make
+            # the provider reject every later request
+            del self.messages[checkpoint:]
+            return f"Error calling {self.display_name} API: {e}"
+
+    def _run_chat(self, user_input: str, tool_schemas: list, tool_invoker: callable) -> str:
+        """Non-streaming turn. Raises on failure; handle_chat turns errors into messages."""
+        self._turn_start = len(self.messages)
+        self.messages.append(Message("user", user_input))
+
+        response = self._create_completion(messages=self.messages, **_tool_options(tool_schemas, "auto"))
+        response_message = response.choices[0].message
+        self.messages.append(Message.from_sdk(response_message))
+
+        if response_message.tool_calls:
+            for tool_call in response_message.tool_calls:
+                function_name = tool_call.function.name
+                tool_output = _invoke_with_arguments(tool_invoker, function_name, tool_call.function.arguments)
+
+                self.messages.append(Message("tool", str(tool_output), name=function_name, tool_call_id=tool_call.id))
+
+            second_response = self._create_completion(messages=self.messages, **_tool_options(tool_schemas, "none"))
+            second_response_message = second_response.choices[0].message
+            self.messages.append(Message.from_sdk(second_response_message))
+            return second_response_message.content
+
+        return response_message.content
+
+    def complete(self, prompt: str) -> str:
+        """One-off completion outside the conversation: no history, no tools. Raises on failure."""
+        self._ensure_ready()
+        response = self._create_completion(messages=[{"role": "user", "content": prompt}])
+        return response.choices[0].message.content or ""
+
+    def handle_chat_stream(self, user_input: str, tools: list, tool_invoker: callable, stream_callback: callable, cancel_token=None):
+        """Streaming version of handle_chat."""
+        try:
+            self._ensure_ready()
+        except Exception as e:
+            error_msg = f"Error: {e}"
+            stream_callback(error_msg)
+            return error_msg
 
-        # Initialize client now that we know we have a key and need to use it
-        if self.client is None:
-            self.client = openai.OpenAI(base_url="https://api.openai.com/v1",api_key=self.api_key)
+        checkpoint = len(self.messages)
+        try:
+            return self._run_chat_stream(user_input, tools, tool_invoker, stream_callback, cancel_token)
+        except GenerationCancelled:
+            del self.messages[checkpoint:]
+            raise
+        except Exception as e:
+            # See handle_chat
+            del self.messages[checkpoint:]
+            error_msg = f"Error calling {self.display_name} API: {e}"
+            stream_callback(error_msg)
+            return error_msg
 
-        return self._handle_chat_completions(user_input, tool_schemas, tool_invoker)
+    def _run_chat_stream(self, user_input: str, tools: list, tool_invoker: callable, stream_callback: callable, cancel_token=None):
+        """Streaming turn. Raises on failure and GenerationCancelled when cancelled."""
+        self._turn_start = len(self.messages)
+        self.messages.append(Message("user", user_input))
 
-    def _handle_chat_completions(self, user_input: str, tool_schemas: list, tool_invoker: callable) -> str:
-        self.messages.append({"role": "user", "content": user_input})
+        response_content, tool_calls = self._stream_completion(stream_callback, cancel_token, **_tool_options(tools, "auto"))
 
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=self.messages,
-                tools=tool_schemas,
-                tool_choice="auto",
-            )
-            response_message = response.choices[0].message
-            self.messages.append(response_message)
-
-            if response_message.tool_calls:
-                for tool_call in response_message.tool_calls:
-                    function_name = tool_call.function.name
-                    function_args = json.loads(tool_call.function.arguments)
-                    tool_output = tool_invoker(function_name, function_args)
-
-                    self.messages.append({
-                        "tool_call_id": tool_call.id,
-                        "role": "tool",
-                        "name": function_name,
-                        "content": str(tool_output),
-                    })
+        if tool_calls:
+            self.messages.append(Message("assistant", response_content or None, tool_calls=tool_calls))
+            for tool_call in tool_calls:
+                if cancel_token is not None:
+                    cancel_token.raise_if_cancelled()
+                tool_output = _invoke_with_arguments(tool_invoker, tool_call.name, tool_call.arguments)
 
-                second_response = self.client.chat.completions.create(model=self.model, messages=self.messages)
-                second_response_message = second_response.choices[0].message
-                self.messages.append(second_response_message)
-                return second_response_message.content
+                self.messages.append(Message("tool", str(tool_output), name=tool_call.name, tool_call_id=tool_call.id))
 
-            return response_message.content
-        except Exception as e:
-            return f"Error calling OpenAI API: {e}"
+            response_content, _ = self._stream_completion(stream_callback, cancel_token, **_tool_options(tools, "none"))
 
-    def handle_chat_stream(self, user_input: str, tools: list, tool_invoker: callable, stream_callback: callable):
-        """Streaming version of handle_chat for OpenAI."""
-        if not self.api_key:
-            error_msg = "Error: OpenAI API key is not configured. Please set it via the File -> Manage API Keys menu."
-            stream_callback(error_msg)
-            return error_msg
+        self.messages.append(Message("assistant", response_content))
+        return response_content
 
-        # Initialize client now that we know we have a key and need to use it
-        if self.client is None:
-            self.client = openai.OpenAI(base_url="https://api.openai.com/v1", api_key=self.api_key)
+    def _stream_completion(self, stream_callback: callable, cancel_token=None, **kwargs):
+        """Stream one completion, forwarding content tokens.
 
-        self.messages.append({"role": "user", "content": user_input})
+        Returns the text and the ToolCalls reassembled from their deltas.
+        """
+        started = time.perf_counter()
+        response, estimated = self._send_request(messages=self.messages, stream=True, cancel_token=cancel_token, **kwargs)
+        if cancel_token is not None:
+            # Closing the HTTP stream unblocks the read loop below right away
+            cancel_token.on_cancel(response.close)
 
+        response_content = ""
+        tool_calls = {}
+        first_token = True
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=self.messages,
-                tools=tools,
-                tool_choice="auto",
-                stream=True,
-            )
-            
-            response_content = ""
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
             for chunk in response:
-                if chunk.choices[0].delta.content:
-                    token = chunk.choices[0].delta.content
+                if cancel_token is not None:
+                    cancel_token.raise_if_cancelled()
+                if getattr(chunk, 'usage', None) is not None:
+                    self._record_usage(chunk.usage, estimated)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if first_token and (delta.content or getattr(delta, 'tool_calls', None)):
+                    first_token = False
+                    time_to_first_token.get(self.latency_key).add(time.perf_counter() - started)
+                if delta.content:
+                    token = delta.content
                     response_content += token
                     stream_callback(token)
-            
-            # Handle tool calls if any
-            if hasattr(chunk.choices[0].delta, 'tool_calls') and chunk.choices[0].delta.tool_calls:
-                # For simplicity, we'll handle tool calls in non-streaming mode
-                # This could be enhanced to stream tool call responses
-                pass
-            
-            self.messages.append({"role": "assistant", "content": response_content})
-            return response_content
-            
-        except Exception as e:
-            error_msg = f"Error calling OpenAI API: {e}"
-            stream_callback(error_msg)
-            return error_msg
+
+                for tool_call_delta in getattr(delta, 'tool_calls', None) or []:
+                    entry = tool_calls.setdefault(tool_call_delta.index, {
+                        "id": None,
+                        "type": "function",
+                        "function": {"name": "", "arguments": ""},
+                    })
+                    if tool_call_delta.id:
+                        entry["id"] = tool_call_delta.id
+                    function = tool_call_delta.function
+                    if function is not None:
+                        entry["function"]["name"] += function.name or ""
+                        entry["function"]["arguments"] += function.arguments or ""
+        except Exception:
+            if cancel_token is not None and cancel_token.cancelled:
+                raise GenerationCancelled()
+            raise
+        finally:
+            if cancel_token is not None:
+                cancel_token.remove_callback(response.close)
+            response.close()
+
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        return response_content, [
+            ToolCall(tool_calls[index]["id"], tool_calls[index]["function"]["name"], tool_calls[index]["function"]["arguments"])
+            for index in sorted(tool_calls)
+        ]
+
+    @property
+    def latency_key(self):
+        return f"{self.rate_limit_key}:{self.model}"
+
+
+class OpenAIProvider(ChatCompletionsProvider):
+    display_name = "OpenAI"
+    rate_limit_key = "openai"
+    supports_stream_usage = True
+
+    def __init__(self, api_key=None, model="gpt-5"):
+        # Prioritize settings, then environment variable, then direct parameter
+        self.api_key = settings.get_api_key("openai") or os.getenv("OPENAI_API_KEY") or api_key
+
+        # The client will be initialized on-demand to avoid errors if key is not set at startup
+        self.client = None
+        self.model = model
+        self.messages = MessageHistory()
+
+    def _ensure_client(self):
+        if not self.api_key:
+            raise ValueError("OpenAI API key is not configured. Please set it via the File -> Manage API Keys menu.")
+        # Initialize client now that we know we have a key and need to use it
+        if self.client is None:
+            self.client = get_client("https://api.openai.com/v1", self.api_key)
 
     @classmethod
     def get_models(cls):
@@ -126,7 +368,7 @@ class OpenAIProvider(BaseProvider):
         if not api_key:
             return []
         try:
-            client = openai.OpenAI(base_url="https://api.openai.com/v1", api_key=api_key)
+            client = get_client("https://api.openai.com/v1", api_key)
             models = client.models.list()
             return [model.id for model in models.data]
         except Exception as e:
@@ -134,7 +376,10 @@ class OpenAIProvider(BaseProvider):
             return []
 
 
-class GroqProvider(BaseProvider):
+class GroqProvider(ChatCompletionsProvider):
+    display_name = "Groq"
+    rate_limit_key = "groq"
+
     def __init__(self, api_key=None, model="llama3-8b-8192"):
         # Prioritize settings, then environment variable, then direct parameter
         self.api_key = settings.get_api_key("groq") or os.getenv("GROQ_API_KEY") or api_key
@@ -142,94 +387,14 @@ class GroqProvider(BaseProvider):
         # The client will be initialized on-demand to avoid errors if key is not set at startup
         self.client = None
         self.model = model
-        self.messages = []
-
-    def handle_chat(self, user_input: str, tool_schemas: list, tool_invoker: callable) -> str:
-        if not self.api_key:
-            return "Error: Groq API key is not configured. Please set it via the File -> Manage API Keys menu."
-
-        # Initialize client now that we know we have a key and need to use it
-        if self.client is None:
-            self.client = openai.OpenAI(base_url="https://api.groq.com/openai/v1",api_key=self.api_key)
-
-        return self._handle_chat_completions(user_input, tool_schemas, tool_invoker)
+        self.messages = MessageHistory()
 
-    def _handle_chat_completions(self, user_input: str, tool_schemas: list, tool_invoker: callable) -> str:
-        self.messages.append({"role": "user", "content": user_input})
-
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=self.messages,
-                tools=tool_schemas,
-                tool_choice="auto",
-            )
-            response_message = response.choices[0].message
-            self.messages.append(response_message)
-
-            if response_message.tool_calls:
-                for tool_call in response_message.tool_calls:
-                    function_name = tool_call.function.name
-                    function_args = json.loads(tool_call.function.arguments)
-                    tool_output = tool_invoker(function_name, function_args)
-
-                    self.messages.append({
-                        "tool_call_id": tool_call.id,
-                        "role": "tool",
-                        "name": function_name,
-                        "content": str(tool_output),
-                    })
-
-                second_response = self.client.chat.completions.create(model=self.model, messages=self.messages)
-                second_response_message = second_response.choices[0].message
-                self.messages.append(second_response_message)
-                return second_response_message.content
-
-            return response_message.content
-        except Exception as e:
-            return f"Error calling Groq API: {e}"
-
-    def handle_chat_stream(self, user_input: str, tools: list, tool_invoker: callable, stream_callback: callable):
-        """Streaming version of handle_chat for Groq."""
+    def _ensure_client(self):
         if not self.api_key:
-            error_msg = "Error: Groq API key is not configured. Please set it via the File -> Manage API Keys menu."
-            stream_callback(error_msg)
-            return error_msg
-
+            raise ValueError("Groq API key is not configured. Please set it via the File -> Manage API Keys menu.")
         # Initialize client now that we know we have a key and need to use it
         if self.client is None:
-            self.client = openai.OpenAI(base_url="https://api.groq.com/openai/v1", api_key=self.api_key)
-
-        self.messages.append({"role": "user", "content": user_input})
-
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=self.messages,
-                tools=tools,
-                tool_choice="auto",
-                stream=True,
-            )
-            
-            response_content = ""
-            for chunk in response:
-                if chunk.choices[0].delta.content:
-                    token = chunk.choices[0].delta.content
-                    response_content += token
-                    stream_callback(token)
-            
-            # Handle tool calls if any
-            if hasattr(chunk.choices[0].delta, 'tool_calls') and chunk.choices[0].delta.tool_calls:
-                # For simplicity, we'll handle tool calls in non-streaming mode
-                pass
-            
-            self.messages.append({"role": "assistant", "content": response_content})
-            return response_content
-            
-        except Exception as e:
-            error_msg = f"Error calling Groq API: {e}"
-            stream_callback(error_msg)
-            return error_msg
+            self.client = get_client("https://api.groq.com/openai/v1", self.api_key)
 
     @classmethod
     def get_models(cls):
@@ -237,7 +402,7 @@ class GroqProvider(BaseProvider):
         if not api_key:
             return []
         try:
-            client = openai.OpenAI(base_url="https://api.groq.com/openai/v1", api_key=api_key)
+            client = get_client("https://api.groq.com/openai/v1", api_key)
             models = client.models.list()
             return [model.id for model in models.data]
         except Exception as e:
@@ -245,88 +410,19 @@ class GroqProvider(BaseProvider):
             return []
 
 
-class LocalTransformersProvider(BaseProvider):
+class LocalTransformersProvider(ChatCompletionsProvider):
+    display_name = "Local Transformers"
+    rate_limit_key = "local_transformers"
+
     def __init__(self, model="distilbert-base-uncased"):
-        self.client = openai.OpenAI(base_url="http://localhost:8008/v1", api_key="local")
+        self.client = get_client("http://localhost:8008/v1", "local")
         self.model = model
-        self.messages = []
-
-    def handle_chat(self, user_input: str, tool_schemas: list, tool_invoker: callable) -> str:
-        return self._handle_chat_completions(user_input, tool_schemas, tool_invoker)
-
-    def _handle_chat_completions(self, user_input: str, tool_schemas: list, tool_invoker: callable) -> str:
-        self.messages.append({"role": "user", "content": user_input})
-
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=self.messages,
-                tools=tool_schemas,
-                tool_choice="auto",
-            )
-            response_message = response.choices[0].message
-            self.messages.append(response_message)
-
-            if response_message.tool_calls:
-                for tool_call in response_message.tool_calls:
-                    function_name = tool_call.function.name
-                    function_args = json.loads(tool_call.function.arguments)
-                    tool_output = tool_invoker(function_name, function_args)
-
-                    self.messages.append({
-                        "tool_call_id": tool_call.id,
-                        "role": "tool",
-                        "name": function_name,
-                        "content": str(tool_output),
-                    })
-
-                second_response = self.client.chat.completions.create(model=self.model, messages=self.messages)
-                second_response_message = second_response.choices[0].message
-                self.messages.append(second_response_message)
-                return second_response_message.content
-
-            return response_message.content
-        except Exception as e:
-            return f"Error calling Local Transformers API: {e}"
-
-    def handle_chat_stream(self, user_input: str, tools: list, tool_invoker: callable, stream_callback: callable):
-        """Streaming version of handle_chat for Local Transformers."""
-        # Client is already initialized in __init__ for local transformers
-        self.messages.append({"role": "user", "content": user_input})
-
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=self.messages,
-                tools=tools,
-                tool_choice="auto",
-                stream=True,
-            )
-            
-            response_content = ""
-            for chunk in response:
-                if chunk.choices[0].delta.content:
-                    token = chunk.choices[0].delta.content
-                    response_content += token
-                    stream_callback(token)
-            
-            # Handle tool calls if any
-            if hasattr(chunk.choices[0].delta, 'tool_calls') and chunk.choices[0].delta.tool_calls:
-                # For simplicity, we'll handle tool calls in non-streaming mode
-                pass
-            
-            self.messages.append({"role": "assistant", "content": response_content})
-            return response_content
-            
-        except Exception as e:
-            error_msg = f"Error calling Local Transformers API: {e}"
-            stream_callback(error_msg)
-            return error_msg
+        self.messages = MessageHistory()
 
     @classmethod
     def get_models(cls):
         try:
-            client = openai.OpenAI(base_url="http://localhost:8008/v1", api_key="local")
+            client = get_client("http://localhost:8008/v1", "local")
             models = client.models.list()
             return [model.id for model in models.data]
         except Exception as e:
@@ -335,12 +431,15 @@ class LocalTransformersProvider(BaseProvider):
             return ["local-model"]
 
 
-class RemoteTransformersProvider(BaseProvider):
+class RemoteTransformersProvider(ChatCompletionsProvider):
+    display_name = "Remote Transformers"
+    rate_limit_key = "remote_transformers"
+
     def __init__(self, model="distilbert-base-uncased", base_url: str | None = None):
         # base_url is expected to be like https://host:port/v1
         self.base_url = base_url or settings.get_remote_transformers_url()
         self.model = model
-        self.messages = []
+        self.messages = MessageHistory()
         # Initialize lazily so we can return a helpful error if URL is missing
         self.client = None
 
@@ -348,99 +447,356 @@ class RemoteTransformersProvider(BaseProvider):
         if self.client is None:
             if not self.base_url:
                 raise ValueError("Remote Transformers URL is not configured. Please set it in Settings.")
-            self.client = openai.OpenAI(base_url=self.base_url, api_key="remote")
+            self.client = get_client(self.base_url, "remote")
 
-    def handle_chat(self, user_input: str, tool_schemas: list, tool_invoker: callable) -> str:
+    @classmethod
+    def get_models(cls):
+        base_url = settings.get_remote_transformers_url()
+        if not base_url:
+            return []
         try:
-            self._ensure_client()
+            client = get_client(base_url, "remote")
+            models = client.models.list()
+            return [model.id for model in models.data]
         except Exception as e:
-            return f"Error: {e}"
-        return self._handle_chat_completions(user_input, tool_schemas, tool_invoker)
+            print(f"Error fetching Remote Transformers models: {e}")
+            return []
 
-    def _handle_chat_completions(self, user_input: str, tool_schemas: list, tool_invoker: callable) -> str:
-        self.messages.append({"role": "user", "content": user_input})
 
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=self.messages,
-                tools=tool_schemas,
-                tool_choice="auto",
+def plain_chat_messages(messages):
+    """Wire messages with tool traffic turned into text, for chat templates without tool support.
+
+    Tool calls become lines of the assistant's message and tool results a
+    user message, as does a system message past the start (the turn
+    context). Consecutive messages of one role are then merged, so the
+    roles still alternate as strict templates require.
+    """
+    plain = []
+    for message in messages:
+        role = message["role"]
+        content = message.get("content") or ""
+        if role == "system" and plain:
+            role = "user"
+        elif role == "tool":
+            role = "user"
+            content = f"[Result of {message.get('name') or 'tool'}]\n{content}"
+        elif message.get("tool_calls"):
+            calls = "\n".join(
+                f"[Called {call['function']['name']}({call['function']['arguments']})]"
+                for call in message["tool_calls"]
             )
-            response_message = response.choices[0].message
-            self.messages.append(response_message)
-
-            if response_message.tool_calls:
-                for tool_call in response_message.tool_calls:
-                    function_name = tool_call.function.name
-                    function_args = json.loads(tool_call.function.arguments)
-                    tool_output = tool_invoker(function_name, function_args)
-
-                    self.messages.append({
-                        "tool_call_id": tool_call.id,
-                        "role": "tool",
-                        "name": function_name,
-                        "content": str(tool_output),
-                    })
+            content = f"{content}\n{calls}" if content else calls
+        if plain and plain[-1]["role"] == role and role != "system":
+            plain[-1] = {"role": role, "content": f"{plain[-1]['content']}\n\n{content}"}
+        else:
+            plain.append({"role": role, "content": content})
+    return plain
+
+
+class EmbeddedTransformersProvider(BaseProvider):
+    """Runs a Hugging Face chat model inside this process, on the CPU.
+
+    No server to launch and no HTTP/SSE framing per token: tokens come
+    straight from the shared LocalEngine, which also keeps the KV cache of
+    the conversation between turns. Small local models are used for plain
+    chat here, so tool schemas are not sent to the model, and tool calls
+    and results already in the history (from another provider) are given
+    to it as text.
+    """
+    display_name = "Embedded Transformers"
+    rate_limit_key = "embedded_transformers"
+
+    def __init__(self, model="Qwen/Qwen2.5-0.5B-Instruct"):
+        self.model = model
+        self.messages = MessageHistory()
+        self.engine = None
+        self._warned_tools = False
 
-                second_response = self.client.chat.completions.create(model=self.model, messages=self.messages)
-                second_response_message = second_response.choices[0].message
-                self.messages.append(second_response_message)
-                return second_response_message.content
+    def _ensure_client(self):
+        # The model itself is loaded lazily by the engine's worker
+        if self.engine is None:
+            self.engine = get_engine(self.model)
+
+    @property
+    def latency_key(self):
+        return f"{self.rate_limit_key}:{self.model}"
 
-            return response_message.content
+    def handle_chat(self, user_input: str, tool_schemas: list, tool_invoker: callable) -> str:
+        checkpoint = len(self.messages)
+        try:
+            self._ensure_ready()
+            return self._run_chat(user_input, tool_schemas, tool_invoker)
         except Exception as e:
-            return f"Error calling Remote Transformers API: {e}"
+            del self.messages[checkpoint:]
+            return f"Error running {self.model} in-process: {e}"
+
+    def _run_chat(self, user_input: str, tool_schemas: list, tool_invoker: callable) -> str:
+        return self._run_chat_stream(user_input, tool_schemas, tool_invoker, lambda token: None)
 
-    def handle_chat_stream(self, user_input: str, tools: list, tool_invoker: callable, stream_callback: callable):
-        """Streaming version of handle_chat for Remote Transformers."""
+    def handle_chat_stream(self, user_input: str, tools: list, tool_invoker: callable, stream_callback: callable, cancel_token=None):
+        checkpoint = len(self.messages)
         try:
-            self._ensure_client()
+            self._ensure_ready()
+            return self._run_chat_stream(user_input, tools, tool_invoker, stream_callback, cancel_token)
+        except GenerationCancelled:
+            del self.messages[checkpoint:]
+            raise
         except Exception as e:
-            error_msg = f"Error: {e}"
+            del self.messages[checkpoint:]
+            error_msg = f"Error running {self.model} in-process: {e}"
             stream_callback(error_msg)
             return error_msg
 
-        self.messages.append({"role": "user", "content": user_input})
+    def _run_chat_stream(self, user_input: str, tools: list, tool_invoker: callable, stream_callback: callable, cancel_token=None):
+        if tools and not self._warned_tools:
+            self._warned_tools = True
+            print(f"{self.display_name} does not support tools; {len(tools)} tool schemas are not sent to {self.model}")
+        self._turn_start = len(self.messages)
+        self.messages.append(Message("user", user_input))
+        response_content = self._generate(plain_chat_messages(self._with_turn_context(self.messages.wire())), stream_callback, cancel_token)
+        self.messages.append(Message("assistant", response_content))
+        return response_content
+
+    def _generate(self, messages, stream_callback, cancel_token=None):
+        started = time.perf_counter()
+        pieces = []
+        for piece in self.engine.generate(messages, max_new_tokens=settings.get_embedded_max_new_tokens(), cancel_token=cancel_token):
+            if not pieces:
+                time_to_first_token.get(self.latency_key).add(time.perf_counter() - started)
+            pieces.append(piece)
+            stream_callback(piece)
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        return "".join(pieces)
+
+    def complete(self, prompt: str) -> str:
+        self._ensure_ready()
+        return self._generate([{"role": "user", "content": prompt}], lambda token: None)
+
+    @classmethod
+    def get_models(cls):
+        return settings.get_embedded_models()
+
+
+PROVIDER_CLASSES = {
+    "openai": OpenAIProvider,
+    "groq": GroqProvider,
+    "local_transformers": LocalTransformersProvider,
+    "remote_transformers": RemoteTransformersProvider,
+    "embedded_transformers": EmbeddedTransformersProvider,
+}
+
+def create_provider(provider_name: str, model_name: str):
+    """Instantiate the provider registered under provider_name (OpenAI by default)."""
+    if provider_name == "fallback":
+        return FallbackProvider.from_settings()
+    provider_class = PROVIDER_CLASSES.get(provider_name, OpenAIProvider)
+    return provider_class(model=model_name)
+
+
+class _HedgeRace:
+    """Book-keeping for the attempts of one hedged turn.
+
+    The first attempt to stream a token (or to invoke a tool) wins; every
+    other attempt is cancelled so it stops consuming tokens and bandwidth.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.winner = None
+        self.attempts = []
+        self.results = queue.Queue()
+
+    def claim(self, attempt):
+        with self.lock:
+            if self.winner is None:
+                self.winner = attempt
+                losers = [a for a in self.attempts if a is not attempt]
+            else:
+                losers = []
+        for loser in losers:
+            loser.cancel_token.cancel()
+        return self.winner is attempt
+
+    def running(self):
+        return [a for a in self.attempts if not a.done]
+
+
+class _HedgeAttempt:
+    def __init__(self, provider):
+        self.provider = provider
+        self.cancel_token = CancelToken()
+        self.done = False
+
+
+class FallbackProvider(BaseProvider):
+    """Tries an ordered chain of providers, optionally hedging slow starts.
+
+    Failover: when a provider errors before producing output, the next one in
+    the chain is tried. Hedging (streaming only): when the current provider
+    has not produced a first token within its p95 time-to-first-token, the
+    same request is also sent to the next provider; whichever streams first
+    is kept and the other is cancelled. No hedge is fired until a provider has
+    `hedge_min_samples` measured TTFTs, so thresholds always come from real
+    measurements.
+    """
+
+    def __init__(self, chain, hedge=True, hedge_min_samples=20):
+        # chain: [(provider_name, model_name), ...] in order of preference
+        self.chain = list(chain)
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        self.model = self.chain[0][1] if self.chain else None
+        self.messages = MessageHistory()
+
+    @classmethod
+    def from_settings(cls):
+        chain = [(entry["provider"], entry.get("model")) for entry in settings.get_fallback_chain()]
+        return cls(chain, hedge=settings.get_hedging_enabled())
+
+    def _new_provider(self, index):
+        # A fresh instance per attempt, so an abandoned attempt can never
+        # touch the history of a later turn. Clients are shared anyway.
+        provider_name, model_name = self.chain[index]
+        provider = create_provider(provider_name, model_name)
+        provider.messages = self.messages.copy()
+        provider.turn_context = self.turn_context
+        return provider
+
+    def hedge_delay(self, provider):
+        """p95 TTFT for provider, or None while there are too few samples."""
+        if not self.hedge:
+            return None
+        stats = time_to_first_token.get(provider.latency_key)
+        if stats.count() < self.hedge_min_samples:
+            return None
+        return stats.percentile(95)
+
+    def handle_chat(self, user_input: str, tool_schemas: list, tool_invoker: callable) -> str:
+        if not self.chain:
+            return "Error: No providers are configured for the fallback chain."
+        errors = []
+        for index in range(len(self.chain)):
+            provider = self._new_provider(index)
+            try:
+                provider._ensure_ready()
+                result = provider._run_chat(user_input, tool_schemas, tool_invoker)
+            except Exception as e:
+                errors.append(f"{provider.display_name}: {e}")
+                continue
+            self.messages[:] = provider.messages
+            return result
+        return "Error: All providers in the fallback chain failed (" + "; ".join(errors) + ")"
+
+    def complete(self, prompt: str) -> str:
+        errors = []
+        for index in range(len(self.chain)):
+            provider = self._new_provider(index)
+            try:
+                return provider.complete(prompt)
+            except Exception as e:
+                errors.append(f"{provider.display_name}: {e}")
+        raise RuntimeError("All providers in the fallback chain failed (" + "; ".join(errors) + ")")
+
+    def handle_chat_stream(self, user_input: str, tools: list, tool_invoker: callable, stream_callback: callable, cancel_token=None):
+        if not self.chain:
+            error_msg = "Error: No providers are configured for the fallback chain."
+            stream_callback(error_msg)
+            return error_msg
+
+        race = _HedgeRace()
+        errors = []
+        next_index = 0
+
+        def cancel_all():
+            for attempt in list(race.attempts):
+                attempt.cancel_token.cancel()
+
+        def start_attempt():
+            nonlocal next_index
+            provider = self._new_provider(next_index)
+            next_index += 1
+            attempt = _HedgeAttempt(provider)
+            race.attempts.append(attempt)
+
+            def forward(token):
+                if not race.claim(attempt):
+                    raise GenerationCancelled()
+                stream_callback(token)
+
+            def invoke(tool_name, kwargs):
+                # Tools may have side effects, so only the winner runs them
+                if not race.claim(attempt):
+                    raise GenerationCancelled()
+                return tool_invoker(tool_name, kwargs)
+
+            def run():
+                try:
+                    provider._ensure_ready()
+                    result = provider._run_chat_stream(user_input, tools, invoke, forward, attempt.cancel_token)
+                    race.results.put((attempt, True, result))
+                except Exception as e:
+                    race.results.put((attempt, False, e))
+
+            threading.Thread(target=run, daemon=True).start()
+            return attempt
+
+        if cancel_token is not None:
+            cancel_token.on_cancel(cancel_all)
+
+        def hedge_deadline(attempt):
+            # When to hedge `attempt` with the next provider, if ever
+            delay = self.hedge_delay(attempt.provider)
+            if delay is None or next_index >= len(self.chain):
+                return None
+            return time.monotonic() + delay
+
+        hedge_at = hedge_deadline(start_attempt())
 
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=self.messages,
-                tools=tools,
-                tool_choice="auto",
-                stream=True,
-            )
-            
-            response_content = ""
-            for chunk in response:
-                if chunk.choices[0].delta.content:
-                    token = chunk.choices[0].delta.content
-                    response_content += token
-                    stream_callback(token)
-            
-            # Handle tool calls if any
-            if hasattr(chunk.choices[0].delta, 'tool_calls') and chunk.choices[0].delta.tool_calls:
-                # For simplicity, we'll handle tool calls in non-streaming mode
-                pass
-            
-            self.messages.append({"role": "assistant", "content": response_content})
-            return response_content
-            
+            while True:
+                timeout = None if hedge_at is None else max(0.0, hedge_at - time.monotonic())
+                try:
+                    attempt, ok, value = race.results.get(timeout=timeout)
+                except queue.Empty:
+                    # Primary is slower than its p95 TTFT: hedge once
+                    hedge_at = None
+                    if race.winner is None and next_index < len(self.chain):
+                        start_attempt()
+                    continue
+
+                attempt.done = True
+                if cancel_token is not None and cancel_token.cancelled:
+                    raise GenerationCancelled()
+                if ok and race.winner in (None, attempt):
+                    race.claim(attempt)
+                    self.messages[:] = attempt.provider.messages
+                    return value
+                if ok or isinstance(value, GenerationCancelled):
+                    # A loser that was cancelled or finished after the winner
+                    continue
+
+                errors.append(f"{attempt.provider.display_name}: {value}")
+                if race.winner is attempt:
+                    # Output was already streamed, so switching providers would duplicate it
+                    raise value
+                if race.winner is None and not race.running():
+                    if next_index >= len(self.chain):
+                        raise RuntimeError("; ".join(errors))
+                    # The failed attempt's hedge deadline no longer applies
+                    hedge_at = hedge_deadline(start_attempt())
+        except GenerationCancelled:
+            raise
         except Exception as e:
-            error_msg = f"Error calling Remote Transformers API: {e}"
+            cancel_all()
+            error_msg = f"Error: All providers in the fallback chain failed ({e})" if race.winner is None else f"Error calling {race.winner.provider.display_name} API: {e}"
             stream_callback(error_msg)
             return error_msg
+        finally:
+            if cancel_token is not None:
+                cancel_token.remove_callback(cancel_all)
 
     @classmethod
     def get_models(cls):
-        base_url = settings.get_remote_transformers_url()
-        if not base_url:
-            return []
-        try:
-            client = openai.OpenAI(base_url=base_url, api_key="remote")
-            models = client.models.list()
-            return [model.id for model in models.data]
-        except Exception as e:
-            print(f"Error fetching Remote Transformers models: {e}")
-            return []
\ No newline at end of file
+        # The chain's models are configured per entry in config.json
+        return ["fallback-chain"]
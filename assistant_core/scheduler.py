@@ -0,0 +1,272 @@
+import email.utils
+import json
+import random
+import re
+import threading
+import time
+
+import openai
+
+from config.settings import settings
+from .cancellation import GenerationCancelled
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_duration(value):
+    """Parse rate-limit reset values such as "6m0s", "1.5s", "250ms" or "12" into seconds."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def parse_retry_after(headers):
+    """Seconds to wait according to retry-after-ms / retry-after, or None."""
+    if not headers:
+        return None
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000.0
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    try:
+        # HTTP-date form
+        when = email.utils.parsedate_to_datetime(retry_after)
+        return max(0.0, when.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def estimate_tokens(request_kwargs):
+    """Rough prompt size (~4 characters per token) used to charge the tokens/min bucket."""
+    messages = request_kwargs.get("messages")
+    if hasattr(messages, "char_count"):
+        # MessageHistory keeps a running total, no need to re-serialize it
+        chars = messages.char_count()
+    else:
+        chars = len(json.dumps(messages, default=str))
+    chars += len(json.dumps(request_kwargs.get("tools"), default=str))
+    return chars // 4 + 1
+
+
+class TokenBucket:
+    """Reservation-based token bucket refilled continuously at `per_minute` / 60 per second.
+
+    Reservations may drive the level negative; the caller then sleeps for the
+    returned delay. Since every caller reserves under the limiter lock, callers
+    are released in arrival order instead of all retrying at once.
+    """
+
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount, now):
+        self._refill(now)
+        self.level -= min(amount, self.capacity)
+        if self.level >= 0:
+            return 0.0
+        return -self.level / self.rate
+
+    def adjust(self, amount):
+        """Give back (positive) or charge (negative) tokens once actual usage is known."""
+        self.level = min(self.capacity, self.level + amount)
+
+
+class ProviderLimiter:
+    """Request and token pacing for one provider."""
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.paused_until = 0.0
+        self.waiting = 0
+        self.throttled = 0
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens, cancel_token=None):
+        """Reserve a request and `tokens`, waiting until the buckets allow it.
+
+        Raises GenerationCancelled (and gives the reservation back) if
+        `cancel_token` is cancelled during the wait.
+        """
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self.paused_until - now)
+            if self.requests:
+                wait = max(wait, self.requests.reserve(1, now))
+            if self.tokens:
+                wait = max(wait, self.tokens.reserve(tokens, now))
+            if wait > 0:
+                self.waiting += 1
+        if wait > 0:
+            if cancel_token is None:
+                time.sleep(wait)
+                cancelled = False
+            else:
+                cancelled = cancel_token.wait(wait)
+            with self._lock:
+                self.waiting -= 1
+                if cancelled:
+                    # The request is never sent
+                    if self.requests:
+                        self.requests.adjust(1)
+                    if self.tokens:
+                        self.tokens.adjust(min(tokens, self.tokens.capacity))
+            if cancelled:
+                raise GenerationCancelled()
+        return wait
+
+    def pause(self, seconds):
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def settle(self, estimated_tokens, actual_tokens):
+        if self.tokens and actual_tokens is not None:
+            with self._lock:
+                self.tokens.adjust(estimated_tokens - actual_tokens)
+
+    def observe_headers(self, headers):
+        """Pause until the provider's window resets when its headers say we are out of quota."""
+        if not headers:
+            return
+        for kind in ("requests", "tokens"):
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            if remaining is None:
+                continue
+            try:
+                remaining = float(remaining)
+            except ValueError:
+                continue
+            if remaining <= 0:
+                reset = parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+                if reset:
+                    self.pause(reset)
+
+
+class RequestScheduler:
+    """Paces and retries provider calls.
+
+    Every `chat.completions.create` call goes through `call()`, which waits for
+    the provider's buckets, retries rate limits, timeouts and 5xx responses
+    with jittered exponential backoff (or the server's retry-after), and
+    updates the buckets from the rate-limit headers of each response.
+    """
+
+    def __init__(self, max_retries=4, base_delay=0.5, max_delay=30.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def limiter(self, key):
+        with self._lock:
+            limiter = self._limiters.get(key)
+            if limiter is None:
+                limits = settings.get_rate_limits().get(key, {})
+                limiter = ProviderLimiter(
+                    requests_per_minute=limits.get("requests_per_minute"),
+                    tokens_per_minute=limits.get("tokens_per_minute"),
+                )
+                self._limiters[key] = limiter
+            return limiter
+
+    def reset(self):
+        """Drop all limiters so changed rate limit settings take effect."""
+        with self._lock:
+            self._limiters = {}
+
+    def backoff(self, attempt):
+        # "Full jitter": uniform in [0, min(cap, base * 2^attempt)]
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def call(self, key, fn, estimated_tokens=0, cancel_token=None):
+        """Run `fn` (which returns a raw API response) under `key`'s rate limits.
+
+        Waits for the buckets and between retries end early with
+        GenerationCancelled once `cancel_token` is cancelled, so a stopped
+        turn never sends its request.
+        """
+        limiter = self.limiter(key)
+        attempt = 0
+        while True:
+            limiter.acquire(estimated_tokens, cancel_token)
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            try:
+                response = fn()
+            except Exception as e:
+                if not self._is_retryable(e) or attempt >= self.max_retries:
+                    raise
+                headers = getattr(getattr(e, "response", None), "headers", None)
+                delay = parse_retry_after(headers)
+                if delay is None:
+                    delay = self.backoff(attempt)
+                delay = min(delay, self.max_delay)
+                # A rejected request consumed no tokens at the provider
+                limiter.settle(estimated_tokens, 0)
+                limiter.retries += 1
+                attempt += 1
+                if isinstance(e, openai.RateLimitError):
+                    limiter.throttled += 1
+                    # Everyone queued behind this provider waits out the window,
+                    # not just the request that hit it; acquire() does the waiting.
+                    limiter.pause(delay)
+                    limiter.observe_headers(headers)
+                elif cancel_token is not None:
+                    if cancel_token.wait(delay):
+                        raise GenerationCancelled()
+                else:
+                    time.sleep(delay)
+                continue
+            limiter.observe_headers(getattr(response, "headers", None))
+            return response
+
+    @staticmethod
+    def _is_retryable(error):
+        if isinstance(error, (openai.RateLimitError, openai.APIConnectionError)):
+            return True
+        if isinstance(error, openai.APIStatusError):
+            return error.status_code in (408, 409) or error.status_code >= 500
+        return False
+
+    def stats(self):
+        with self._lock:
+            limiters = dict(self._limiters)
+        return {
+            key: {
+                "waiting": limiter.waiting,
+                "throttled": limiter.throttled,
+                "retries": limiter.retries,
+                "paused_for": max(0.0, limiter.paused_until - time.monotonic()),
+            }
+            for key, limiter in limiters.items()
+        }
+
+# Global instance
+scheduler = RequestScheduler()
@@ -0,0 +1,113 @@
+import json
+import math
+import re
+from collections import Counter, defaultdict
+
+_CAMEL_CASE = re.compile(r"([a-z0-9])([A-Z])")
+_WORD = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by can could do for from how i in is it me my of on or "
+    "please should some that the this to use using what when with would you your".split()
+)
+# Name terms say more about a tool than its prose, so they count several times
+_NAME_WEIGHT = 3
+
+
+def tokenize(text):
+    """Lower-cased word tokens with camelCase/snake_case split and plural "s" stripped."""
+    words = _WORD.findall(_CAMEL_CASE.sub(r"\1 \2", text or "").lower())
+    tokens = []
+    for word in words:
+        if word in _STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        tokens.append(word)
+    return tokens
+
+
+def tool_name(schema):
+    return schema.get("function", {}).get("name", "")
+
+
+def schema_tokens(schema):
+    """Approximate prompt tokens a tool schema costs (~4 characters per token)."""
+    return len(json.dumps(schema, separators=(",", ":"))) // 4 + 1
+
+
+def _document_tokens(schema):
+    function = schema.get("function", {})
+    tokens = tokenize(function.get("name", "")) * _NAME_WEIGHT
+    tokens += tokenize(function.get("description", ""))
+    properties = (function.get("parameters") or {}).get("properties") or {}
+    for param_name, param in properties.items():
+        tokens += tokenize(param_name)
+        if isinstance(param, dict):
+            tokens += tokenize(param.get("description", ""))
+    return tokens
+
+
+class ToolIndex:
+    """BM25 index over tool names, descriptions and parameters.
+
+    Built once when tools are discovered; `select()` then picks the tools
+    relevant to a user turn so only their schemas are sent to the provider.
+    """
+
+    def __init__(self, schemas, k1=1.2, b=0.75):
+        self.schemas = list(schemas)
+        self.names = [tool_name(schema) for schema in self.schemas]
+        self.token_costs = [schema_tokens(schema) for schema in self.schemas]
+        self._cost_by_id = {id(schema): cost for schema, cost in zip(self.schemas, self.token_costs)}
+        self.k1 = k1
+        self.b = b
+
+        self.postings = defaultdict(list)  # term -> [(doc, term frequency)]
+        self.doc_lengths = []
+        for doc, schema in enumerate(self.schemas):
+            counts = Counter(_document_tokens(schema))
+            self.doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings[term].append((doc, tf))
+        count = len(self.schemas)
+        # Guard against an empty catalog or schemas without any text
+        self.avg_length = (sum(self.doc_lengths) / count if count else 0.0) or 1.0
+        self.idf = {
+            term: math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+
+    def scores(self, query):
+        scores = [0.0] * len(self.schemas)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for doc, tf in self.postings[term]:
+                norm = 1 - self.b + self.b * self.doc_lengths[doc] / self.avg_length
+                scores[doc] += idf * tf * (self.k1 + 1) / (tf + self.k1 * norm)
+        return scores
+
+    def select(self, query, k, always_include=(), all_if_unmatched=True):
+        """Top-k schemas for `query` plus any named in `always_include`.
+
+        Results keep catalog order so consecutive turns selecting the same
+        tools send an identical tool list. When nothing matches the query the
+        whole catalog is returned, since pruning blindly could hide the tool
+        the model needs; with `all_if_unmatched` off, only the
+        `always_include` tools are.
+        """
+        scores = self.scores(query)
+        ranked = sorted((doc for doc, score in enumerate(scores) if score > 0), key=lambda doc: -scores[doc])
+        if not ranked and all_if_unmatched:
+            return list(self.schemas)
+        chosen = set(ranked[:k])
+        chosen.update(doc for doc, name in enumerate(self.names) if name in always_include)
+        return [self.schemas[doc] for doc in sorted(chosen)]
+
+    def total_tokens(self):
+        return sum(self.token_costs)
+
+    def tokens_for(self, schemas):
+        """Schema tokens for a selection, using the costs computed at build time."""
+        return sum(self._cost_by_id.get(id(schema)) or schema_tokens(schema) for schema in schemas)
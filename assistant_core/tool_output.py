@@ -0,0 +1,323 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .canonical import canonicalize
+from .cancellation import GenerationCancelled
+from config.settings import settings
+
+HANDLE_PREFIX = "tool-output:"
+_HANDLE = re.compile(r"^tool-output:([0-9a-f]{64})$")
+
+READ_TOOL_OUTPUT = "read_tool_output"
+
+# Local tool the model can use to page through a spilled output by handle
+READ_TOOL_OUTPUT_SCHEMA = canonicalize({
+    "type": "function",
+    "function": {
+        "name": READ_TOOL_OUTPUT,
+        "description": "Read part of a large tool output that was stored instead of being shown in full.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "handle": {"type": "string", "description": "The tool-output:... handle from the truncated result."},
+                "offset": {"type": "integer", "description": "Character offset to start reading from.", "default": 0},
+                "length": {"type": "integer", "description": "Number of characters to read."},
+            },
+            "required": ["handle"],
+        },
+    },
+})
+
+
+class SpillWriter:
+    """Writes one output to the store incrementally, hashing as it goes.
+
+    Chunks are never held in memory as a whole; `commit()` moves the
+    temporary file to its content address and returns the handle.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.size = 0
+        self._hash = hashlib.sha256()
+        fd, self._temp_path = tempfile.mkstemp(dir=store.root, suffix=".part")
+        self._file = os.fdopen(fd, "wb")
+
+    def write(self, text):
+        data = text.encode("utf-8")
+        self._hash.update(data)
+        self._file.write(data)
+        self.size += len(text)
+
+    def commit(self):
+        self._file.close()
+        digest = self._hash.hexdigest()
+        path = self.store.path_for(digest)
+        if os.path.exists(path):
+            # Same content already stored
+            os.remove(self._temp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(self._temp_path, path)
+        return HANDLE_PREFIX + digest
+
+    def discard(self):
+        self._file.close()
+        if os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
+
+
+class ToolOutputStore:
+    """Content-addressed on-disk store for tool outputs too large for the context.
+
+    Outputs are stored under their SHA-256, so the same page fetched twice is
+    stored once and a handle always refers to exactly the same text.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def path_for(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def writer(self):
+        os.makedirs(self.root, exist_ok=True)
+        return SpillWriter(self)
+
+    def put(self, text):
+        writer = self.writer()
+        try:
+            writer.write(text)
+        except Exception:
+            writer.discard()
+            raise
+        return writer.commit()
+
+    def _path_for_handle(self, handle):
+        # Handles come back from the model, so never build a path from anything else
+        match = _HANDLE.match(handle or "")
+        if not match:
+            raise KeyError(f"Invalid tool output handle: {handle!r}")
+        path = self.path_for(match.group(1))
+        if not os.path.exists(path):
+            raise KeyError(f"Unknown tool output handle: {handle}")
+        return path
+
+    def get(self, handle):
+        with open(self._path_for_handle(handle), "r", encoding="utf-8") as f:
+            return f.read()
+
+    def read(self, handle, offset=0, length=None):
+        text = self.get(handle)
+        offset = max(0, int(offset or 0))
+        end = len(text) if length is None else offset + max(0, int(length))
+        return text[offset:end], len(text)
+
+
+def split_chunks(text, chunk_chars):
+    """Split text into chunks of at most chunk_chars, preferring line breaks."""
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(len(text), start + chunk_chars)
+        if end < len(text):
+            newline = text.rfind("\n", start + chunk_chars // 2, end)
+            if newline != -1:
+                end = newline + 1
+        chunks.append(text[start:end])
+        start = end
+    return chunks
+
+
+class MapReduceDigester:
+    """Summarizes a large output chunk by chunk, then merges the partial summaries.
+
+    `summarize(prompt)` is any function returning a completion for a prompt.
+    Partial summaries are merged again in chunks until they fit `chunk_chars`.
+    """
+
+    MAP_PROMPT = (
+        "The following is part {index} of {count} of the output of the tool '{tool}'. "
+        "Summarize the facts it contains that could be relevant, keeping names, numbers and links.\n\n{chunk}"
+    )
+    REDUCE_PROMPT = (
+        "The following are summaries of consecutive parts of the output of the tool '{tool}'. "
+        "Merge them into one concise summary without losing relevant facts.\n\n{chunk}"
+    )
+
+    def __init__(self, summarize, chunk_chars=8000, max_chunks=16, workers=4):
+        self.summarize = summarize
+        self.chunk_chars = chunk_chars
+        self.max_chunks = max_chunks
+        self.workers = workers
+
+    def digest(self, tool_name, text):
+        chunks = split_chunks(text, self.chunk_chars)[:self.max_chunks]
+        prompts = [
+            self.MAP_PROMPT.format(index=i + 1, count=len(chunks), tool=tool_name, chunk=chunk)
+            for i, chunk in enumerate(chunks)
+        ]
+        summaries = self._run(prompts)
+        while len(summaries) > 1:
+            merged = "\n\n".join(summaries)
+            if len(merged) <= self.chunk_chars:
+                return self.summarize(self.REDUCE_PROMPT.format(tool=tool_name, chunk=merged))
+            groups = split_chunks(merged, self.chunk_chars)
+            if len(groups) >= len(summaries):
+                # Summaries are not getting any shorter, stop merging
+                return merged[:self.chunk_chars]
+            summaries = self._run([self.REDUCE_PROMPT.format(tool=tool_name, chunk=group) for group in groups])
+        return summaries[0] if summaries else ""
+
+    def _run(self, prompts):
+        if len(prompts) == 1:
+            return [self.summarize(prompts[0])]
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(prompts))) as executor:
+            return list(executor.map(self.summarize, prompts))
+
+
+class ToolOutputPipeline:
+    """Decides what of a tool's output goes into the conversation history.
+
+    Outputs within the tool's size limit pass through unchanged. Larger ones
+    are spilled to the store and replaced by a preview (or, with a digester,
+    a map-reduce summary) followed by a handle the model can pass to
+    read_tool_output to see the rest.
+    """
+
+    def __init__(self, store, limits=None, preview_chars=2000, digester=None):
+        self.store = store
+        # {"default": max_chars, "<tool name>": max_chars, ...}
+        self.limits = dict(limits or {})
+        self.preview_chars = preview_chars
+        self.digester = digester
+        self.spilled = 0
+
+    @classmethod
+    def from_settings(cls, summarize=None):
+        digester = None
+        if summarize is not None and settings.get_tool_output_digest():
+            digester = MapReduceDigester(summarize)
+        return cls(
+            ToolOutputStore(settings.get_tool_output_dir()),
+            limits=settings.get_tool_output_limits(),
+            preview_chars=settings.get_tool_output_preview_chars(),
+            digester=digester,
+        )
+
+    def limit_for(self, tool_name):
+        return self.limits.get(tool_name, self.limits.get("default", 16000))
+
+    def accumulator(self, tool_name, forward=None):
+        """An OutputAccumulator collecting one tool output, streamed or not."""
+        return OutputAccumulator(self, tool_name, forward)
+
+    def spill(self, tool_name, handle, size, head):
+        """History entry for an output of `size` characters stored under `handle`.
+
+        `head` is the start of the output (at least preview_chars of it);
+        digestion reads the whole output back from the store.
+        """
+        self.spilled += 1
+        limit = self.limit_for(tool_name)
+        if self.digester is not None:
+            try:
+                summary = self.digester.digest(tool_name, self.store.get(handle))
+                return (f"[Summary of the {size}-character output of '{tool_name}'. "
+                        f"Full output: {handle} (use {READ_TOOL_OUTPUT} to read it)]\n{summary[:limit]}")
+            except Exception as e:
+                print(f"Could not digest output of {tool_name}, falling back to a preview: {e}")
+        preview = head[:min(self.preview_chars, limit)]
+        return (f"{preview}\n[Output of '{tool_name}' truncated: showing {len(preview)} of {size} characters. "
+                f"Full output: {handle} (use {READ_TOOL_OUTPUT} with an offset to read more)]")
+
+    def read(self, handle, offset=0, length=None):
+        """Result of the read_tool_output tool."""
+        length = min(int(length or self.preview_chars), self.limit_for(READ_TOOL_OUTPUT))
+        try:
+            text, total = self.store.read(handle, offset, length)
+        except (KeyError, ValueError) as e:
+            return f"Error: {e}"
+        end = int(offset or 0) + len(text)
+        if end < total:
+            return f"{text}\n[Characters {offset or 0}-{end} of {total}; continue with offset={end}]"
+        return text
+
+
+class OutputAccumulator:
+    """Collects a tool output chunk by chunk (a plain result is one chunk).
+
+    Chunks are kept in memory only while the total stays within the tool's
+    limit. Past it, what was collected goes to a SpillWriter and every later
+    chunk is written straight to disk, so a huge output is never held in
+    memory. `forward(chunk)`, if given, receives the chunks as they arrive
+    (for display), also capped at the tool's limit.
+    """
+
+    def __init__(self, pipeline, tool_name, forward=None):
+        self.pipeline = pipeline
+        self.tool_name = tool_name
+        self.forward = forward
+        self.limit = pipeline.limit_for(tool_name)
+        self.size = 0
+        self.closed = False
+        self._parts = []
+        self._head = None
+        self._writer = None
+        self._forwarded = 0
+        # write() runs on the request thread, close() on the cancelling one
+        self._lock = threading.Lock()
+
+    def write(self, text):
+        with self._lock:
+            if self.closed:
+                # The turn was cancelled; close() already dropped the output
+                raise GenerationCancelled()
+            if not text:
+                return
+            text = str(text)
+            self._forward(text)
+            self.size += len(text)
+            if self._writer is None:
+                self._parts.append(text)
+                if not self.limit or self.size <= self.limit:
+                    return
+                buffered = "".join(self._parts)
+                self._parts = []
+                self._head = buffered[:self.pipeline.preview_chars]
+                self._writer = self.pipeline.store.writer()
+                text = buffered
+            self._writer.write(text)
+
+    def _forward(self, text):
+        if self.forward is None:
+            return
+        if not self.limit or self._forwarded + len(text) <= self.limit:
+            self.forward(text)
+        elif self._forwarded < self.limit:
+            self.forward(text[:self.limit - self._forwarded] + "\n[... output continues, stored on disk]")
+        self._forwarded += len(text)
+
+    def close(self):
+        """Stop accepting output and drop it (partial spill file included); called on cancel."""
+        with self._lock:
+            self.closed = True
+            self.discard()
+
+    def discard(self):
+        if self._writer is not None:
+            self._writer.discard()
+            self._writer = None
+        self._parts = []
+
+    def finish(self):
+        """The history entry for everything written so far."""
+        if self._writer is None:
+            return "".join(self._parts)
+        handle = self._writer.commit()
+        self._writer = None
+        return self.pipeline.spill(self.tool_name, handle, self.size, self._head)
@@ -0,0 +1,55 @@
+import argparse
+
+from assistant_core.batch import BatchRunner
+from assistant_core.cassette import Cassette, set_cassette
+from assistant_core.process_manager import process_manager
+
+
+def print_summary(summary):
+    print(f"Processed {summary['processed']} prompts "
+          f"({summary['succeeded']} ok, {summary['failed']} failed, {summary['skipped']} skipped from checkpoint)")
+    print(f"Elapsed: {summary['elapsed']:.2f}s  Throughput: {summary['throughput']:.2f} prompts/s")
+    latency = summary["latency"]
+    if latency["count"]:
+        print("Latency: " + "  ".join(
+            f"{key}={latency[key]:.3f}s" for key in ("mean", "p50", "p90", "p95", "p99", "max")
+        ))
+    for name, cache in summary["prefix_cache"].items():
+        print(f"Prompt cache ({name}): {cache['token_hit_rate']:.1%} of {cache['prompt_tokens']} prompt tokens cached, "
+              f"{cache['request_hit_rate']:.1%} of {cache['requests']} requests hit")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run prompts from a JSONL file through the assistant without the GUI.")
+    parser.add_argument("input", help="JSONL file of prompts ({\"id\": ..., \"prompt\": ...} per line)")
+    parser.add_argument("output", help="JSONL file results are appended to as they finish")
+    parser.add_argument("--workers", type=int, default=4, help="Number of concurrent sessions")
+    parser.add_argument("--provider", help="Override the provider selected in config.json")
+    parser.add_argument("--model", help="Override the model selected in config.json")
+    parser.add_argument("--no-resume", action="store_true", help="Overwrite the output instead of resuming from it")
+    parser.add_argument("--start-servers", action="store_true", help="Launch the configured MCP server processes first")
+    cassette_group = parser.add_mutually_exclusive_group()
+    cassette_group.add_argument("--record", metavar="CASSETTE", help="Record provider and MCP traffic to this file")
+    cassette_group.add_argument("--replay", metavar="CASSETTE", help="Serve provider and MCP traffic from this recording")
+    parser.add_argument("--realtime", action="store_true", help="Replay with the recorded timings instead of as fast as possible")
+    args = parser.parse_args()
+
+    if args.record or args.replay:
+        mode = "record" if args.record else "replay"
+        set_cassette(Cassette(args.record or args.replay, mode, realtime=args.realtime))
+
+    if args.start_servers:
+        process_manager.start_servers()
+
+    runner = BatchRunner(
+        args.input,
+        args.output,
+        workers=args.workers,
+        provider_name=args.provider,
+        model_name=args.model,
+        resume=not args.no_resume,
+    )
+    print_summary(runner.run())
+
+if __name__ == "__main__":
+    main()
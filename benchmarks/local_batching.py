@@ -0,0 +1,89 @@
+"""Throughput vs latency of the embedded CPU engine at concurrency 1-16.
+
+Each level runs `concurrency` generations at once, first with batching off
+(max_batch=1, requests are decoded one after another) and then with
+continuous batching. Needs torch and transformers, and downloads the model
+on first use.
+
+    python -m benchmarks.local_batching [--model Qwen/Qwen2.5-0.5B-Instruct] [--tokens 64]
+"""
+import argparse
+import threading
+import time
+
+from assistant_core.local_inference import LocalEngine, TorchBackend
+from assistant_core.metrics import percentile
+
+PROMPTS = [
+    "Explain what a hash table is.",
+    "Write a haiku about autumn.",
+    "List three uses of Python decorators.",
+    "What causes the seasons on Earth?",
+    "Summarize the plot of Hamlet in two sentences.",
+    "Give a short tip for writing unit tests.",
+    "What is the difference between TCP and UDP?",
+    "Describe a cat to someone who has never seen one.",
+]
+
+
+def run_level(engine, concurrency, max_new_tokens):
+    latencies = [None] * concurrency
+    first_tokens = [None] * concurrency
+    counts = [0] * concurrency
+
+    def run(i):
+        messages = [{"role": "user", "content": PROMPTS[i % len(PROMPTS)] + f" (#{i})"}]
+        started = time.perf_counter()
+        for _ in engine.generate(messages, max_new_tokens=max_new_tokens):
+            if first_tokens[i] is None:
+                first_tokens[i] = time.perf_counter() - started
+            counts[i] += 1
+        latencies[i] = time.perf_counter() - started
+
+    steps, batched = engine.steps, engine.batched_tokens
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    steps, batched = engine.steps - steps, engine.batched_tokens - batched
+    return {
+        # Text pieces are close to one per token
+        "throughput": sum(counts) / elapsed,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "ttft": percentile([t for t in first_tokens if t is not None], 50),
+        "batch": batched / steps if steps else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default="Qwen/Qwen2.5-0.5B-Instruct")
+    parser.add_argument("--tokens", type=int, default=64, help="New tokens per request")
+    parser.add_argument("--levels", default="1,2,4,8,16")
+    args = parser.parse_args()
+    levels = [int(level) for level in args.levels.split(",")]
+
+    # One loaded model shared by both engines so only the scheduling differs
+    backend = TorchBackend(args.model)
+    backend.load()
+    engines = {
+        "sequential": LocalEngine(args.model, backend=backend, max_batch=1, max_cached_prefixes=0),
+        "batched": LocalEngine(args.model, backend=backend, max_batch=max(levels), max_cached_prefixes=0),
+    }
+    # Warm-up
+    list(engines["batched"].generate([{"role": "user", "content": "Hi"}], max_new_tokens=4))
+
+    print(f"{'mode':<11}{'conc':>5}{'tok/s':>9}{'p50 s':>8}{'p95 s':>8}{'ttft s':>8}{'batch':>7}")
+    for concurrency in levels:
+        for mode, engine in engines.items():
+            result = run_level(engine, concurrency, args.tokens)
+            print(f"{mode:<11}{concurrency:>5}{result['throughput']:>9.1f}{result['p50']:>8.2f}"
+                  f"{result['p95']:>8.2f}{result['ttft']:>8.2f}{result['batch']:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Query and append latency of the long-term memory index.
+
+Fills a temporary MemoryIndex with embedded synthetic snippets, then times
+top-k queries and single-snippet appends.
+
+    python -m benchmarks.memory_index [--snippets 300000] [--queries 200]
+"""
+import argparse
+import random
+import shutil
+import tempfile
+import time
+
+from assistant_core.memory import HashedNgramEmbedder, MemoryIndex
+from assistant_core.metrics import percentile
+
+WORDS = (
+    "server port config fetch file python error timeout model token cache request user "
+    "assistant memory index query tool schema stream batch latency window thread process "
+    "budget report meeting travel invoice recipe garden music movie weather project"
+).split()
+
+
+def snippet(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 40)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--snippets", type=int, default=300000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    embedder = HashedNgramEmbedder()
+    directory = tempfile.mkdtemp()
+    try:
+        index = MemoryIndex(directory, dim=embedder.dim)
+        started = time.perf_counter()
+        for start in range(0, args.snippets, 10000):
+            texts = [snippet(rng) for _ in range(min(10000, args.snippets - start))]
+            index.add(embedder.embed_batch(texts), [{"text": text} for text in texts])
+        print(f"Indexed {index.count} snippets in {time.perf_counter() - started:.1f}s")
+
+        queries = [embedder.embed(snippet(rng)) for _ in range(args.queries)]
+        timings = []
+        for query in queries:
+            started = time.perf_counter()
+            index.search(query, k=args.k)
+            timings.append(time.perf_counter() - started)
+        print(f"Query (top-{args.k}): p50 {percentile(timings, 50) * 1000:.2f} ms, p95 {percentile(timings, 95) * 1000:.2f} ms")
+
+        timings = []
+        for _ in range(100):
+            text = snippet(rng)
+            started = time.perf_counter()
+            index.add(embedder.embed_batch([text]), [{"text": text}])
+            timings.append(time.perf_counter() - started)
+        print(f"Append: p50 {percentile(timings, 50) * 1000:.2f} ms, p95 {percentile(timings, 95) * 1000:.2f} ms")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Memory and request-building cost of a long conversation history.
+
+Compares the previous representation (SDK ChatCompletionMessage objects mixed
+with plain dicts, sent with completions.create) against MessageHistory (sent
+as a body joined from each message's cached JSON) over a 5,000-message
+history. Request building is timed up to the bytes handed to the HTTP
+client; nothing is sent.
+
+    python -m benchmarks.message_memory [--messages 5000] [--turns 50]
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+import openai
+from openai.types.chat import ChatCompletionMessage
+
+from assistant_core.messages import MessageHistory
+from assistant_core.providers import OpenAIProvider
+
+
+def build_raw_history(count):
+    """user -> assistant tool call -> tool result -> assistant answer, repeated."""
+    messages = []
+    i = 0
+    while len(messages) < count:
+        call_id = f"call_{i:06d}"
+        messages.append({"role": "user", "content": f"Look up record {i} and summarize it."})
+        messages.append(ChatCompletionMessage.model_validate({
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [{
+                "id": call_id,
+                "type": "function",
+                "function": {"name": "lookup_record", "arguments": json.dumps({"id": i, "fields": ["title", "body"]})},
+            }],
+        }))
+        messages.append({"role": "tool", "tool_call_id": call_id, "name": "lookup_record",
+                         "content": f"Record {i}: " + "lorem ipsum " * 20})
+        messages.append(ChatCompletionMessage.model_validate({
+            "role": "assistant", "content": f"Record {i} is about lorem ipsum.",
+        }))
+        i += 1
+    return messages[:count]
+
+
+def old_request_messages(messages):
+    return [m.model_dump(exclude_none=True) if hasattr(m, "model_dump") else m for m in messages]
+
+
+class NotSent(Exception):
+    pass
+
+
+def offline_client(sent):
+    """An SDK client whose HTTP layer records the size of each request body instead of sending it."""
+    client = openai.OpenAI(api_key="benchmark", base_url="http://127.0.0.1:9/v1", max_retries=0)
+
+    def send(request, **kwargs):
+        sent.append(len(request.read()))
+        raise NotSent()
+    client._client.send = send
+    return client
+
+
+def build_request(send):
+    try:
+        send()
+    except (NotSent, openai.APIConnectionError):
+        # Some SDK versions wrap transport errors
+        pass
+
+
+def measure(build):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    value = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return value, current
+
+
+def time_turns(history, turns, append, request):
+    """Mean time to build the request body after each new turn."""
+    elapsed = 0.0
+    for turn in range(turns):
+        append(history, {"role": "user", "content": f"follow-up {turn}"})
+        started = time.perf_counter()
+        request(history)
+        elapsed += time.perf_counter() - started
+    return elapsed / turns
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--turns", type=int, default=50)
+    args = parser.parse_args()
+
+    raw, raw_bytes = measure(lambda: build_raw_history(args.messages))
+    # Built from scratch inside the measurement so content strings are counted too
+    history, history_bytes = measure(lambda: MessageHistory(old_request_messages(build_raw_history(args.messages))))
+    old_sent, new_sent = [], []
+    client = offline_client(old_sent)
+    provider = OpenAIProvider(api_key="benchmark", model="benchmark")
+    provider.client = offline_client(new_sent)
+
+    def old_request(messages):
+        build_request(lambda: client.chat.completions.create(model="benchmark", messages=messages))
+
+    def new_request(history):
+        body = provider._chat_body({"model": "benchmark", "messages": history})
+        build_request(lambda: provider._post_chat(body, False))
+
+    # Warm the per-message caches as the first request would
+    new_request(history)
+    old_turn = time_turns(list(raw), args.turns, list.append, old_request)
+    new_turn = time_turns(history, args.turns, MessageHistory.append, new_request)
+
+    print(f"{args.messages} messages")
+    print(f"  SDK objects + dicts: {raw_bytes / 1024:10.1f} KiB")
+    print(f"  MessageHistory:      {history_bytes / 1024:10.1f} KiB  ({history_bytes / raw_bytes:.0%})")
+    print(f"Request body building, mean over {args.turns} turns (last body {new_sent[-1] / 1024:.0f} KiB)")
+    print(f"  completions.create:  {old_turn * 1000:8.3f} ms")
+    print(f"  cached message JSON: {new_turn * 1000:8.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -92,5 +92,163 @@ class Settings:
     def set_remote_transformers_url(self, url):
         self.set("remote_transformers_url", url)
 
+    # Per-provider rate limits, e.g. {"groq": {"requests_per_minute": 30, "tokens_per_minute": 6000}}
+    def get_rate_limits(self):
+        return self.get("rate_limits", {})
+
+    def set_rate_limits(self, limits):
+        self.set("rate_limits", limits)
+
+    # Fallback provider chain, e.g. [{"provider": "local_transformers", "model": "..."}, ...]
+    def get_fallback_chain(self):
+        return self.get("fallback_chain", [])
+
+    def set_fallback_chain(self, chain):
+        self.set("fallback_chain", chain)
+
+    # Number of most relevant tool schemas sent per turn (0 sends all of them)
+    def get_tool_top_k(self):
+        return self.get("tool_top_k", 8)
+
+    def set_tool_top_k(self, top_k):
+        self.set("tool_top_k", top_k)
+
+    def get_hedging_enabled(self):
+        return self.get("hedging_enabled", True)
+
+    def set_hedging_enabled(self, enabled):
+        self.set("hedging_enabled", enabled)
+
+    # Max characters of a tool's output kept in history, e.g. {"default": 16000, "fetch": 4000}
+    def get_tool_output_limits(self):
+        return self.get("tool_output_limits", {"default": 16000})
+
+    def set_tool_output_limits(self, limits):
+        self.set("tool_output_limits", limits)
+
+    def get_tool_output_preview_chars(self):
+        return self.get("tool_output_preview_chars", 2000)
+
+    def set_tool_output_preview_chars(self, chars):
+        self.set("tool_output_preview_chars", chars)
+
+    # Summarize oversized tool outputs with the model instead of truncating them
+    def get_tool_output_digest(self):
+        return self.get("tool_output_digest", False)
+
+    def set_tool_output_digest(self, enabled):
+        self.set("tool_output_digest", enabled)
+
+    # Where oversized tool outputs are stored
+    def get_tool_output_dir(self):
+        return self.get("tool_output_dir", "tool_outputs")
+
+    def set_tool_output_dir(self, path):
+        self.set("tool_output_dir", path)
+
+    # Hugging Face model ids offered for in-process (embedded) CPU inference
+    def get_embedded_models(self):
+        return self.get("embedded_models", ["Qwen/Qwen2.5-0.5B-Instruct"])
+
+    def set_embedded_models(self, models):
+        self.set("embedded_models", models)
+
+    def get_embedded_max_new_tokens(self):
+        return self.get("embedded_max_new_tokens", 512)
+
+    def set_embedded_max_new_tokens(self, max_new_tokens):
+        self.set("embedded_max_new_tokens", max_new_tokens)
+
+    # Concurrent generations decoded together by the embedded engine
+    def get_embedded_max_batch(self):
+        return self.get("embedded_max_batch", 8)
+
+    def set_embedded_max_batch(self, max_batch):
+        self.set("embedded_max_batch", max_batch)
+
+    # How long an idle embedded engine waits for more requests to batch with the first
+    def get_embedded_batch_window_ms(self):
+        return self.get("embedded_batch_window_ms", 10)
+
+    def set_embedded_batch_window_ms(self, window_ms):
+        self.set("embedded_batch_window_ms", window_ms)
+
+    # Conversation turns (GUI tabs) run at the same time; each tab runs one at a time
+    def get_turn_workers(self):
+        return self.get("turn_workers", 4)
+
+    def set_turn_workers(self, workers):
+        self.set("turn_workers", workers)
+
+    # Long-term memory: past turns are indexed and the most relevant ones recalled
+    def get_memory_enabled(self):
+        return self.get("memory_enabled", False)
+
+    def set_memory_enabled(self, enabled):
+        self.set("memory_enabled", enabled)
+
+    def get_memory_dir(self):
+        return self.get("memory_dir", "memory")
+
+    def set_memory_dir(self, path):
+        self.set("memory_dir", path)
+
+    def get_memory_top_k(self):
+        return self.get("memory_top_k", 3)
+
+    def set_memory_top_k(self, top_k):
+        self.set("memory_top_k", top_k)
+
+    def get_memory_min_score(self):
+        return self.get("memory_min_score", 0.25)
+
+    def set_memory_min_score(self, min_score):
+        self.set("memory_min_score", min_score)
+
+    # Managed server processes: output kept per process, longest restart delay
+    def get_process_log_bytes(self):
+        return self.get("process_log_bytes", 65536)
+
+    def set_process_log_bytes(self, size):
+        self.set("process_log_bytes", size)
+
+    def get_process_max_backoff(self):
+        return self.get("process_max_backoff", 60)
+
+    def set_process_max_backoff(self, seconds):
+        self.set("process_max_backoff", seconds)
+
+    # Record/replay of provider and MCP traffic: "off", "record" or "replay"
+    def get_cassette_mode(self):
+        return self.get("cassette_mode", "off")
+
+    def set_cassette_mode(self, mode):
+        self.set("cassette_mode", mode)
+
+    def get_cassette_path(self):
+        return self.get("cassette_path", "cassettes/traffic.jsonl")
+
+    def set_cassette_path(self, path):
+        self.set("cassette_path", path)
+
+    def get_cassette_realtime(self):
+        return self.get("cassette_realtime", False)
+
+    def set_cassette_realtime(self, realtime):
+        self.set("cassette_realtime", realtime)
+
+    # Per-turn profiling (cProfile + tracemalloc); also on with ASSISTANT_PROFILE=1
+    def get_profile_turns(self):
+        return self.get("profile_turns", False)
+
+    def set_profile_turns(self, enabled):
+        self.set("profile_turns", enabled)
+
+    def get_profile_dir(self):
+        return self.get("profile_dir", "profiles")
+
+    def set_profile_dir(self, path):
+        self.set("profile_dir", path)
+
 # Global settings instance
 settings = Settings()
@@ -0,0 +1,204 @@
+import tkinter as tk
+from tkinter import messagebox
+import ttkbootstrap as ttk
+from assistant_core.conversation import Conversation
+from .dialogs import EditPromptDialog
+
+PLACEHOLDER = "Type your message here..."
+
+class ChatTab(ttk.Frame):
+    """One conversation: its transcript, input box and Send/Stop buttons.
+
+    Every tab has its own Conversation (history, queue, Stop) but they all
+    share the turn executor and the MCP tool catalog passed in by the window.
+    The branch selector switches between the conversation's branches, and
+    "Edit Prompt..." re-asks an earlier prompt on a new branch.
+    """
+
+    def __init__(self, parent, catalog=None):
+        super().__init__(parent, padding="10")
+        self._closed = False
+        # Outlives the tab, so callbacks from turns still finishing can be scheduled
+        self._window = self.winfo_toplevel()
+        self._create_widgets()
+
+        # Turns are queued and run one at a time; the assistant itself is
+        # created on the first turn and follows provider/model changes.
+        self.conversation = Conversation(catalog=catalog)
+
+    def _create_widgets(self):
+        # Branch frame
+        branch_frame = ttk.Frame(self)
+        branch_frame.pack(fill="x", pady=(0, 10))
+
+        ttk.Label(branch_frame, text="Branch:").pack(side="left")
+        self.branch_var = tk.StringVar(self, value="main")
+        self.branch_menu = ttk.Combobox(branch_frame, textvariable=self.branch_var, values=["main"], state="readonly", width=20)
+        self.branch_menu.pack(side="left", padx=5)
+        self.branch_menu.bind("<<ComboboxSelected>>", self._on_branch_changed)
+        ttk.Button(branch_frame, text="Edit Prompt...", command=self.on_edit_prompt, style="secondary.TButton").pack(side="left", padx=5)
+
+        # Chat frame
+        chat_frame = ttk.Frame(self)
+        chat_frame.pack(fill="both", expand=True)
+
+        self.output_text = tk.Text(chat_frame, height=15, wrap="word")
+        self.output_text.pack(fill="both", expand=True)
+
+        # Input frame
+        input_frame = ttk.Frame(self)
+        input_frame.pack(fill="x", pady=(10, 0))
+
+        self.input_text = tk.Text(input_frame, height=4, wrap="word")
+        self.input_text.pack(side="left", fill="x", expand=True, padx=(0, 10))
+
+        # Add placeholder text
+        self.input_text.insert("1.0", PLACEHOLDER)
+        self.input_text.config(foreground="gray")
+        self.input_text.bind("<FocusIn>", self._on_input_focus_in)
+        self.input_text.bind("<FocusOut>", self._on_input_focus_out)
+
+        button_frame = ttk.Frame(input_frame)
+        button_frame.pack(side="right")
+
+        self.send_button = ttk.Button(button_frame, text="Send", command=self.on_send, style="primary.TButton")
+        self.send_button.pack(fill="x")
+
+        self.stop_button = ttk.Button(button_frame, text="Stop", command=self.on_stop, style="danger.TButton", state="disabled")
+        self.stop_button.pack(fill="x", pady=(5, 0))
+
+        # Configure text tags for chat display
+        self.output_text.tag_configure("user", foreground="black")
+        self.output_text.tag_configure("assistant", foreground="blue")
+        self.output_text.tag_configure("error", foreground="red")
+        self.output_text.tag_configure("tool", foreground="gray")
+        # Name of the tool whose streamed output is currently being shown
+        self._tool_output_open = None
+
+    def on_send(self):
+        user_input = self.input_text.get("1.0", tk.END).strip()
+        if not user_input or user_input == PLACEHOLDER:
+            return
+
+        # Turns sent while another one is running wait for it in the queue
+        self.conversation.submit(user_input, **self._turn_callbacks())
+        self.stop_button.config(state="normal")
+
+        self.input_text.delete("1.0", tk.END)
+
+    def _turn_callbacks(self):
+        def on_start(turn):
+            self._post(lambda: self._start_streaming(turn))
+
+        def stream_callback(token):
+            self._post(lambda: self._update_streaming_output(token))
+
+        def on_tool_output(tool_name, chunk):
+            self._post(lambda: self._update_tool_output(tool_name, chunk))
+
+        def on_done(turn):
+            self._post(lambda: self._finish_streaming(turn))
+
+        return {
+            "stream_callback": stream_callback,
+            "on_start": on_start,
+            "on_done": on_done,
+            "on_tool_output": on_tool_output,
+        }
+
+    def on_edit_prompt(self):
+        if self.conversation.busy:
+            messagebox.showwarning("Busy", "Stop or wait for the current answer first.", parent=self)
+            return
+        prompts = [(i, message.content) for i, message in enumerate(self.conversation.history) if message.role == "user"]
+        if not prompts:
+            return
+        editor = EditPromptDialog(self, prompts)
+        if editor.result:
+            index, text = editor.result
+            self.conversation.edit(index, text, **self._turn_callbacks())
+            self._show_branch()
+            self.stop_button.config(state="normal")
+
+    def _on_branch_changed(self, event=None):
+        name = self.branch_var.get()
+        try:
+            self.conversation.switch(name)
+        except RuntimeError as e:
+            messagebox.showwarning("Busy", str(e), parent=self)
+        self._show_branch()
+
+    def _show_branch(self):
+        """Redraw the transcript from the current branch's history."""
+        self.branch_menu["values"] = list(self.conversation.histories)
+        self.branch_var.set(self.conversation.branch)
+        self._tool_output_open = None
+        self.output_text.delete("1.0", tk.END)
+        for message in self.conversation.history:
+            if message.role == "user":
+                self.output_text.insert(tk.END, f"> You: {message.content}\n", "user")
+            elif message.role == "assistant" and message.content:
+                self.output_text.insert(tk.END, "> Assistant: ", "assistant")
+                self.output_text.insert(tk.END, f"{message.content}\n\n")
+        self.output_text.see(tk.END)
+
+    def on_stop(self):
+        self.conversation.cancel()
+
+    def close(self):
+        """Stop this conversation's turns and remove the tab."""
+        self._closed = True
+        self.conversation.cancel()
+        self.destroy()
+
+    def _post(self, callback):
+        # Use after() to schedule UI updates on the main thread; a closed
+        # tab's widgets are gone, so late tokens are dropped
+        if not self._closed:
+            self._window.after(0, lambda: None if self._closed else callback())
+
+    def _on_input_focus_in(self, event):
+        if self.input_text.get("1.0", tk.END).strip() == PLACEHOLDER:
+            self.input_text.delete("1.0", tk.END)
+            self.input_text.config(foreground="black")
+
+    def _on_input_focus_out(self, event):
+        if not self.input_text.get("1.0", tk.END).strip():
+            self.input_text.insert("1.0", PLACEHOLDER)
+            self.input_text.config(foreground="gray")
+
+    def _start_streaming(self, turn):
+        """Show the user's message and the assistant header when a turn starts."""
+        self.output_text.insert(tk.END, f"> You: {turn.user_input}\n", "user")
+        self.output_text.insert(tk.END, "> Assistant: ", "assistant")
+        self.output_text.see(tk.END)
+
+    def _update_streaming_output(self, token):
+        """Update the streaming output on the main thread."""
+        if self._tool_output_open:
+            self.output_text.insert(tk.END, "\n")
+            self._tool_output_open = None
+        self.output_text.insert(tk.END, token)
+        self.output_text.see(tk.END)
+
+    def _update_tool_output(self, tool_name, chunk):
+        """Show output of a tool that streams its result, as it arrives."""
+        if self._tool_output_open != tool_name:
+            self.output_text.insert(tk.END, f"\n[{tool_name}]\n", "tool")
+            self._tool_output_open = tool_name
+        self.output_text.insert(tk.END, chunk, "tool")
+        self.output_text.see(tk.END)
+
+    def _finish_streaming(self, turn):
+        """Finish the streaming response on the main thread."""
+        self._tool_output_open = None
+        # Queued turns that were cancelled before starting have nothing on screen
+        if turn.started:
+            if turn.status == "cancelled":
+                self.output_text.insert(tk.END, " [stopped]", "error")
+            elif turn.status == "error":
+                self.output_text.insert(tk.END, turn.result, "error")
+            self.output_text.insert(tk.END, "\n\n")
+            self.output_text.see(tk.END)
+        if not self.conversation.busy:
+            self.stop_button.config(state="disabled")
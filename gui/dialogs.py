@@ -1,6 +1,7 @@
 import tkinter as tk
 from tkinter import ttk, simpledialog, messagebox
 from config.settings import settings
+from assistant_core.process_manager import process_manager
 
 class ApiKeysDialog(simpledialog.Dialog):
     def body(self, master):
@@ -98,8 +99,67 @@ class MCPManagerDialog(tk.Toplevel):
         tk.Button(btn_frame, text="Remove", command=self.remove_server).pack(side="left", padx=5)
         btn_frame.pack(pady=5)
 
+        # Processes started by the app, refreshed every second
+        tk.Label(self, text="Running processes:").pack(anchor="w", padx=10)
+        columns = ("Name", "PID", "Status", "CPU", "Memory", "Restarts")
+        self.process_tree = ttk.Treeview(self, columns=columns, show="headings", height=5)
+        for column in columns:
+            self.process_tree.heading(column, text=column)
+            self.process_tree.column(column, width=140 if column == "Name" else 80)
+        self.process_tree.pack(padx=10, pady=5, fill="both", expand=True)
+
+        process_btn_frame = tk.Frame(self)
+        tk.Button(process_btn_frame, text="Show Log", command=self.show_log).pack(side="left", padx=5)
+        tk.Button(process_btn_frame, text="Restart", command=self.restart_process).pack(side="left", padx=5)
+        process_btn_frame.pack(pady=5)
+
+        self._refresh_id = None
+        self.refresh_processes()
+
         self.wait_window(self)
 
+    def destroy(self):
+        if self._refresh_id is not None:
+            self.after_cancel(self._refresh_id)
+            self._refresh_id = None
+        super().destroy()
+
+    def refresh_processes(self):
+        selected = self.process_tree.focus()
+        for i in self.process_tree.get_children():
+            self.process_tree.delete(i)
+        self._process_names = []
+        for i, info in enumerate(process_manager.stats()):
+            self._process_names.append(info["name"])
+            memory = f"{info['rss'] / 2**20:.0f} MB (peak {info['peak_rss'] / 2**20:.0f})"
+            status = info["status"]
+            if info["exit_code"] is not None and status != "running":
+                status = f"{status} ({info['exit_code']})"
+            self.process_tree.insert("", "end", iid=i, values=(
+                info["name"], info["pid"] or "", status, f"{info['cpu_percent']:.0f}%", memory, info["restarts"],
+            ))
+        if selected and self.process_tree.exists(selected):
+            self.process_tree.focus(selected)
+            self.process_tree.selection_set(selected)
+        self._refresh_id = self.after(1000, self.refresh_processes)
+
+    def _selected_process(self):
+        selected_item = self.process_tree.focus()
+        if not selected_item:
+            messagebox.showwarning("No Selection", "Please select a process.", parent=self)
+            return None
+        return self._process_names[int(selected_item)]
+
+    def show_log(self):
+        name = self._selected_process()
+        if name:
+            ProcessLogDialog(self, name)
+
+    def restart_process(self):
+        name = self._selected_process()
+        if name and messagebox.askyesno("Confirm", f"Restart {name}?", parent=self):
+            process_manager.restart_process(name)
+
     def populate_tree(self):
         for i in self.tree.get_children():
             self.tree.delete(i)
@@ -138,6 +198,32 @@ class MCPManagerDialog(tk.Toplevel):
             self.populate_tree()
 
 
+class ProcessLogDialog(tk.Toplevel):
+    """Recent output (stdout and stderr) of a managed process."""
+
+    def __init__(self, parent, name):
+        super().__init__(parent)
+        self.title(f"{name} log")
+        self.transient(parent)
+        self.name = name
+
+        self.text = tk.Text(self, height=25, width=100, wrap="none")
+        self.text.pack(padx=10, pady=10, fill="both", expand=True)
+        tk.Button(self, text="Refresh", command=self.refresh).pack(pady=5)
+        self.refresh()
+
+    def refresh(self):
+        managed = process_manager.get(self.name)
+        self.text.delete("1.0", tk.END)
+        if managed is None:
+            self.text.insert(tk.END, "Process is no longer managed.")
+            return
+        if managed.log.dropped:
+            self.text.insert(tk.END, f"[{managed.log.dropped} earlier lines dropped]\n")
+        self.text.insert(tk.END, managed.log.text())
+        self.text.see(tk.END)
+
+
 class RemoteTransformersUrlDialog(simpledialog.Dialog):
     def body(self, master):
         self.title("Configure Remote Transformers URL")
@@ -150,4 +236,37 @@ class RemoteTransformersUrlDialog(simpledialog.Dialog):
     def apply(self):
         url = self.url_var.get().strip()
         settings.set_remote_transformers_url(url)
-        messagebox.showinfo("Saved", "Remote Transformers URL saved.", parent=self)
\ No newline at end of file
+        messagebox.showinfo("Saved", "Remote Transformers URL saved.", parent=self)
+
+class EditPromptDialog(simpledialog.Dialog):
+    """Pick one of the conversation's earlier prompts and change its text."""
+
+    def __init__(self, parent, prompts):
+        # prompts: list of (history index, text)
+        self.prompts = prompts
+        super().__init__(parent, "Edit Prompt")
+
+    def body(self, master):
+        tk.Label(master, text="Prompt:").grid(row=0, column=0, sticky="w", padx=5, pady=5)
+        labels = [f"{n + 1}. {text[:60]}" for n, (_, text) in enumerate(self.prompts)]
+        self.prompt_menu = ttk.Combobox(master, values=labels, state="readonly", width=60)
+        self.prompt_menu.grid(row=0, column=1, padx=5, pady=5)
+        self.prompt_menu.bind("<<ComboboxSelected>>", self.on_prompt_select)
+
+        tk.Label(master, text="New text:").grid(row=1, column=0, sticky="nw", padx=5, pady=5)
+        self.text = tk.Text(master, height=6, width=60, wrap="word")
+        self.text.grid(row=1, column=1, padx=5, pady=5)
+
+        # The latest prompt is the one usually edited
+        self.prompt_menu.current(len(labels) - 1)
+        self.on_prompt_select()
+        return self.text
+
+    def on_prompt_select(self, event=None):
+        self.text.delete("1.0", tk.END)
+        self.text.insert("1.0", self.prompts[self.prompt_menu.current()][1])
+
+    def apply(self):
+        text = self.text.get("1.0", tk.END).strip()
+        if text:
+            self.result = (self.prompts[self.prompt_menu.current()][0], text)
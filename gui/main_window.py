@@ -1,8 +1,10 @@
 import tkinter as tk
+from tkinter import messagebox
 import ttkbootstrap as ttk
-import threading
-from assistant_core.assistant import Assistant
-from assistant_core.providers import OpenAIProvider, GroqProvider, LocalTransformersProvider, RemoteTransformersProvider
+from assistant_core.assistant import ToolCatalog
+from assistant_core.executor import turn_executor
+from assistant_core.providers import OpenAIProvider, GroqProvider, LocalTransformersProvider, RemoteTransformersProvider, EmbeddedTransformersProvider, FallbackProvider
+from .chat_tab import ChatTab
 from .dialogs import MCPManagerDialog, ApiKeysDialog, RemoteTransformersUrlDialog
 from config.settings import settings
 from assistant_core.process_manager import process_manager
@@ -23,16 +25,22 @@ class MainWindow(ttk.Window):
         self._create_menu()
         self._create_widgets()
 
-        # Assistant will be initialized on the first `on_send` call
-        self.assistant = None
+        # MCP tools are discovered once for all the tabs
+        self.catalog = ToolCatalog()
+        self._conversation_count = 0
+        self.new_conversation()
 
         self._update_models_list()
+        self._refresh_status()
 
     def _create_menu(self):
         self.menu_bar = tk.Menu(self)
 
         # File Menu
         file_menu = tk.Menu(self.menu_bar, tearoff=0)
+        file_menu.add_command(label="New Conversation", command=self.new_conversation)
+        file_menu.add_command(label="Close Conversation", command=self.close_conversation)
+        file_menu.add_separator()
         file_menu.add_command(label="Manage API Keys", command=self.open_api_keys_manager)
         file_menu.add_command(label="Manage MCP Servers", command=self.open_mcp_manager)
         file_menu.add_separator()
@@ -45,6 +53,8 @@ class MainWindow(ttk.Window):
         provider_menu.add_radiobutton(label="Groq", variable=self.provider_var, value="groq", command=self._on_provider_changed)
         provider_menu.add_radiobutton(label="Local Transformers", variable=self.provider_var, value="local_transformers", command=self._on_provider_changed)
         provider_menu.add_radiobutton(label="Remote Transformers", variable=self.provider_var, value="remote_transformers", command=self._on_provider_changed)
+        provider_menu.add_radiobutton(label="Embedded Transformers (CPU, no tools)", variable=self.provider_var, value="embedded_transformers", command=self._on_provider_changed)
+        provider_menu.add_radiobutton(label="Fallback Chain", variable=self.provider_var, value="fallback", command=self._on_provider_changed)
         provider_menu.add_separator()
         provider_menu.add_command(label="Set Remote Transformers URL...", command=self.open_remote_transformers_url_dialog)
         self.menu_bar.add_cascade(label="Provider", menu=provider_menu)
@@ -62,6 +72,10 @@ class MainWindow(ttk.Window):
             models = LocalTransformersProvider.get_models()
         elif provider_name == "remote_transformers":
             models = RemoteTransformersProvider.get_models()
+        elif provider_name == "embedded_transformers":
+            models = EmbeddedTransformersProvider.get_models()
+        elif provider_name == "fallback":
+            models = FallbackProvider.get_models()
         else:
             models = []
 
@@ -78,6 +92,13 @@ class MainWindow(ttk.Window):
         provider = self.provider_var.get()
         settings.set_selected_provider(provider)
         self._update_models_list()
+        if provider == "embedded_transformers":
+            messagebox.showinfo(
+                "Embedded Transformers",
+                "The embedded CPU models are used for plain chat: MCP tools are not available with this provider. "
+                "Earlier tool calls and results in a conversation are shown to the model as text.",
+                parent=self,
+            )
 
     def _on_model_changed(self, event=None):
         model = self.model_var.get()
@@ -97,68 +118,36 @@ class MainWindow(ttk.Window):
         self.model_menu.pack(side="left", padx=5)
         self.model_menu.bind("<<ComboboxSelected>>", self._on_model_changed)
 
-        # Chat frame
-        chat_frame = ttk.Frame(main_frame)
-        chat_frame.pack(fill="both", expand=True)
-
-        self.output_text = tk.Text(chat_frame, height=15, wrap="word")
-        self.output_text.pack(fill="both", expand=True)
-
-        # Input frame
-        input_frame = ttk.Frame(main_frame)
-        input_frame.pack(fill="x", pady=(10, 0))
-
-        self.input_text = tk.Text(input_frame, height=4, wrap="word")
-        self.input_text.pack(side="left", fill="x", expand=True, padx=(0, 10))
-        
-        # Add placeholder text
-        self.input_text.insert("1.0", "Type your message here...")
-        self.input_text.config(foreground="gray")
-        self.input_text.bind("<FocusIn>", self._on_input_focus_in)
-        self.input_text.bind("<FocusOut>", self._on_input_focus_out)
-
-        self.send_button = ttk.Button(input_frame, text="Send", command=self.on_send, style="primary.TButton")
-        self.send_button.pack(side="right")
-
-        # Configure text tags for chat display
-        self.output_text.tag_configure("user", foreground="black")
-        self.output_text.tag_configure("assistant", foreground="blue")
-        self.output_text.tag_configure("error", foreground="red")
-
-    def on_send(self):
-        user_input = self.input_text.get("1.0", tk.END).strip()
-        if not user_input or user_input == "Type your message here...":
-            return
+        # One tab per conversation; they share the MCP tool catalog and the turn workers
+        self.notebook = ttk.Notebook(main_frame)
+        self.notebook.pack(fill="both", expand=True)
+
+        self.status_var = tk.StringVar(self)
+        ttk.Label(main_frame, textvariable=self.status_var, foreground="gray").pack(fill="x", pady=(5, 0))
 
-        # Re-initialize assistant to pick up any settings changes
-        # A more sophisticated approach might be to have the assistant update itself
-        self.assistant = Assistant()
-
-        self.output_text.insert(tk.END, f"> You: {user_input}\n", "user")
-        self.output_text.update_idletasks()
-        
-        # Start streaming response
-        self.output_text.insert(tk.END, "> Assistant: ", "assistant")
-        self.output_text.update_idletasks()
-        
-        def stream_callback(token):
-            # Use after() to schedule UI updates on the main thread
-            self.after(0, lambda: self._update_streaming_output(token))
-        
-        # Run streaming in a separate thread to prevent UI blocking
-        def streaming_thread():
-            try:
-                response = self.assistant.handle_command_stream(user_input, stream_callback)
-                # Add newline after streaming is complete
-                self.after(0, lambda: self._finish_streaming())
-            except Exception as e:
-                error_msg = f"Error: {e}"
-                self.after(0, lambda: self._update_streaming_output(error_msg))
-                self.after(0, lambda: self._finish_streaming())
-        
-        threading.Thread(target=streaming_thread, daemon=True).start()
-
-        self.input_text.delete("1.0", tk.END)
+    def new_conversation(self):
+        self._conversation_count += 1
+        tab = ChatTab(self.notebook, catalog=self.catalog)
+        self.notebook.add(tab, text=f"Conversation {self._conversation_count}")
+        self.notebook.select(tab)
+        return tab
+
+    def close_conversation(self):
+        current = self.notebook.select()
+        if not current:
+            return
+        self.nametowidget(current).close()
+        if not self.notebook.tabs():
+            self.new_conversation()
+
+    def _refresh_status(self):
+        """Show how busy the shared turn workers are, once a second."""
+        stats = turn_executor.stats()
+        self.status_var.set(
+            f"Workers busy {stats['busy']}/{stats['workers']} ({stats['utilization']:.0%})"
+            f" \u00b7 queued {stats['queued']}"
+        )
+        self.after(1000, self._refresh_status)
 
     def open_api_keys_manager(self):
         ApiKeysDialog(self)
@@ -170,23 +159,3 @@ class MainWindow(ttk.Window):
         RemoteTransformersUrlDialog(self)
         if self.provider_var.get() == "remote_transformers":
             self._update_models_list()
-
-    def _on_input_focus_in(self, event):
-        if self.input_text.get("1.0", tk.END).strip() == "Type your message here...":
-            self.input_text.delete("1.0", tk.END)
-            self.input_text.config(foreground="black")
-
-    def _on_input_focus_out(self, event):
-        if not self.input_text.get("1.0", tk.END).strip():
-            self.input_text.insert("1.0", "Type your message here...")
-            self.input_text.config(foreground="gray")
-
-    def _update_streaming_output(self, token):
-        """Update the streaming output on the main thread."""
-        self.output_text.insert(tk.END, token)
-        self.output_text.see(tk.END)
-
-    def _finish_streaming(self):
-        """Finish the streaming response on the main thread."""
-        self.output_text.insert(tk.END, "\n\n")
-
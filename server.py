@@ -0,0 +1,25 @@
+import argparse
+
+from assistant_core.gateway import Gateway, create_app
+from assistant_core.process_manager import process_manager
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Expose the assistant over a local OpenAI-compatible API.")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to bind (local only by default)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=4, help="Number of concurrent turns")
+    parser.add_argument("--max-queue", type=int, default=16, help="Requests allowed to wait for a worker before returning 429")
+    parser.add_argument("--provider", help="Override the provider selected in config.json")
+    parser.add_argument("--start-servers", action="store_true", help="Launch the configured MCP server processes first")
+    args = parser.parse_args()
+
+    if args.start_servers:
+        process_manager.start_servers()
+
+    gateway = Gateway(workers=args.workers, max_queue=args.max_queue, provider_name=args.provider)
+    app = create_app(gateway)
+    app.run(host=args.host, port=args.port, threaded=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import unittest
+from unittest.mock import patch
+import json
+import os
+import sys
+import tempfile
+
+# Add the root directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from assistant_core.batch import BatchRunner
+from config.settings import settings
+
+class TestBatchRunner(unittest.TestCase):
+
+    def setUp(self):
+        settings.settings = settings._load_settings()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.input_path = os.path.join(self.tmpdir.name, "prompts.jsonl")
+        self.output_path = os.path.join(self.tmpdir.name, "results.jsonl")
+        with open(self.input_path, "w") as f:
+            for i in range(5):
+                f.write(json.dumps({"id": f"p{i}", "prompt": f"prompt {i}"}) + "\n")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _read_output(self):
+        with open(self.output_path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    @patch('assistant_core.batch.fetch_all_tools', return_value=[])
+    @patch('assistant_core.providers.OpenAIProvider.handle_chat')
+    def test_runs_all_prompts(self, mock_handle_chat, mock_fetch):
+        mock_handle_chat.side_effect = lambda user_input, *args: f"echo {user_input}"
+        summary = BatchRunner(self.input_path, self.output_path, workers=3).run()
+
+        self.assertEqual(summary["succeeded"], 5)
+        self.assertEqual(summary["latency"]["count"], 5)
+        results = {r["id"]: r for r in self._read_output()}
+        self.assertEqual(results["p3"]["response"], "echo prompt 3")
+        mock_fetch.assert_called_once()
+
+    @patch('assistant_core.batch.fetch_all_tools', return_value=[])
+    @patch('assistant_core.providers.OpenAIProvider.handle_chat')
+    def test_resume_skips_completed_and_retries_errors(self, mock_handle_chat, mock_fetch):
+        with open(self.output_path, "w") as f:
+            f.write(json.dumps({"id": "p0", "status": "ok", "response": "done"}) + "\n")
+            f.write(json.dumps({"id": "p1", "status": "error", "response": "Error: boom"}) + "\n")
+            f.write('{"id": "p2", "sta')  # torn line from an interrupted run
+        mock_handle_chat.return_value = "fine"
+
+        summary = BatchRunner(self.input_path, self.output_path, workers=2).run()
+
+        self.assertEqual(summary["skipped"], 1)
+        self.assertEqual(summary["succeeded"], 4)
+        prompts = sorted(call.args[0] for call in mock_handle_chat.call_args_list)
+        self.assertEqual(prompts, ["prompt 1", "prompt 2", "prompt 3", "prompt 4"])
+
+if __name__ == '__main__':
+    unittest.main()
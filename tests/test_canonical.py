@@ -0,0 +1,234 @@
+import unittest
+from unittest.mock import MagicMock, patch
+from types import SimpleNamespace
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add the root directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from openai.types.chat import ChatCompletionMessage
+from assistant_core.assistant import Assistant
+from assistant_core.canonical import canonical_tools
+from assistant_core.messages import Message, MessageHistory, compact_json
+from assistant_core.metrics import prefix_cache
+from assistant_core.providers import OpenAIProvider, get_client
+from config.settings import settings
+
+def _schema(name, reverse=False):
+    function = {"name": name, "description": f"{name} tool", "parameters": {"type": "object", "properties": {}}}
+    if reverse:
+        function = dict(reversed(list(function.items())))
+    return {"type": "function", "function": function}
+
+def _posting(create):
+    """Route the client's low-level post (the request body as bytes) to a fake create(**kwargs)."""
+    return lambda path, content, **options: create(**json.loads(content))
+
+class _CompletionHandler(BaseHTTPRequestHandler):
+    """Answers every chat completion with "reply" and keeps the requests it got."""
+
+    requests = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.requests.append((self.headers["Authorization"], body))
+        reply = json.dumps({
+            "id": "c", "object": "chat.completion", "created": 0, "model": "gpt-4",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "reply"}}],
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def log_message(self, *args):
+        pass
+
+class TestCanonicalPrefix(unittest.TestCase):
+
+    def setUp(self):
+        settings.settings = settings._load_settings()
+
+    def test_tool_order_and_keys_are_stable(self):
+        first = canonical_tools([{"server_url": "a", "schema": _schema("zeta")}, {"server_url": "b", "schema": _schema("alpha")}])
+        second = canonical_tools([{"server_url": "b", "schema": _schema("alpha", reverse=True)}, {"server_url": "a", "schema": _schema("zeta", reverse=True)}])
+        self.assertEqual(json.dumps([t["schema"] for t in first]), json.dumps([t["schema"] for t in second]))
+        self.assertEqual(first[0]["schema"]["function"]["name"], "alpha")
+
+    def test_sdk_messages_become_compact_messages(self):
+        message = ChatCompletionMessage.model_validate({
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [{"id": "call_1", "type": "function", "function": {"name": "fetch", "arguments": "{\"url\":\"x\"}"}}],
+        })
+        self.assertEqual(Message.from_sdk(message).to_wire(), {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [{"id": "call_1", "type": "function", "function": {"name": "fetch", "arguments": "{\"url\":\"x\"}"}}],
+        })
+
+    def test_history_reuses_cached_wire_dicts_and_rebuilds_on_truncate(self):
+        history = MessageHistory([{"role": "user", "content": "hi"}])
+        first = history.wire()[0]
+        history.append(Message("assistant", "hello"))
+        self.assertIs(history.wire()[0], first)
+        self.assertEqual(history.char_count(), sum(len(json.dumps(m, separators=(",", ":"))) for m in history.wire()))
+        del history[1:]
+        self.assertEqual(history.wire(), [{"role": "user", "content": "hi"}])
+        self.assertEqual(history.char_count(), len(json.dumps(first, separators=(",", ":"))))
+
+    def test_forked_histories_share_their_prefix(self):
+        history = MessageHistory([{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}])
+        first = history.wire()[0]
+        branch = history.fork(1)
+        branch.append(Message("user", "hi again"))
+        history.append(Message("user", "bye"))
+
+        self.assertEqual([m["content"] for m in branch], ["hi", "hi again"])
+        self.assertEqual([m["content"] for m in history], ["hi", "hello", "bye"])
+        self.assertIs(branch.wire()[0], first)
+        self.assertEqual(branch.shared_prefix_length(history), 1)
+        self.assertEqual(branch.char_count(), sum(len(json.dumps(m, separators=(",", ":"))) for m in branch.wire()))
+
+    def test_consecutive_turns_share_request_prefix_and_record_cache_hits(self):
+        provider = OpenAIProvider(api_key="test-key", model="prefix-test")
+        provider._ensure_client()
+        provider.client = MagicMock()
+        sent = []
+
+        def create(**kwargs):
+            sent.append(json.dumps(kwargs["messages"]))
+            message = ChatCompletionMessage.model_validate({"role": "assistant", "content": "reply"})
+            usage = SimpleNamespace(prompt_tokens=100, total_tokens=110, prompt_tokens_details=SimpleNamespace(cached_tokens=64))
+            response = SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+            return SimpleNamespace(headers={}, parse=lambda: response)
+        provider.client.post.side_effect = _posting(create)
+
+        provider.handle_chat("first", [], None)
+        provider.handle_chat("second", [], None)
+
+        self.assertTrue(sent[1].startswith(sent[0][:-1]))
+        stats = prefix_cache.get("openai:prefix-test").summary()
+        self.assertEqual(stats["requests"], 2)
+        self.assertAlmostEqual(stats["token_hit_rate"], 0.64)
+
+    def test_request_body_is_joined_from_cached_message_json(self):
+        provider = OpenAIProvider(api_key="test-key", model="gpt-4")
+        history = MessageHistory([{"role": "user", "content": "héllo"}, {"role": "assistant", "content": "hi"}])
+        tools = [_schema("fetch")]
+        body = provider._chat_body({"model": "gpt-4", "tools": tools, "messages": history})
+        self.assertEqual(json.loads(body), {"model": "gpt-4", "tools": tools, "messages": history.wire()})
+
+        history.append(Message("user", "again"))
+        with patch("assistant_core.messages.compact_json", wraps=compact_json) as encode:
+            body = provider._chat_body({"model": "gpt-4", "messages": history})
+        # Earlier messages were encoded once, when they were added
+        encode.assert_not_called()
+        self.assertEqual(json.loads(body)["messages"], history.wire())
+
+    def test_encoded_body_is_what_the_server_receives(self):
+        _CompletionHandler.requests = []
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _CompletionHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.shutdown)
+        provider = OpenAIProvider(api_key="test-key", model="gpt-4")
+        provider.client = get_client(f"http://127.0.0.1:{server.server_port}/v1", "test-key")
+
+        self.assertEqual(provider.handle_chat("first", [], None), "reply")
+        self.assertEqual(provider.handle_chat("second", [], None), "reply")
+
+        (auth, first), (_, second) = _CompletionHandler.requests
+        self.assertEqual(auth, "Bearer test-key")
+        self.assertEqual(json.loads(first), {"model": "gpt-4", "messages": [{"role": "user", "content": "first"}]})
+        self.assertTrue(second.startswith(first[:-2]))
+
+    def test_pruned_tool_list_only_grows_so_the_prefix_survives(self):
+        settings.settings["tool_top_k"] = 1
+        names = ["fetch_url", "read_file", "search_web", "write_file"]
+        tools_info = canonical_tools([{"server_url": "http://tools", "schema": _schema(name)} for name in names])
+        assistant = Assistant(provider_name="openai", model_name="prefix-tools", tools_info=tools_info)
+        assistant.provider.api_key = "test-key"
+        assistant.provider._ensure_client()
+        assistant.provider.client = MagicMock()
+        sent = []
+
+        def create(**kwargs):
+            # Tools are serialized ahead of the messages, as in the real request body
+            sent.append(json.dumps({"tools": kwargs.get("tools"), "messages": kwargs["messages"]}))
+            message = ChatCompletionMessage.model_validate({"role": "assistant", "content": "reply"})
+            response = SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+            return SimpleNamespace(headers={}, parse=lambda: response)
+        assistant.provider.client.post.side_effect = _posting(create)
+
+        tool_lists = []
+        for prompt in ("hello there", "read the file notes.txt", "thanks", "read the file again", "now search the web"):
+            assistant.handle_command(prompt)
+            tool_lists.append([tool["function"]["name"] for tool in assistant.active_tools])
+
+        # Small talk first adds nothing, rather than the whole catalog
+        self.assertEqual(tool_lists[0], [])
+        self.assertEqual(tool_lists[1:4], [["read_file"]] * 3)
+        self.assertEqual(tool_lists[4], ["read_file", "search_web"])
+        # Turns that add no tool extend the previous request byte for byte
+        for previous, current in zip(sent[1:3], sent[2:4]):
+            self.assertTrue(current.startswith(previous[:-2]))
+
+    def _tool_call_provider(self, arguments):
+        provider = OpenAIProvider(api_key="test-key", model="gpt-4")
+        provider._ensure_client()
+        provider.client = MagicMock()
+        replies = [
+            {"role": "assistant", "content": None, "tool_calls": [
+                {"id": "call_1", "type": "function", "function": {"name": "fetch", "arguments": arguments}},
+            ]},
+            {"role": "assistant", "content": "done"},
+        ]
+
+        def create(**kwargs):
+            message = ChatCompletionMessage.model_validate(replies.pop(0))
+            response = SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+            return SimpleNamespace(headers={}, parse=lambda: response)
+        provider.client.post.side_effect = _posting(create)
+        return provider
+
+    def test_malformed_tool_arguments_become_an_error_result(self):
+        provider = self._tool_call_provider('{"url": "http://exa')
+        invoked = []
+        self.assertEqual(provider.handle_chat("fetch it", [_schema("fetch")], lambda name, kwargs: invoked.append(name)), "done")
+        self.assertEqual(invoked, [])
+        self.assertEqual([m["role"] for m in provider.messages], ["user", "assistant", "tool", "assistant"])
+        self.assertIn("not valid JSON", provider.messages[2]["content"])
+
+    def test_follow_up_after_tool_calls_keeps_the_tools(self):
+        provider = self._tool_call_provider('{"url": "http://example.com"}')
+        tools = [_schema("fetch")]
+        provider.handle_chat("fetch it", tools, lambda name, kwargs: "page")
+
+        first, follow_up = [json.loads(call.kwargs["content"]) for call in provider.client.post.call_args_list]
+        self.assertEqual(first["tool_choice"], "auto")
+        # Same tools ahead of the messages, so the follow-up reuses the cached prefix
+        self.assertEqual(follow_up["tools"], first["tools"])
+        self.assertEqual(follow_up["tool_choice"], "none")
+
+    def test_no_tools_arguments_when_no_tool_is_sent(self):
+        provider = self._tool_call_provider('{}')
+        provider.handle_chat("hello", [], lambda name, kwargs: "")
+        for call in provider.client.post.call_args_list:
+            self.assertNotIn("tools", json.loads(call.kwargs["content"]))
+            self.assertNotIn("tool_choice", json.loads(call.kwargs["content"]))
+
+    def test_failed_turn_leaves_no_tool_calls_without_results(self):
+        provider = self._tool_call_provider('{"url": "http://example.com"}')
+
+        def broken_tool(name, kwargs):
+            raise RuntimeError("tool thread died")
+        self.assertTrue(provider.handle_chat("fetch it", [_schema("fetch")], broken_tool).startswith("Error"))
+        self.assertEqual(len(provider.messages), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+import unittest
+from unittest.mock import MagicMock
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add the root directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from openai.types.chat import ChatCompletionChunk
+from assistant_core.assistant import mcp_http
+from assistant_core.cassette import Cassette, set_cassette
+from assistant_core.providers import OpenAIProvider
+from assistant_core.scheduler import scheduler
+from config.settings import settings
+
+def _chunk(content):
+    return ChatCompletionChunk.model_validate({
+        "id": "chunk", "object": "chat.completion.chunk", "created": 0, "model": "gpt-4",
+        "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": None}],
+    })
+
+class _Stream(list):
+    def close(self):
+        pass
+
+class _SlowStreamHandler(BaseHTTPRequestHandler):
+    """/invoke streams two NDJSON lines 0.2 s apart."""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        for i, delta in enumerate(("first", "second")):
+            if i:
+                time.sleep(0.2)
+            self.wfile.write(json.dumps({"delta": delta}).encode() + b"\n")
+            self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+class TestCassette(unittest.TestCase):
+
+    def setUp(self):
+        settings.settings = settings._load_settings()
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, "traffic.jsonl")
+        self.addCleanup(shutil.rmtree, self.root)
+        self.addCleanup(set_cassette, None)
+
+    def _turn(self, provider):
+        tokens = []
+        result = provider.handle_chat_stream("hello", [], None, tokens.append)
+        return result, tokens
+
+    def test_streamed_chat_is_replayed_without_a_client(self):
+        set_cassette(Cassette(self.path, "record"))
+        provider = OpenAIProvider(api_key="test-key", model="gpt-4")
+        provider._ensure_client()
+        provider.client = MagicMock()
+        stream = _Stream([_chunk("Hel"), _chunk("lo!")])
+        provider.client.post.return_value = MagicMock(headers={}, parse=lambda: stream)
+        recorded = self._turn(provider)
+        self.assertEqual(recorded, ("Hello!", ["Hel", "lo!"]))
+
+        replay = Cassette(self.path, "replay")
+        set_cassette(replay)
+        provider = OpenAIProvider(model="gpt-4")
+        provider.api_key = None
+        self.assertEqual(self._turn(provider), recorded)
+        self.assertEqual((replay.replayed, replay.misses), (1, 0))
+
+    def test_recording_keeps_the_request_and_replay_skips_rate_limits(self):
+        settings.settings["rate_limits"] = {"openai": {"requests_per_minute": 1}}
+        scheduler.reset()
+        self.addCleanup(scheduler.reset)
+        set_cassette(Cassette(self.path, "record"))
+        provider = OpenAIProvider(api_key="test-key", model="gpt-4")
+        provider._ensure_client()
+        provider.client = MagicMock()
+        provider.client.post.side_effect = (
+            lambda *args, **kwargs: MagicMock(headers={}, parse=lambda: _Stream([_chunk("Hi")]))
+        )
+        self._turn(provider)
+        set_cassette(None)
+        with open(self.path, encoding="utf-8") as f:
+            entry = json.loads(f.readline())
+        self.assertEqual(entry["request"]["model"], "gpt-4")
+        self.assertEqual(entry["request"]["messages"], [{"role": "user", "content": "hello"}])
+
+        # One request per minute would hold the second replay back a whole minute
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+        scheduler.reset()
+        set_cassette(Cassette(self.path, "replay"))
+        started = time.perf_counter()
+        for _ in range(2):
+            self.assertEqual(self._turn(OpenAIProvider(model="gpt-4")), ("Hi", ["Hi"]))
+        self.assertLess(time.perf_counter() - started, 1)
+        self.assertEqual(scheduler.stats(), {})
+
+    def test_mcp_stream_is_replayed_fast_or_with_recorded_timing(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _SlowStreamHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_port}/invoke"
+
+        def invoke():
+            started = time.perf_counter()
+            with mcp_http.post(url, json={"tool": "t", "kwargs": {}}, stream=True) as response:
+                lines = list(response.iter_lines())
+            return lines, time.perf_counter() - started
+
+        set_cassette(Cassette(self.path, "record"))
+        recorded, _ = invoke()
+        server.shutdown()
+        server.server_close()
+        set_cassette(None)
+
+        set_cassette(Cassette(self.path, "replay"))
+        fast, fast_elapsed = invoke()
+        set_cassette(Cassette(self.path, "replay", realtime=True))
+        realtime, realtime_elapsed = invoke()
+
+        self.assertEqual(recorded, [b'{"delta": "first"}', b'{"delta": "second"}'])
+        self.assertEqual((fast, realtime), (recorded, recorded))
+        self.assertLess(fast_elapsed, 0.1)
+        self.assertGreater(realtime_elapsed, 0.15)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import unittest
+from unittest.mock import patch
+import os
+import sys
+import threading
+
+# Add the root directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from assistant_core.cancellation import GenerationCancelled
+from assistant_core.conversation import Conversation
+from assistant_core.executor import FairExecutor
+from config.settings import settings
+
+class FakeProvider:
+    """Appends to its history like the real providers; "slow" blocks until cancelled."""
+
+    def __init__(self):
+        self.model = "fake"
+        self.messages = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def handle_chat_stream(self, user_input, tools, tool_invoker, stream_callback, cancel_token=None):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            self.messages.append({"role": "user", "content": user_input})
+            if user_input == "slow":
+                self.messages.append({"role": "assistant", "content": None, "tool_calls": []})
+                cancel_token.wait(5)
+                raise GenerationCancelled()
+            stream_callback(user_input.upper())
+            self.messages.append({"role": "assistant", "content": user_input.upper()})
+            return user_input.upper()
+        finally:
+            with self.lock:
+                self.active -= 1
+
+class TestConversation(unittest.TestCase):
+
+    def setUp(self):
+        settings.settings = settings._load_settings()
+        self.provider = FakeProvider()
+        patcher = patch('assistant_core.assistant.create_provider', return_value=self.provider)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.conversation = Conversation(executor=FairExecutor(workers=2))
+
+    def _submit(self, text):
+        done = threading.Event()
+        turn = self.conversation.submit(text, lambda token: None, on_done=lambda t: done.set())
+        return turn, done
+
+    def test_turns_are_serialized(self):
+        turns = [self._submit(f"message {i}") for i in range(5)]
+        for turn, done in turns:
+            self.assertTrue(done.wait(2))
+            self.assertEqual(turn.status, "completed")
+        self.assertEqual(self.provider.max_active, 1)
+        self.assertEqual([m["content"] for m in self.provider.messages[::2]], [f"message {i}" for i in range(5)])
+
+    def test_cancel_rolls_back_and_drops_queued_turns(self):
+        first, first_done = self._submit("hello")
+        self.assertTrue(first_done.wait(2))
+        history = list(self.provider.messages)
+
+        slow_started = threading.Event()
+        slow_done = threading.Event()
+        slow = self.conversation.submit("slow", lambda token: None, on_start=lambda t: slow_started.set(), on_done=lambda t: slow_done.set())
+        queued, queued_done = self._submit("never sent")
+        self.assertTrue(slow_started.wait(2))
+        self.conversation.cancel()
+
+        self.assertTrue(slow_done.wait(2))
+        self.assertTrue(queued_done.wait(2))
+        self.assertEqual(slow.status, "cancelled")
+        self.assertEqual(queued.status, "cancelled")
+        self.assertFalse(queued.started)
+        self.assertEqual(self.provider.messages, history)
+
+    def test_edit_branches_and_switch_keeps_both_histories(self):
+        for text in ("first", "second"):
+            turn, done = self._submit(text)
+            self.assertTrue(done.wait(2))
+        done = threading.Event()
+        self.conversation.edit(2, "second, edited", lambda token: None, on_done=lambda t: done.set())
+        self.assertTrue(done.wait(2))
+
+        edited = self.conversation.history
+        self.assertEqual([m["content"] for m in edited], ["first", "FIRST", "second, edited", "SECOND, EDITED"])
+        self.assertIs(self.provider.messages, edited)
+        self.conversation.switch("main")
+        self.assertEqual([m["content"] for m in self.conversation.history][2:], ["second", "SECOND"])
+        self.assertEqual(edited.shared_prefix_length(self.conversation.history), 2)
+        with self.assertRaises(ValueError):
+            self.conversation.edit(1, "not a prompt", lambda token: None)
+
+class TestFairExecutor(unittest.TestCase):
+
+    def test_owners_take_turns_and_backlog_cannot_starve_others(self):
+        executor = FairExecutor(workers=1)
+        order = []
+        gate = threading.Event()
+        running = threading.Event()
+        done = threading.Event()
+
+        def task(name):
+            if name == "a1":
+                running.set()
+                gate.wait(2)
+            order.append(name)
+            if name == "a3":
+                done.set()
+
+        executor.submit("a", task, "a1")
+        self.assertTrue(running.wait(2))
+        for name in ("a2", "a3"):
+            executor.submit("a", task, name)
+        executor.submit("b", task, "b1")
+        self.assertEqual(executor.stats()["queued"], 3)
+        gate.set()
+        self.assertTrue(done.wait(2))
+        self.assertEqual(order, ["a1", "b1", "a2", "a3"])
+
+    def test_one_running_task_per_owner(self):
+        executor = FairExecutor(workers=4, max_per_owner=1)
+        release = threading.Event()
+        started = threading.Event()
+        executor.submit("a", lambda: (started.set(), release.wait(2)))
+        executor.submit("a", lambda: None)
+        self.assertTrue(started.wait(2))
+        stats = executor.stats()
+        self.assertEqual((stats["busy"], stats["queued"]), (1, 1))
+        self.assertEqual(executor.cancel_pending("a"), [()])
+        release.set()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import unittest
+from unittest.mock import patch
+import os
+import sys
+import time
+
+# Add the root directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from assistant_core.cancellation import GenerationCancelled
+from assistant_core.metrics import time_to_first_token
+from assistant_core.providers import FallbackProvider
+
+class FakeProvider:
+    """Stands in for a ChatCompletionsProvider; behaviour is "ok", "slow", "fail" or "hang"."""
+
+    def __init__(self, name, behaviour):
+        self.display_name = name
+        self.latency_key = f"fake:{name}"
+        self.behaviour = behaviour
+        self.messages = []
+        self.cancelled = False
+
+    def _ensure_ready(self):
+        pass
+
+    def _run_chat(self, user_input, tools, tool_invoker):
+        if self.behaviour != "ok":
+            raise RuntimeError(f"{self.display_name} is down")
+        self.messages += [{"role": "user", "content": user_input}, {"role": "assistant", "content": self.display_name}]
+        return self.display_name
+
+    def _run_chat_stream(self, user_input, tools, tool_invoker, stream_callback, cancel_token):
+        if self.behaviour == "hang":
+            cancel_token.wait(5)
+            self.cancelled = cancel_token.cancelled
+            raise GenerationCancelled()
+        if self.behaviour == "slow":
+            time.sleep(0.3)
+            self.behaviour = "ok"
+        self._run_chat(user_input, tools, tool_invoker)
+        for token in (self.display_name, "!"):
+            stream_callback(token)
+        return self.display_name + "!"
+
+class TestFallbackProvider(unittest.TestCase):
+
+    def _patch_chain(self, **behaviours):
+        created = []
+
+        def factory(name, model):
+            provider = FakeProvider(name, behaviours[name])
+            created.append(provider)
+            return provider
+
+        patcher = patch('assistant_core.providers.create_provider', side_effect=factory)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return created
+
+    def test_fails_over_to_next_provider(self):
+        self._patch_chain(primary="fail", secondary="ok")
+        provider = FallbackProvider([("primary", "m1"), ("secondary", "m2")], hedge=False)
+
+        self.assertEqual(provider.handle_chat("hi", [], None), "secondary")
+        self.assertEqual(provider.messages[-1]["content"], "secondary")
+
+        tokens = []
+        self.assertEqual(provider.handle_chat_stream("again", [], None, tokens.append), "secondary!")
+        self.assertEqual(tokens, ["secondary", "!"])
+
+    def test_hedges_after_measured_p95_and_cancels_loser(self):
+        created = self._patch_chain(slow="hang", fast="ok")
+        for _ in range(20):
+            time_to_first_token.get("fake:slow").add(0.01)
+        provider = FallbackProvider([("slow", "m1"), ("fast", "m2")], hedge=True)
+
+        tokens = []
+        result = provider.handle_chat_stream("hi", [], None, tokens.append)
+
+        self.assertEqual(result, "fast!")
+        self.assertEqual(tokens, ["fast", "!"])
+        self.assertEqual([p.display_name for p in created], ["slow", "fast"])
+        # The losing attempt is released by its cancel token rather than left running
+        deadline = time.monotonic() + 2
+        while not created[0].cancelled and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(created[0].cancelled)
+
+    def test_failover_drops_the_failed_attempts_hedge(self):
+        created = self._patch_chain(flaky="fail", steady="slow", spare="ok")
+        for _ in range(20):
+            time_to_first_token.get("fake:flaky").add(0.1)
+        provider = FallbackProvider([("flaky", "m1"), ("steady", "m2"), ("spare", "m3")], hedge=True)
+
+        tokens = []
+        self.assertEqual(provider.handle_chat_stream("hi", [], None, tokens.append), "steady!")
+        # steady has no TTFT samples, so nothing may hedge it with spare
+        self.assertEqual([p.display_name for p in created], ["flaky", "steady"])
+
+    def test_no_hedge_without_measurements(self):
+        self._patch_chain(unmeasured="ok", other="ok")
+        provider = FallbackProvider([("unmeasured", "m1"), ("other", "m2")], hedge=True)
+        self.assertIsNone(provider.hedge_delay(FakeProvider("unmeasured", "ok")))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import unittest
+from unittest.mock import patch
+import json
+import os
+import sys
+import threading
+
+# Add the root directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from assistant_core.cancellation import GenerationCancelled
+from assistant_core.gateway import Gateway, GatewayBusy, create_app
+from config.settings import settings
+
+class TestGateway(unittest.TestCase):
+
+    def setUp(self):
+        settings.settings = settings._load_settings()
+        patcher = patch('assistant_core.gateway.fetch_all_tools', return_value=[])
+        self.mock_fetch = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.gateway = Gateway(workers=1, max_queue=1)
+        self.client = create_app(self.gateway).test_client()
+
+    @patch('assistant_core.providers.OpenAIProvider.handle_chat')
+    def test_session_keeps_history(self, mock_handle_chat):
+        mock_handle_chat.return_value = "hello"
+        body = {"model": "gpt-4", "messages": [{"role": "user", "content": "hi"}]}
+
+        response = self.client.post("/v1/chat/completions", json=body, headers={"X-Session-Id": "abc"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["choices"][0]["message"]["content"], "hello")
+
+        session = self.gateway.sessions["abc"]
+        self.client.post("/v1/chat/completions", json=body, headers={"X-Session-Id": "abc"})
+        self.assertIs(self.gateway.sessions["abc"], session)
+        self.mock_fetch.assert_called_once()
+        self.assertEqual(self.gateway.metrics()["tool_schema_tokens"]["count"], 2)
+
+    @patch('assistant_core.providers.OpenAIProvider.handle_chat_stream')
+    def test_streaming_sse(self, mock_stream):
+        def fake_stream(user_input, tools, tool_invoker, stream_callback, cancel_token=None):
+            for token in ("Hel", "lo"):
+                stream_callback(token)
+            return "Hello"
+        mock_stream.side_effect = fake_stream
+        body = {"model": "gpt-4", "stream": True, "messages": [{"role": "user", "content": "hi"}]}
+
+        response = self.client.post("/v1/chat/completions", json=body)
+        events = [line[len("data: "):] for line in response.get_data(as_text=True).split("\n") if line.startswith("data: ")]
+        self.assertEqual(events[-1], "[DONE]")
+        content = "".join(json.loads(e)["choices"][0]["delta"].get("content", "") for e in events[:-1])
+        self.assertEqual(content, "Hello")
+
+    def test_session_rejects_a_different_model(self):
+        body = {"model": "gpt-4", "messages": [{"role": "user", "content": "hi"}]}
+        with patch('assistant_core.providers.OpenAIProvider.handle_chat', return_value="hello"):
+            self.client.post("/v1/chat/completions", json=body, headers={"X-Session-Id": "abc"})
+            response = self.client.post("/v1/chat/completions", json=dict(body, model="gpt-5"), headers={"X-Session-Id": "abc"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.gateway.sessions["abc"].assistant.provider.model, "gpt-4")
+
+    def test_session_created_without_a_model_accepts_the_model_it_runs(self):
+        settings.settings["selected_provider"] = "openai"
+        settings.settings["selected_model"] = "gpt-4"
+        body = {"messages": [{"role": "user", "content": "hi"}]}
+        with patch('assistant_core.providers.OpenAIProvider.handle_chat', return_value="hello"):
+            self.client.post("/v1/chat/completions", json=body, headers={"X-Session-Id": "abc"})
+            response = self.client.post("/v1/chat/completions", json=dict(body, model="gpt-4"), headers={"X-Session-Id": "abc"})
+        self.assertEqual(response.status_code, 200)
+
+    @patch('assistant_core.providers.OpenAIProvider.handle_chat_stream')
+    def test_client_disconnect_cancels_the_turn(self, mock_stream):
+        cancelled = threading.Event()
+
+        def fake_stream(user_input, tools, tool_invoker, stream_callback, cancel_token=None):
+            stream_callback("Hel")
+            if cancel_token.wait(5):
+                cancelled.set()
+                raise GenerationCancelled()
+            return "Hel"
+        mock_stream.side_effect = fake_stream
+        body = {"model": "gpt-4", "stream": True, "messages": [{"role": "user", "content": "hi"}]}
+
+        response = self.client.post("/v1/chat/completions", json=body)
+        chunks = iter(response.response)
+        next(chunks)
+        next(chunks)
+        response.close()
+        self.assertTrue(cancelled.wait(5))
+        self.gateway.executor.shutdown(wait=True)
+        self.assertEqual(self.gateway.metrics()["running"], 0)
+
+    def test_admission_control_rejects_when_full(self):
+        release = threading.Event()
+        self.gateway.submit(release.wait)
+        self.gateway.submit(release.wait)
+        with self.assertRaises(GatewayBusy):
+            self.gateway.submit(release.wait)
+        release.set()
+        self.gateway.executor.shutdown(wait=True)
+        metrics = self.gateway.metrics()
+        self.assertEqual(metrics["rejected"], 1)
+        self.assertEqual(metrics["completed"], 2)
+        self.assertEqual(metrics["queue_wait"]["count"], 2)
+
+if __name__ == '__main__':
+    unittest.main()
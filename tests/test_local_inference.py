@@ -0,0 +1,191 @@
+import unittest
+import os
+import sys
+import threading
+
+# Add the root directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from assistant_core.cancellation import CancelToken, GenerationCancelled
+from assistant_core.local_inference import LocalEngine, IncrementalDecoder
+from assistant_core.messages import Message, ToolCall
+from assistant_core.providers import EmbeddedTransformersProvider
+from config.settings import settings
+
+class FakeCache:
+    def __init__(self, length):
+        self.length = length
+
+    def crop(self, length):
+        self.length = min(self.length, length)
+
+class FakeTokenizer:
+    # Token ids are byte values; a lone lead byte decodes to U+FFFD
+    def decode(self, ids, skip_special_tokens=True):
+        return bytes(ids).decode("utf-8", errors="replace")
+
+class FakeBackend:
+    """Every prompt decodes to "abc", then end of sequence (token 0)."""
+    tokenizer = FakeTokenizer()
+    eos_ids = {0}
+
+    def __init__(self):
+        self.rows = []
+        self.batch_sizes = []
+
+    def load(self):
+        pass
+
+    def encode(self, messages):
+        return list(messages[-1]["content"].encode("utf-8"))
+
+    def prefill(self, ids, cache, reused, temperature):
+        return ord("a"), FakeCache(len(ids))
+
+    def add(self, cache):
+        self.rows.append(cache)
+
+    def remove(self, index):
+        return self.rows.pop(index)
+
+    def step(self, tokens, temperatures):
+        self.batch_sizes.append(len(tokens))
+        return [token + 1 if token < ord("c") else 0 for token in tokens]
+
+    def reset(self):
+        self.rows = []
+
+class FakeEngine:
+    def __init__(self, pieces):
+        self.pieces = pieces
+        self.calls = []
+
+    def generate(self, messages, max_new_tokens=512, temperature=0.0, cancel_token=None):
+        self.calls.append(messages)
+        for piece in self.pieces:
+            if cancel_token is not None and cancel_token.cancelled:
+                return
+            yield piece
+
+class TestLocalInference(unittest.TestCase):
+
+    def setUp(self):
+        settings.settings = settings._load_settings()
+
+    def test_follow_up_turn_reuses_longest_cached_prefix(self):
+        engine = LocalEngine("fake")
+        engine._keep_prefix([1, 2, 3, 9], FakeCache(4))
+        engine._keep_prefix([1, 2, 3, 4, 5, 6], FakeCache(6))
+
+        cache, reused = engine._take_prefix([1, 2, 3, 4, 5, 6, 7, 8])
+        self.assertEqual((cache.length, reused), (6, 6))
+        # The entry is taken while in use
+        self.assertEqual(len(engine._prefixes), 1)
+
+        # A prompt identical to the cached ids still feeds its last token
+        engine._keep_prefix([1, 2, 3, 4], FakeCache(4))
+        cache, reused = engine._take_prefix([1, 2, 3, 4])
+        self.assertEqual((cache.length, reused), (3, 3))
+        self.assertEqual(engine._take_prefix([7, 7]), (None, 0))
+
+    def test_concurrent_requests_are_decoded_in_one_batch(self):
+        backend = FakeBackend()
+        engine = LocalEngine("fake", backend=backend, max_batch=8, batch_window=0.2)
+        results = {}
+
+        def run(i):
+            results[i] = "".join(engine.generate([{"role": "user", "content": f"prompt {i}"}]))
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(results, {i: "abc" for i in range(4)})
+        self.assertEqual(max(backend.batch_sizes), 4)
+        self.assertEqual(backend.rows, [])
+        self.assertEqual(len(engine._prefixes), 4)
+        self.assertEqual("".join(engine.generate([{"role": "user", "content": "x"}], max_new_tokens=2)), "ab")
+
+    def test_backend_failure_fails_requests_instead_of_stopping_the_worker(self):
+        backend = FakeBackend()
+        engine = LocalEngine("fake", backend=backend, batch_window=0)
+        real_add = backend.add
+        backend.add = lambda cache: (_ for _ in ()).throw(RuntimeError("out of memory"))
+
+        with self.assertRaisesRegex(RuntimeError, "out of memory"):
+            "".join(engine.generate([{"role": "user", "content": "x"}]))
+        # The worker survived with an empty batch and serves the next request
+        backend.add = real_add
+        self.assertEqual("".join(engine.generate([{"role": "user", "content": "y"}])), "abc")
+        self.assertEqual(backend.rows, [])
+
+    def test_cancel_wakes_a_request_queued_behind_a_full_batch(self):
+        backend = FakeBackend()
+        release = threading.Event()
+        real_step = backend.step
+
+        def slow_step(tokens, temperatures):
+            release.wait(5)
+            return real_step(tokens, temperatures)
+        backend.step = slow_step
+        engine = LocalEngine("fake", backend=backend, max_batch=1, batch_window=0)
+        first = threading.Thread(target=lambda: "".join(engine.generate([{"role": "user", "content": "a"}])))
+        first.start()
+
+        token = CancelToken()
+        finished = threading.Event()
+        second = threading.Thread(target=lambda: ("".join(engine.generate([{"role": "user", "content": "b"}], cancel_token=token)), finished.set()))
+        second.start()
+        token.cancel()
+        self.assertTrue(finished.wait(2))
+        release.set()
+        first.join(5)
+        self.assertEqual(backend.rows, [])
+
+    def test_decoder_waits_for_complete_characters(self):
+        decoder = IncrementalDecoder(FakeTokenizer())
+        pieces = [decoder.push(byte) for byte in "hé\n!".encode("utf-8")]
+        self.assertEqual(pieces, ["h", "", "é", "\n", "!"])
+
+    def test_provider_streams_engine_pieces_into_history(self):
+        provider = EmbeddedTransformersProvider(model="fake")
+        provider.engine = FakeEngine(["Hel", "lo"])
+        tokens = []
+        self.assertEqual(provider.handle_chat_stream("hi", [], None, tokens.append), "Hello")
+        self.assertEqual(tokens, ["Hel", "lo"])
+        provider.handle_chat("again", [], None)
+        self.assertEqual(provider.engine.calls[1], [
+            {"role": "user", "content": "hi"},
+            {"role": "assistant", "content": "Hello"},
+            {"role": "user", "content": "again"},
+        ])
+
+    def test_provider_flattens_tool_messages_from_another_provider(self):
+        provider = EmbeddedTransformersProvider(model="fake")
+        provider.engine = FakeEngine(["ok"])
+        provider.messages.extend([
+            Message("user", "weather?"),
+            Message("assistant", None, tool_calls=[ToolCall("call_1", "get_weather", '{"city": "Paris"}')]),
+            Message("tool", "sunny", name="get_weather", tool_call_id="call_1"),
+            Message("assistant", "It is sunny."),
+        ])
+        provider.handle_chat("thanks", [{"type": "function", "function": {"name": "get_weather"}}], None)
+        self.assertEqual(provider.engine.calls[0], [
+            {"role": "user", "content": "weather?"},
+            {"role": "assistant", "content": '[Called get_weather({"city": "Paris"})]'},
+            {"role": "user", "content": "[Result of get_weather]\nsunny"},
+            {"role": "assistant", "content": "It is sunny."},
+            {"role": "user", "content": "thanks"},
+        ])
+
+    def test_provider_raises_when_cancelled(self):
+        provider = EmbeddedTransformersProvider(model="fake")
+        provider.engine = FakeEngine(["a", "b"])
+        token = CancelToken()
+        with self.assertRaises(GenerationCancelled):
+            provider.handle_chat_stream("hi", [], None, lambda piece: token.cancel(), cancel_token=token)
+
+if __name__ == '__main__':
+    unittest.main()
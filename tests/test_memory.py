@@ -0,0 +1,106 @@
+import unittest
+from unittest.mock import patch, MagicMock
+from types import SimpleNamespace
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+# Add the root directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from assistant_core import memory
+from assistant_core.assistant import Assistant
+from assistant_core.memory import HashedNgramEmbedder, MemoryIndex
+from config.settings import settings
+
+def _unit_vectors(count, dim, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+class TestMemory(unittest.TestCase):
+
+    def setUp(self):
+        settings.settings = settings._load_settings()
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        memory._memory = None
+        shutil.rmtree(self.root)
+
+    def test_embeddings_rank_related_text_higher(self):
+        embedder = HashedNgramEmbedder()
+        query = embedder.embed("which port does the fetch server listen on")
+        related = embedder.embed("The fetch server listens on port 8001")
+        unrelated = embedder.embed("Banana bread needs ripe bananas and butter")
+        self.assertAlmostEqual(float(np.linalg.norm(query)), 1.0, places=5)
+        self.assertGreater(float(query @ related), float(query @ unrelated))
+
+    def test_index_persists_and_drops_torn_appends(self):
+        index = MemoryIndex(self.root, dim=8)
+        vectors = _unit_vectors(3, 8)
+        index.add(vectors, [{"text": str(i)} for i in range(3)])
+        with open(os.path.join(self.root, "snippets.jsonl"), "ab") as f:
+            f.write(b'{"text": "to')
+
+        reopened = MemoryIndex(self.root, dim=8)
+        self.assertEqual(reopened.count, 3)
+        row, score = reopened.search(vectors[1], k=1)[0][0]
+        self.assertEqual((row, reopened.get(row)["text"]), (1, "1"))
+        self.assertAlmostEqual(score, 1.0, places=5)
+
+    def test_clustered_search_after_training_and_appends(self):
+        index = MemoryIndex(self.root, dim=16, n_lists=8, n_probe=2, train_size=200)
+        vectors = _unit_vectors(300, 16)
+        index.add(vectors[:250], [{"text": str(i)} for i in range(250)])
+        self.assertIsNotNone(index.centroids)
+        index.add(vectors[250:], [{"text": str(i)} for i in range(250, 300)])
+
+        results = index.search(vectors[[10, 280]], k=3)
+        self.assertEqual([hits[0][0] for hits in results], [10, 280])
+        self.assertEqual(MemoryIndex(self.root, dim=16, n_lists=8, n_probe=2).search(vectors[280], k=1)[0][0][0], 280)
+
+    def test_assistant_recalls_other_sessions_only(self):
+        settings.settings["memory_enabled"] = True
+        settings.settings["memory_dir"] = self.root
+        first = Assistant(provider_name="openai", model_name="gpt-4", tools_info=[])
+        with patch.object(first.provider, "handle_chat", return_value="The fetch server listens on port 8001."):
+            first.handle_command("Which port does the fetch server use?")
+
+        second = Assistant(provider_name="openai", model_name="gpt-4", tools_info=[])
+        self.assertIn("port 8001", second.recall("fetch server port?"))
+        self.assertIsNone(first.recall("fetch server port?"))
+
+    def test_recalled_notes_go_with_the_request_not_the_history(self):
+        settings.settings["memory_enabled"] = True
+        settings.settings["memory_dir"] = self.root
+        first = Assistant(provider_name="openai", model_name="gpt-4", tools_info=[])
+        with patch.object(first.provider, "handle_chat", return_value="The fetch server listens on port 8001."):
+            first.handle_command("Which port does the fetch server use?")
+
+        second = Assistant(provider_name="openai", model_name="gpt-4", tools_info=[])
+        second.provider.api_key = "test-key"
+        second.provider._ensure_client()
+        second.provider.client = MagicMock()
+        sent = []
+
+        def post(path, content, **options):
+            sent.append(json.loads(content)["messages"])
+            message = SimpleNamespace(role="assistant", content="8001", tool_calls=None)
+            response = SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+            return SimpleNamespace(headers={}, parse=lambda: response)
+        second.provider.client.post.side_effect = post
+
+        second.handle_command("fetch server port?")
+
+        self.assertEqual([m["role"] for m in sent[0]], ["system", "user"])
+        self.assertIn("port 8001", sent[0][0]["content"])
+        self.assertEqual(sent[0][1]["content"], "fetch server port?")
+        self.assertEqual([m["content"] for m in second.provider.messages], ["fetch server port?", "8001"])
+        self.assertIsNone(second.provider.turn_context)
+
+if __name__ == '__main__':
+    unittest.main()
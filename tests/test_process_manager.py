@@ -0,0 +1,85 @@
+import unittest
+import os
+import sys
+import threading
+import time
+
+# Add the root directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from assistant_core.process_manager import LogBuffer, ProcessManager
+from config.settings import settings
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+class TestProcessManager(unittest.TestCase):
+
+    def setUp(self):
+        settings.settings = settings._load_settings()
+        settings.settings["process_max_backoff"] = 0.1
+        self.manager = ProcessManager(interval=0.05)
+        self.addCleanup(self.manager.shutdown)
+
+    def test_log_buffer_keeps_the_newest_output_within_its_size(self):
+        log = LogBuffer(max_bytes=30)
+        log.write(b"line one\nline two\nline th")
+        log.write(b"ree\n" + b"x" * 15)
+        self.assertEqual(log.lines(), ["line one", "line two", "line three", "x" * 15])
+        log.write(b"x" * 50)
+        self.assertEqual(log.lines(), ["x" * 30])
+        self.assertEqual(log.dropped, 3)
+
+    def test_crashed_process_is_restarted_and_its_output_captured(self):
+        script = "import sys; print('started', flush=True); sys.stderr.write('boom\\n'); sys.exit(3)"
+        managed = self.manager.start_process(sys.executable, ["-c", script], name="crashy")
+        self.assertTrue(_wait_for(lambda: managed.restarts >= 2))
+        self.assertEqual(managed.exit_code, 3)
+        self.assertTrue(_wait_for(lambda: managed.log.lines()[:2] == ["started", "boom"]))
+
+    def test_samples_cpu_and_rss_of_running_process(self):
+        if not os.path.exists("/proc/self/statm"):
+            self.skipTest("needs /proc")
+        script = "import time\nend = time.time() + 5\nwhile time.time() < end: pass"
+        managed = self.manager.start_process(sys.executable, ["-c", script], name="busy")
+        self.assertTrue(_wait_for(lambda: managed.cpu_percent > 10 and managed.rss > 0))
+        info = self.manager.stats()[0]
+        self.assertEqual((info["name"], info["status"], info["restarts"]), ("busy", "running", 0))
+        self.assertGreaterEqual(info["peak_rss"], info["rss"])
+
+    def test_restart_does_not_hold_the_lock_while_the_process_stops(self):
+        managed = self.manager.start_process(sys.executable, ["-c", "import time; time.sleep(30)"], name="slow-stop")
+        real_proc = managed.proc
+        stopped = threading.Event()
+
+        class SlowToStop:
+            pid = real_proc.pid
+            returncode = None
+            def poll(self):
+                return None if not stopped.is_set() else 0
+            def terminate(self):
+                real_proc.kill()
+            def wait(self, timeout=None):
+                stopped.wait(timeout)
+            def kill(self):
+                pass
+        managed.proc = SlowToStop()
+
+        restart = threading.Thread(target=self.manager.restart_process, args=("slow-stop",))
+        restart.start()
+        self.assertTrue(_wait_for(lambda: managed.status == "stopped"))
+        started = time.monotonic()
+        self.assertEqual(self.manager.stats()[0]["name"], "slow-stop")
+        self.assertLess(time.monotonic() - started, 1)
+        stopped.set()
+        restart.join(5)
+        real_proc.wait()
+        self.assertTrue(_wait_for(lambda: managed.restarts == 1 and managed.status == "running"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import unittest
+from unittest.mock import patch
+import gc
+import json
+import os
+import pstats
+import shutil
+import sys
+import tempfile
+import threading
+import tracemalloc
+
+# Add the root directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from assistant_core import profiling
+from assistant_core.assistant import Assistant
+from assistant_core.messages import Message, MessageHistory
+from config.settings import settings
+
+class FakeProvider:
+    """Streams a canned reply of about 2 KB and keeps its history like the real providers."""
+
+    def __init__(self, *args):
+        self.model = "fake"
+        self.messages = MessageHistory()
+
+    def handle_chat_stream(self, user_input, tools, tool_invoker, stream_callback, cancel_token=None):
+        self.messages.append(Message("user", user_input))
+        reply = " ".join(f"{user_input}-{i}" for i in range(200))
+        for token in reply.split(" "):
+            stream_callback(token)
+        self.messages.append(Message("assistant", reply))
+        return reply
+
+class TestProfiling(unittest.TestCase):
+
+    def setUp(self):
+        settings.settings = settings._load_settings()
+        self.root = tempfile.mkdtemp()
+        settings.settings["profile_dir"] = self.root
+        patcher = patch('assistant_core.assistant.create_provider', side_effect=FakeProvider)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        profiling._profiler = None
+        shutil.rmtree(self.root)
+
+    def _assistant(self):
+        return Assistant(provider_name="openai", model_name="gpt-4", tools_info=[])
+
+    def test_profiled_turn_writes_pstats_and_memory_summary(self):
+        assistant = self._assistant()
+        assistant.handle_command_stream("unprofiled", lambda token: None)
+        self.assertEqual(os.listdir(self.root), [])
+
+        settings.settings["profile_turns"] = True
+        assistant.handle_command_stream("hello", lambda token: None)
+
+        files = sorted(os.listdir(self.root))
+        self.assertEqual([os.path.splitext(name)[1] for name in files], [".json", ".pstats"])
+        with open(os.path.join(self.root, files[0]), encoding="utf-8") as f:
+            summary = json.load(f)
+        self.assertEqual(summary["label"], assistant.session_id[:8])
+        self.assertGreater(summary["peak_traced_bytes"], 0)
+        self.assertGreaterEqual(summary["peak_traced_bytes"], summary["net_traced_bytes"])
+        self.assertTrue(summary["top_allocations"])
+        functions = {name for _, _, name in pstats.Stats(summary["pstats"]).stats}
+        self.assertIn("handle_chat_stream", functions)
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_overlapping_turns_run_one_cprofile_session(self):
+        profiler = profiling.TurnProfiler(self.root)
+        inside = threading.Event()
+        release = threading.Event()
+        summaries = {}
+
+        def first_turn():
+            with profiler.profile("first"):
+                inside.set()
+                release.wait(5)
+            summaries["first"] = profiler.last_summary
+
+        thread = threading.Thread(target=first_turn)
+        thread.start()
+        self.assertTrue(inside.wait(5))
+        with profiler.profile("second"):
+            sum(range(1000))
+        summaries["second"] = profiler.last_summary
+        release.set()
+        thread.join(5)
+
+        self.assertIsNone(summaries["second"]["pstats"])
+        self.assertTrue(summaries["second"]["overlapping"])
+        self.assertTrue(os.path.exists(summaries["first"]["pstats"]))
+        # Both sessions are over, so the next turn is profiled again
+        with profiler.profile("third"):
+            pass
+        self.assertIsNotNone(profiler.last_summary["pstats"])
+
+    def test_soak_memory_stays_flat_across_long_sessions(self):
+        """1,000 turns in 100 sessions of 10; every 10th session's last turn is profiled."""
+        tracemalloc.start()
+        self.addCleanup(tracemalloc.stop)
+        samples = []
+        for session in range(100):
+            assistant = self._assistant()
+            for turn in range(10):
+                profiled = session % 10 == 9 and turn == 9
+                if profiled:
+                    # Earlier sessions hold reference cycles; free them first
+                    gc.collect()
+                settings.settings["profile_turns"] = profiled
+                assistant.handle_command_stream(f"s{session}t{turn}", lambda token: None)
+            if profiled:
+                samples.append(profiling.get_turn_profiler().last_summary)
+
+        self.assertEqual(len(samples), 10)
+        # The first sample is the warm-up; afterwards each session's memory must be released
+        growth = samples[-1]["traced_bytes"] - samples[1]["traced_bytes"]
+        self.assertLess(growth, 256 * 1024, f"traced memory grew by {growth} bytes over 80 sessions")
+        if samples[1]["rss_bytes"] is not None:
+            self.assertLess(samples[-1]["rss_bytes"] - samples[1]["rss_bytes"], 32 * 2**20)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import os
+import sys
+import threading
+import time
+
+# Add the root directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import openai
+from assistant_core.cancellation import CancelToken, GenerationCancelled
+from assistant_core.scheduler import RequestScheduler, TokenBucket, parse_duration, parse_retry_after
+from config.settings import settings
+
+def _rate_limit_error(headers):
+    response = MagicMock(status_code=429, headers=headers)
+    return openai.RateLimitError("rate limited", response=response, body=None)
+
+class TestRequestScheduler(unittest.TestCase):
+
+    def setUp(self):
+        settings.settings = settings._load_settings()
+
+    def test_parse_rate_limit_headers(self):
+        self.assertEqual(parse_duration("6m0s"), 360.0)
+        self.assertAlmostEqual(parse_duration("1m2.5s"), 62.5)
+        self.assertAlmostEqual(parse_duration("250ms"), 0.25)
+        self.assertEqual(parse_retry_after({"retry-after": "3"}), 3.0)
+        self.assertEqual(parse_retry_after({"retry-after-ms": "1500", "retry-after": "9"}), 1.5)
+        self.assertIsNone(parse_retry_after({}))
+
+    def test_token_bucket_queues_instead_of_bursting(self):
+        bucket = TokenBucket(per_minute=60)  # one per second
+        now = bucket.updated
+        waits = [bucket.reserve(20, now) for _ in range(4)]
+        self.assertEqual(waits[:3], [0.0, 0.0, 0.0])
+        self.assertAlmostEqual(waits[3], 20.0)
+
+    @patch('assistant_core.scheduler.time.sleep')
+    def test_retries_rate_limit_using_retry_after(self, mock_sleep):
+        scheduler = RequestScheduler(max_retries=3)
+        fn = MagicMock(side_effect=[_rate_limit_error({"retry-after": "2"}), MagicMock(headers={})])
+
+        scheduler.call("groq", fn)
+
+        self.assertEqual(fn.call_count, 2)
+        # The second attempt waited out the pause set by the 429
+        waited = mock_sleep.call_args_list[0].args[0]
+        self.assertAlmostEqual(waited, 2.0, places=1)
+        self.assertEqual(scheduler.stats()["groq"]["throttled"], 1)
+
+    @patch('assistant_core.scheduler.time.sleep')
+    def test_gives_up_after_max_retries(self, mock_sleep):
+        scheduler = RequestScheduler(max_retries=2)
+        fn = MagicMock(side_effect=_rate_limit_error({}))
+        with self.assertRaises(openai.RateLimitError):
+            scheduler.call("openai", fn)
+        self.assertEqual(fn.call_count, 3)
+
+    def test_cancel_during_rate_limit_wait_never_sends_the_request(self):
+        settings.settings["rate_limits"] = {"groq": {"requests_per_minute": 1}}
+        scheduler = RequestScheduler()
+        scheduler.call("groq", MagicMock(return_value=MagicMock(headers={})))
+        fn = MagicMock()
+        token = CancelToken()
+        threading.Timer(0.1, token.cancel).start()
+
+        started = time.monotonic()
+        with self.assertRaises(GenerationCancelled):
+            scheduler.call("groq", fn, cancel_token=token)
+        self.assertLess(time.monotonic() - started, 5)
+        fn.assert_not_called()
+        # The cancelled reservation was given back
+        self.assertAlmostEqual(scheduler.limiter("groq").requests.level, 0.0, places=1)
+        self.assertEqual(scheduler.stats()["groq"]["waiting"], 0)
+
+    def test_cancel_during_retry_backoff_stops_retrying(self):
+        scheduler = RequestScheduler()
+        token = CancelToken()
+        fn = MagicMock(side_effect=[openai.APIConnectionError(request=MagicMock())])
+        threading.Timer(0.1, token.cancel).start()
+        with patch.object(scheduler, "backoff", return_value=30):
+            with self.assertRaises(GenerationCancelled):
+                scheduler.call("openai", fn, cancel_token=token)
+        fn.assert_called_once()
+
+    def test_does_not_retry_client_errors(self):
+        scheduler = RequestScheduler()
+        fn = MagicMock(side_effect=ValueError("bad request"))
+        with self.assertRaises(ValueError):
+            scheduler.call("openai", fn)
+        fn.assert_called_once()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+from unittest.mock import patch
+import os
+import sys
+
+# Add the root directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from assistant_core.assistant import Assistant
+from assistant_core.tool_index import ToolIndex, tokenize
+from config.settings import settings
+
+def _tool(name, description, **params):
+    return {
+        "type": "function",
+        "function": {
+            "name": name,
+            "description": description,
+            "parameters": {"type": "object", "properties": {k: {"type": "string", "description": v} for k, v in params.items()}},
+        },
+    }
+
+CATALOG = [
+    _tool("fetch", "Fetches a URL from the internet and returns the page as markdown", url="URL to fetch"),
+    _tool("read_file", "Read the complete contents of a file from the file system", path="Path of the file"),
+    _tool("write_file", "Create a new file or overwrite an existing file", path="Path of the file", content="Text to write"),
+    _tool("run_python", "Execute Python code in a sandbox and return stdout", code="Python source"),
+    _tool("search_web", "Search the web with a query and return result links", query="Search terms"),
+]
+
+class TestToolIndex(unittest.TestCase):
+
+    def setUp(self):
+        settings.settings = settings._load_settings()
+
+    def test_tokenize_splits_identifiers(self):
+        self.assertEqual(tokenize("readFile from my_files"), ["read", "file", "file"])
+
+    def test_select_ranks_relevant_tools_in_catalog_order(self):
+        index = ToolIndex(CATALOG)
+        selected = index.select("please read the file notes.txt", k=2)
+        names = [schema["function"]["name"] for schema in selected]
+        self.assertIn("read_file", names)
+        self.assertEqual(len(names), 2)
+        self.assertEqual(names, sorted(names, key=[s["function"]["name"] for s in CATALOG].index))
+
+    def test_select_without_matches_keeps_full_catalog(self):
+        index = ToolIndex(CATALOG)
+        self.assertEqual(len(index.select("hello there", k=1)), len(CATALOG))
+
+    @patch('assistant_core.assistant.Assistant._post_invoke', side_effect=lambda url, tool, kwargs, output: output.write("ok"))
+    def test_assistant_prunes_and_keeps_called_tools_for_later_turns(self, mock_post):
+        settings.settings["tool_top_k"] = 1
+        tools_info = [{"server_url": "http://tools", "schema": schema} for schema in CATALOG]
+        assistant = Assistant(provider_name="openai", model_name="gpt-4", tools_info=tools_info)
+
+        tools = assistant.select_tools("run this python code")
+        self.assertEqual([t["function"]["name"] for t in tools], ["run_python"])
+        self.assertLess(assistant.last_tool_selection["schema_tokens_sent"], assistant.last_tool_selection["schema_tokens_total"])
+
+        # The model calls a tool that was not sent: it is still served, and sent from now on
+        self.assertEqual(assistant._invoke_tool("fetch", {"url": "http://example.com"}), "ok")
+        self.assertIn("fetch", assistant.used_tools)
+        tools = assistant.select_tools("run more python code")
+        self.assertEqual([t["function"]["name"] for t in tools], ["fetch", "run_python"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+import unittest
+from unittest.mock import patch
+import os
+import shutil
+import sys
+import tempfile
+
+# Add the root directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from assistant_core.assistant import Assistant, mcp_http
+from assistant_core.cancellation import GenerationCancelled
+from assistant_core.tool_output import ToolOutputStore, ToolOutputPipeline, MapReduceDigester, READ_TOOL_OUTPUT
+from config.settings import settings
+
+class TestToolOutput(unittest.TestCase):
+
+    def setUp(self):
+        settings.settings = settings._load_settings()
+        self.root = tempfile.mkdtemp()
+        self.store = ToolOutputStore(self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_store_is_content_addressed(self):
+        handle = self.store.put("page body")
+        self.assertEqual(self.store.put("page body"), handle)
+        self.assertEqual(self.store.get(handle), "page body")
+        with self.assertRaises(KeyError):
+            self.store.get("tool-output:../../etc/passwd")
+
+    def _entry(self, pipeline, tool_name, text):
+        output = pipeline.accumulator(tool_name)
+        output.write(text)
+        return output.finish()
+
+    def test_small_outputs_pass_through_and_large_ones_spill(self):
+        pipeline = ToolOutputPipeline(self.store, limits={"default": 100, "fetch": 10}, preview_chars=5)
+        self.assertEqual(self._entry(pipeline, "run", "short"), "short")
+
+        entry = self._entry(pipeline, "fetch", "0123456789abcdef")
+        self.assertTrue(entry.startswith("01234\n[Output of 'fetch' truncated"))
+        handle = entry.split("Full output: ")[1].split(" ")[0]
+        self.assertEqual(self.store.get(handle), "0123456789abcdef")
+        self.assertEqual(pipeline.read(handle, offset=14), "ef")
+
+    def test_digest_maps_chunks_then_reduces(self):
+        prompts = []
+
+        def summarize(prompt):
+            prompts.append(prompt)
+            return "summary"
+
+        pipeline = ToolOutputPipeline(self.store, limits={"default": 50}, digester=MapReduceDigester(summarize, chunk_chars=40))
+        entry = self._entry(pipeline, "fetch", "line of text\n" * 10)
+        self.assertTrue(entry.endswith("\nsummary"))
+        # 130 characters in chunks of at most 40, plus one merge
+        self.assertEqual(len(prompts), 5)
+        self.assertTrue(prompts[-1].startswith("The following are summaries"))
+
+    def test_close_removes_the_partial_spill_file(self):
+        pipeline = ToolOutputPipeline(self.store, limits={"default": 10})
+        output = pipeline.accumulator("fetch")
+        output.write("x" * 50)
+        part_files = lambda: [name for name in os.listdir(self.root) if name.endswith(".part")]
+        self.assertEqual(len(part_files()), 1)
+        # Cancelled while the tool stream is stalled: no further chunk arrives
+        output.close()
+        self.assertEqual(part_files(), [])
+        with self.assertRaises(GenerationCancelled):
+            output.write("late")
+
+    @patch('assistant_core.assistant.Assistant._post_invoke', side_effect=lambda url, tool, kwargs, output: output.write("x" * 500))
+    def test_assistant_spills_and_offers_read_tool(self, mock_post):
+        settings.settings["tool_output_limits"] = {"default": 100}
+        settings.settings["tool_output_dir"] = self.root
+        tools_info = [{"server_url": "http://tools", "schema": {"type": "function", "function": {"name": "fetch"}}}]
+        assistant = Assistant(provider_name="openai", model_name="gpt-4", tools_info=tools_info)
+
+        self.assertNotIn(READ_TOOL_OUTPUT, [t["function"]["name"] for t in assistant.select_tools("get it")])
+        entry = assistant._invoke_tool("fetch", {})
+        self.assertLess(len(entry), 500)
+        self.assertIn(READ_TOOL_OUTPUT, [t["function"]["name"] for t in assistant.select_tools("more")])
+
+        handle = entry.split("Full output: ")[1].split(" ")[0]
+        self.assertTrue(assistant._invoke_tool(READ_TOOL_OUTPUT, {"handle": handle, "offset": 450}).startswith("x" * 50))
+
+class _StreamedResponse:
+    def __init__(self, content_type, lines):
+        self.headers = {"Content-Type": content_type}
+        self.lines = lines
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_lines(self, decode_unicode=False):
+        return iter(line.encode("utf-8") for line in self.lines)
+
+class TestStreamedInvoke(unittest.TestCase):
+
+    def setUp(self):
+        settings.settings = settings._load_settings()
+        self.root = tempfile.mkdtemp()
+        settings.settings["tool_output_dir"] = self.root
+        tools_info = [{"server_url": "http://tools", "schema": {"type": "function", "function": {"name": "crawl"}}}]
+        self.assistant = Assistant(provider_name="openai", model_name="gpt-4", tools_info=tools_info)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_ndjson_chunks_are_forwarded_and_accumulated(self):
+        lines = ['{"delta": "page 1\\n"}', '{"delta": "page 2\\n"}', '{"result": "ignored once output was streamed"}']
+        forwarded = []
+        with patch.object(mcp_http, "post", return_value=_StreamedResponse("application/x-ndjson", lines)):
+            entry = self.assistant._invoke_tool("crawl", {}, on_output=lambda tool, chunk: forwarded.append((tool, chunk)))
+        self.assertEqual(entry, "page 1\npage 2\n")
+        self.assertEqual(forwarded, [("crawl", "page 1\n"), ("crawl", "page 2\n")])
+
+    def test_sse_output_over_the_limit_is_spilled_and_capped(self):
+        self.assistant.tool_outputs.limits = {"default": 10}
+        lines = ["data: 0123456", "", "data: 789abcdef", "", "data: [DONE]", ""]
+        forwarded = []
+        with patch.object(mcp_http, "post", return_value=_StreamedResponse("text/event-stream", lines)):
+            entry = self.assistant._invoke_tool("crawl", {}, on_output=lambda tool, chunk: forwarded.append(chunk))
+        self.assertIn("showing 10 of 16 characters", entry)
+        self.assertTrue("".join(forwarded).startswith("0123456789\n[... output continues"))
+        handle = entry.split("Full output: ")[1].split(" ")[0]
+        self.assertEqual(self.assistant.tool_outputs.store.get(handle), "0123456789abcdef")
+
+if __name__ == '__main__':
+    unittest.main()